@@ -1,8 +1,7 @@
 import streamlit as st
-from utils.function_calling import get_response
 import os
 from dotenv import load_dotenv
-from utils.openai_client import get_openai_client
+from utils.chat_service import run_chat, stream_remote_chat
 
 load_dotenv()
 try:
@@ -10,6 +9,9 @@ try:
 except:
     openai_api_key = None
 
+# When set, chat turns run on the headless chat service instead of in this process
+CHAT_SERVICE_URL = os.getenv("CHAT_SERVICE_URL")
+
 # Duke University color palette
 DUKE_BLUE = "#00539B"  # Primary Duke Blue
 DUKE_NAVY = "#012169"  # Duke Navy Blue
@@ -134,6 +136,7 @@ Guidelines:
 8. Provide links, references, and citations when relevant.
 9. !!!!!!! When asked about the Artificial Intelligence for Product Innovation or AIPI course make sure to use the get_courses tool in your planning !!!!!!!!!
 10. Use "pratt_search" tool to get general information about Pratt School of Engineering and their programs please!.
+11. For questions that compare or span several programs (MEM, Pratt, AIPI), use "search_duke_programs" once instead of calling each program's tool in turn.
 
 Be concise when appropriate, but offer long, elaborate answers when more detail would be helpful.
 """
@@ -145,19 +148,17 @@ if "messages" not in st.session_state:
 
 if openai_api_key or st_openai_api_key:
     st.session_state.api_key = openai_api_key or st_openai_api_key
-    st.session_state.client = get_openai_client(st.session_state.api_key)
 else:
     st.session_state.api_key = None
-    st.session_state.client = None
 
 
 # Display chat messages from session state
 for message in st.session_state.messages:
-    if message["role"] == "user" or message["role"] == "assistant":
+    if message["role"] in ("user", "assistant") and message.get("content"):
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
 
-if st.session_state.client:
+if st.session_state.api_key:
     # User input
     if user_input := st.chat_input("Enter your message here..."):
         
@@ -173,19 +174,32 @@ if st.session_state.client:
             
             status_container.info("Initializing...")
             
-            response = None
-            for status in get_response(st.session_state.messages):
-                if isinstance(status, str):
-                    status_container.info(status)
-                else:
-                    response = status
-                    break
-            
-            if response and response.content:
+            if CHAT_SERVICE_URL:
+                events = stream_remote_chat(CHAT_SERVICE_URL, st.session_state.messages, st.session_state.api_key)
+            else:
+                events = run_chat(st.session_state.messages, st.session_state.api_key)
+
+            final_event = None
+            streamed_text = ""
+            for event in events:
+                if event["type"] == "delta":
+                    streamed_text += event["text"]
+                    response_container.markdown(streamed_text + "▌")
+                elif event["type"] in ("status", "error"):
+                    # Text streamed before a tool call is only interim thinking
+                    if streamed_text:
+                        streamed_text = ""
+                        response_container.empty()
+                    status_container.info(event["text"])
+                elif event["type"] == "final":
+                    final_event = event
+
+            if final_event and final_event["content"]:
                 status_container.empty()
                 with response_container.container():
-                    st.markdown(response.content)
-                st.session_state.messages.append({"role": "assistant", "content": response.content})
+                    st.markdown(final_event["content"])
+                # Tool calls, tool results and the answer from this turn
+                st.session_state.messages.extend(final_event["new_messages"])
 
 else:
     st.warning("Please enter your OpenAI API key here or add it to the .env file to continue.")
\ No newline at end of file
@@ -0,0 +1,111 @@
+"""
+Benchmark the IVF approximate index against exact search.
+
+By default the corpus is synthetic: clustered unit vectors, which is how
+document chunk embeddings behave. Pass --store to benchmark a saved local
+vector store instead (e.g. data/vector_store/mem-database); its own vectors
+plus noise are used as queries.
+
+    python -m evaluation.ann_benchmark --vectors 200000 --dimension 384 --nprobe 4 8 16 32
+
+Reports build time, p50/p95 query latency and recall@k (the share of the
+exact top-k that the approximate search also returns) for each nprobe.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add the project root directory to the Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from utils.vector_store import LocalVectorStore
+from utils.ivf_index import IVFVectorStore
+
+
+def synthetic_corpus(vector_count, dimension, clusters, spread, seed=0):
+    """Unit vectors scattered around random topic centres; larger spread means overlapping topics"""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dimension)).astype(np.float32)
+    labels = rng.integers(0, clusters, vector_count)
+    vectors = centres[labels] + spread * rng.normal(size=(vector_count, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def make_queries(vectors, query_count, seed=1):
+    """Perturbed copies of random corpus vectors"""
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.choice(len(vectors), query_count, replace=False)]
+    queries = queries + 0.3 * rng.normal(size=queries.shape).astype(np.float32) / np.sqrt(queries.shape[1])
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def load_store_vectors(path, namespace):
+    store = LocalVectorStore(path)
+    records = store.get_namespace(namespace)
+    if records is None:
+        raise ValueError(f"No namespace '{namespace}' in {path}")
+    return records.matrix
+
+
+def time_queries(store, queries, top_k, **search_params):
+    """Run every query; returns (latencies in ms, result id sets)"""
+    latencies, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        response = store.query(query, top_k=top_k, include_metadata=False, **search_params)
+        latencies.append((time.perf_counter() - started) * 1000)
+        results.append({match["id"] for match in response["matches"]})
+    return np.array(latencies), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare IVF approximate search with exact search")
+    parser.add_argument("--vectors", type=int, default=100000, help="Synthetic corpus size")
+    parser.add_argument("--dimension", type=int, default=384, help="Synthetic vector size")
+    parser.add_argument("--clusters", type=int, default=500, help="Topics in the synthetic corpus")
+    parser.add_argument("--spread", type=float, default=1.5, help="Noise around each synthetic topic centre")
+    parser.add_argument("--store", help="Benchmark a saved local vector store instead of synthetic data")
+    parser.add_argument("--namespace", default="")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    if args.store:
+        vectors = load_store_vectors(args.store, args.namespace)
+    else:
+        vectors = synthetic_corpus(args.vectors, args.dimension, args.clusters, args.spread)
+    queries = make_queries(vectors, min(args.queries, len(vectors)))
+    ids = [str(i) for i in range(len(vectors))]
+    print(f"Corpus: {len(vectors)} vectors x {vectors.shape[1]} dimensions, {len(queries)} queries, top_k={args.top_k}")
+
+    exact = LocalVectorStore()
+    exact.upsert(list(zip(ids, vectors)))
+
+    started = time.perf_counter()
+    approximate = IVFVectorStore(nlist=args.nlist, min_train_size=1)
+    approximate.upsert(list(zip(ids, vectors)))
+    build_seconds = time.perf_counter() - started
+    nlist = approximate.describe_index_stats()["namespaces"][""]["nlist"]
+    print(f"IVF build: {build_seconds:.1f}s, {nlist} lists\n")
+
+    exact_latencies, exact_results = time_queries(exact, queries, args.top_k)
+    print(f"{'search':<16}{'p50 ms':>10}{'p95 ms':>10}{'recall@k':>10}{'speedup':>10}")
+    print(f"{'exact':<16}{np.percentile(exact_latencies, 50):>10.2f}{np.percentile(exact_latencies, 95):>10.2f}"
+          f"{1.0:>10.3f}{1.0:>10.1f}")
+
+    for nprobe in args.nprobe:
+        latencies, results = time_queries(approximate, queries, args.top_k, nprobe=nprobe)
+        recall = np.mean([len(found & truth) / len(truth) for found, truth in zip(results, exact_results)])
+        speedup = np.percentile(exact_latencies, 50) / np.percentile(latencies, 50)
+        print(f"{f'ivf nprobe={nprobe}':<16}{np.percentile(latencies, 50):>10.2f}{np.percentile(latencies, 95):>10.2f}"
+              f"{recall:>10.3f}{speedup:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
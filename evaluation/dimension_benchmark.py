@@ -0,0 +1,101 @@
+"""
+Benchmark recall against embedding size for shortened (Matryoshka) embeddings.
+
+Every vector and query is truncated to each size and re-normalized, the same
+way text-embedding-3 shortens its outputs, and searched exactly. Recall@k is
+the share of the full-size top-k that the shortened search also returns.
+
+Use a synced local store of real text-embedding-3 vectors for meaningful
+numbers; with --questions the evaluation questions are embedded as queries
+(needs OPENAI_API_KEY), otherwise queries are perturbed corpus vectors:
+
+    python -m evaluation.dimension_benchmark --store data/vector_store/mem-database --namespace mem-handbook \\
+        --questions evaluation/eval_Q_data.csv
+
+Without --store the corpus is synthetic, with variance decaying across
+dimensions the way Matryoshka-trained embeddings concentrate information in
+the leading values; it only illustrates the trade-off.
+"""
+import argparse
+import csv
+import os
+import sys
+
+import numpy as np
+
+# Add the project root directory to the Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from evaluation.ann_benchmark import synthetic_corpus, make_queries, load_store_vectors, time_queries
+from utils.vector_store import LocalVectorStore, normalize_vectors
+
+
+def matryoshka_corpus(vector_count, dimension, clusters, spread, seed=0):
+    """Synthetic corpus whose later dimensions carry less of each vector"""
+    vectors = synthetic_corpus(vector_count, dimension, clusters, spread, seed)
+    decay = 1 / np.sqrt(1 + np.arange(dimension) / 32)
+    return normalize_vectors(vectors * decay)
+
+
+def embed_questions(path, dimension):
+    from dotenv import load_dotenv
+    from openai import OpenAI
+    from utils.embeddings import CachedEmbeddings
+    load_dotenv()
+
+    with open(path, "r", encoding="latin1", newline="") as f:
+        questions = [row["questions"] for row in csv.DictReader(f) if row.get("questions")]
+    # Full-size embeddings; each size below is a truncation of them
+    embeddings = CachedEmbeddings(OpenAI(api_key=os.getenv("OPENAI_API_KEY")), dimensions=None)
+    vectors = np.array(embeddings.embed_documents(questions), dtype=np.float32)
+    if vectors.shape[1] != dimension:
+        raise ValueError(f"Questions embed to {vectors.shape[1]} dimensions but the store holds {dimension}")
+    return vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall and latency of shortened embeddings")
+    parser.add_argument("--vectors", type=int, default=50000, help="Synthetic corpus size")
+    parser.add_argument("--dimension", type=int, default=1536, help="Full synthetic vector size")
+    parser.add_argument("--clusters", type=int, default=500, help="Topics in the synthetic corpus")
+    parser.add_argument("--spread", type=float, default=1.5, help="Noise around each synthetic topic centre")
+    parser.add_argument("--store", help="Benchmark a saved local vector store instead of synthetic data")
+    parser.add_argument("--namespace", default="")
+    parser.add_argument("--questions", help="CSV with a 'questions' column to embed as queries")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--dimensions", type=int, nargs="+", default=[64, 128, 256, 512, 768, 1024])
+    args = parser.parse_args()
+
+    if args.store:
+        vectors = load_store_vectors(args.store, args.namespace)
+    else:
+        vectors = matryoshka_corpus(args.vectors, args.dimension, args.clusters, args.spread)
+    if args.questions:
+        queries = embed_questions(args.questions, vectors.shape[1])
+    else:
+        queries = make_queries(vectors, min(args.queries, len(vectors)))
+    ids = [str(i) for i in range(len(vectors))]
+    full_dimension = vectors.shape[1]
+    top_k = min(args.top_k, len(vectors))
+    print(f"Corpus: {len(vectors)} vectors x {full_dimension} dimensions, {len(queries)} queries, top_k={top_k}\n")
+
+    full = LocalVectorStore()
+    full.upsert(list(zip(ids, vectors)))
+    full_latencies, full_results = time_queries(full, queries, top_k)
+
+    print(f"{'dimensions':<12}{'KB/vector':>10}{'index MB':>10}{'p50 ms':>9}{'p95 ms':>9}{'recall@k':>10}")
+    for dimension in sorted(d for d in args.dimensions if d < full_dimension):
+        store = LocalVectorStore()
+        store.upsert(list(zip(ids, vectors[:, :dimension])))
+        latencies, results = time_queries(store, queries[:, :dimension], top_k)
+        recall = np.mean([len(found & truth) / len(truth) for found, truth in zip(results, full_results)])
+        print(f"{dimension:<12}{dimension * 4 / 1024:>10.2f}{len(vectors) * dimension * 4 / 1e6:>10.1f}"
+              f"{np.percentile(latencies, 50):>9.2f}{np.percentile(latencies, 95):>9.2f}{recall:>10.3f}")
+    print(f"{full_dimension:<12}{full_dimension * 4 / 1024:>10.2f}{len(vectors) * full_dimension * 4 / 1e6:>10.1f}"
+          f"{np.percentile(full_latencies, 50):>9.2f}{np.percentile(full_latencies, 95):>9.2f}{1.0:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
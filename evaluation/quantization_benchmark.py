@@ -0,0 +1,82 @@
+"""
+Benchmark int8 and binary quantized search against exact float search.
+
+Each quantized store is saved to a temporary directory and used the way the
+tools use it: codes in memory, float vectors memory-mapped from disk for
+rescoring. By default the corpus is synthetic (see evaluation.ann_benchmark);
+pass --store to benchmark a saved local vector store instead.
+
+    python -m evaluation.quantization_benchmark --vectors 100000 --dimension 1536 --rescore-factor 2 4 16
+
+Reports the in-memory size of the vectors, p50/p95 query latency and
+recall@k (the share of the exact top-k that the quantized search also
+returns) for each quantization and rescore factor.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Add the project root directory to the Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from evaluation.ann_benchmark import synthetic_corpus, make_queries, load_store_vectors, time_queries
+from utils.vector_store import LocalVectorStore
+from utils.quantized_index import QuantizedVectorStore, QUANTIZATIONS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare quantized search with exact search")
+    parser.add_argument("--vectors", type=int, default=100000, help="Synthetic corpus size")
+    parser.add_argument("--dimension", type=int, default=1536, help="Synthetic vector size")
+    parser.add_argument("--clusters", type=int, default=500, help="Topics in the synthetic corpus")
+    parser.add_argument("--spread", type=float, default=1.5, help="Noise around each synthetic topic centre")
+    parser.add_argument("--store", help="Benchmark a saved local vector store instead of synthetic data")
+    parser.add_argument("--namespace", default="")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--quantization", nargs="+", choices=QUANTIZATIONS, default=list(QUANTIZATIONS))
+    parser.add_argument("--rescore-factor", type=int, nargs="+", default=[1, 4, 16])
+    args = parser.parse_args()
+
+    if args.store:
+        vectors = load_store_vectors(args.store, args.namespace)
+    else:
+        vectors = synthetic_corpus(args.vectors, args.dimension, args.clusters, args.spread)
+    queries = make_queries(vectors, min(args.queries, len(vectors)))
+    ids = [str(i) for i in range(len(vectors))]
+    print(f"Corpus: {len(vectors)} vectors x {vectors.shape[1]} dimensions, {len(queries)} queries, top_k={args.top_k}")
+
+    exact = LocalVectorStore()
+    exact.upsert(list(zip(ids, vectors)))
+    float_megabytes = exact.get_namespace("").matrix.nbytes / 1e6
+
+    exact_latencies, exact_results = time_queries(exact, queries, args.top_k)
+    print(f"\n{'search':<22}{'memory MB':>11}{'smaller':>9}{'p50 ms':>9}{'p95 ms':>9}{'recall@k':>10}")
+    print(f"{'exact float32':<22}{float_megabytes:>11.1f}{1.0:>8.1f}x{np.percentile(exact_latencies, 50):>9.2f}"
+          f"{np.percentile(exact_latencies, 95):>9.2f}{1.0:>10.3f}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for quantization in args.quantization:
+            store = QuantizedVectorStore(os.path.join(directory, quantization), quantization=quantization)
+            started = time.perf_counter()
+            store.upsert(list(zip(ids, vectors)))
+            store.save()
+            build_seconds = time.perf_counter() - started
+            megabytes = store.describe_index_stats()["namespaces"][""]["code_bytes"] / 1e6
+
+            for rescore_factor in args.rescore_factor:
+                latencies, results = time_queries(store, queries, args.top_k, rescore_factor=rescore_factor)
+                recall = np.mean([len(found & truth) / len(truth) for found, truth in zip(results, exact_results)])
+                label = f"{quantization} rescore x{rescore_factor}"
+                print(f"{label:<22}{megabytes:>11.1f}{float_megabytes / megabytes:>8.1f}x"
+                      f"{np.percentile(latencies, 50):>9.2f}{np.percentile(latencies, 95):>9.2f}{recall:>10.3f}")
+            print(f"{'':<22}({quantization} build and save: {build_seconds:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
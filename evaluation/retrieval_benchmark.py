@@ -0,0 +1,371 @@
+"""
+Benchmark the retrieval paths on their own, without the LLM.
+
+Runs the questions in eval_Q_data.csv through the MEM, Pratt and AIPI
+retrievers (each question goes to the paths whose program it names, or to
+every path with --all-questions) and reports per path:
+
+- latency percentiles of the retrieval call, and of the query embedding
+- payload sizes: the JSON size of the query (vector and top_k) and of the
+  results the path returns. These are estimates, not bytes on the wire, and
+  leave out AIPI's follow-up per-file chunk fetches.
+- recall@k, once questions in retrieval_labels.json are labeled: the share
+  of a question's relevant chunks found in its top-k results. A relevant
+  chunk is given by its "id", by "source" plus "page_number" (MEM, Pratt) or
+  by "source_file" (AIPI); write candidates to pick from with
+  --label-candidates. No question is labeled yet (that needs the synced
+  stores), so recall is not measured and its column is left out.
+- overlap with a previous run (--baseline): mean Jaccard similarity of the
+  result ids per question
+
+The full report, including every question's result ids, is written as JSON
+with sorted keys, so runs from two commits or two backends diff cleanly:
+
+    python -m evaluation.retrieval_benchmark --backend local --output before.json
+    python -m evaluation.retrieval_benchmark --backend ivf --baseline before.json --output after.json
+
+--embedder fake runs offline: queries are embedded with the hashing
+embedder from utils.semantic_cache, and the synced local stores are copied
+into a temporary directory re-embedded the same way, so no API key or
+network is needed. Its recall reflects keyword overlap rather than the real
+embedding model; use it for latency, payload sizes and regressions.
+"""
+import argparse
+import atexit
+import csv
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Add the project root directory to the Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+EVAL_QUESTIONS_FILE = os.path.join(project_root, "evaluation", "eval_Q_data.csv")
+LABELS_FILE = os.path.join(project_root, "evaluation", "retrieval_labels.json")
+BACKENDS = ("pinecone", "local", "ivf", "int8", "binary")
+PATHS = ("mem", "pratt", "aipi")
+# A question goes to the paths whose program it names
+PATH_PATTERNS = {
+    "mem": re.compile(r"\bMEM"),
+    "pratt": re.compile(r"\bPratt|\bMEng"),
+    "aipi": re.compile(r"\bAIPI")
+}
+PERCENTILES = (50, 90, 95, 99)
+LABEL_EXCERPT_CHARS = 200
+FAKE_EMBED_BATCH_SIZE = 1000
+
+
+def load_questions(path):
+    with open(path, "r", encoding="latin1", newline="") as f:
+        return [row["questions"] for row in csv.DictReader(f) if row.get("questions")]
+
+
+def load_labels(path):
+    """{path: {question: label}} for the labeled subset"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        labels = json.load(f)
+    by_path = {}
+    for label in labels:
+        by_path.setdefault(label["path"], {})[label["question"]] = label
+    return by_path
+
+
+def questions_for_path(path, questions, all_questions=False):
+    if all_questions:
+        return list(questions)
+    return [question for question in questions if PATH_PATTERNS[path].search(question)]
+
+
+def is_relevant(result, chunk):
+    """Whether a result is the labeled chunk, e.g. {"id"}, {"source", "page_number"} or {"source_file"}"""
+    return all(result.get(field) == value for field, value in chunk.items())
+
+
+def recall_at_k(results, label):
+    """Share of a label's relevant chunks found among the results"""
+    relevant = label.get("relevant", [])
+    if not relevant:
+        return None
+    found = sum(1 for chunk in relevant if any(is_relevant(result, chunk) for result in results))
+    return found / len(relevant)
+
+
+def jaccard(first, second):
+    first, second = set(first), set(second)
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+
+def percentiles(values):
+    if not values:
+        return None
+    summary = {f"p{p}": float(np.percentile(values, p)) for p in PERCENTILES}
+    summary["mean"] = float(np.mean(values))
+    summary["max"] = float(np.max(values))
+    return summary
+
+
+def _rounded(value):
+    """Floats rounded so reports diff on real changes only"""
+    if isinstance(value, float):
+        return round(value, 3)
+    if isinstance(value, dict):
+        return {key: _rounded(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_rounded(item) for item in value]
+    return value
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=project_root, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def build_fake_stores(index_names, source_dir, embedder):
+    """Copy each synced local store into the (temporary) VECTOR_STORE_DIR, re-embedded with embedder"""
+    from utils.vector_store import LocalVectorStore, new_local_vector_store, local_store_path
+
+    for index_name in index_names:
+        source_path = os.path.join(source_dir, index_name)
+        if not os.path.exists(os.path.join(source_path, "index.json")):
+            print(f"No local copy of {index_name} in {source_dir}; run python -m utils.vector_store sync first")
+            continue
+        source = LocalVectorStore(source_path)
+        target = new_local_vector_store(local_store_path(index_name), embedder.dimensions)
+        for namespace in source.describe_index_stats()["namespaces"]:
+            store = source.get_namespace(namespace)
+            for start in range(0, len(store.ids), FAKE_EMBED_BATCH_SIZE):
+                metadata = store.metadata[start:start + FAKE_EMBED_BATCH_SIZE]
+                vectors = embedder.embed_documents([meta.get("text", "") for meta in metadata])
+                target.upsert(list(zip(store.ids[start:start + FAKE_EMBED_BATCH_SIZE], vectors, metadata)),
+                              namespace=namespace)
+        target.save()
+        print(f"Re-embedded {target.describe_index_stats()['total_vector_count']} vectors of {index_name} offline")
+
+
+def retrieval_paths():
+    """
+    {path: (index name, retrieve(question, top_k, query_embedding) -> results)}; each result has
+    "id" and "text" plus the fields labels can name (source and page_number, or source_file)
+    """
+    from tools import memDatabaseTool, prattDatabaseTool, aipiDatabaseTool
+
+    def matches(retrieve):
+        def run(question, top_k, query_embedding):
+            results = []
+            for match in retrieve(question, top_k, query_embedding):
+                metadata = match.get("metadata") or {}
+                results.append({
+                    "id": match["id"],
+                    "source": metadata.get("source"),
+                    "page_number": metadata.get("page_number"),
+                    "text": metadata.get("text", "")
+                })
+            return results
+        return run
+
+    def aipi(question, top_k, query_embedding):
+        return [
+            {"id": document["source_file"], "source_file": document["source_file"],
+             "text": document["reconstructed_content"]}
+            for document in aipiDatabaseTool.retrieve(question, top_k, query_embedding)
+        ]
+
+    return {
+        "mem": (memDatabaseTool.INDEX_NAME, matches(memDatabaseTool.retrieve)),
+        "pratt": (prattDatabaseTool.INDEX_NAME, matches(prattDatabaseTool.retrieve)),
+        "aipi": (os.getenv("PINECONE_INDEX_AIPI"), aipi)
+    }
+
+
+def label_candidate(result):
+    """A result as a labeling candidate: its identifying fields and the start of its text"""
+    candidate = {field: value for field, value in result.items() if field != "text" and value is not None}
+    candidate["excerpt"] = " ".join(result["text"].split())[:LABEL_EXCERPT_CHARS]
+    return candidate
+
+
+def run_path(retrieve, questions, embedder, top_k, labels, baseline, warmup, candidates=None):
+    """
+    Report and per-question result ids for one retrieval path. If candidates
+    is a dict, the results of every question are added to it for labeling.
+    """
+    for question in questions[:warmup]:
+        try:
+            retrieve(question, top_k, embedder.embed_query(question))
+        except Exception:
+            pass
+
+    latencies, embedding_latencies, query_bytes, result_bytes = [], [], [], []
+    recalls, overlaps, results_by_question, errors = [], [], {}, {}
+    for question in questions:
+        try:
+            started = time.perf_counter()
+            query_embedding = [float(value) for value in embedder.embed_query(question)]
+            embedding_latencies.append((time.perf_counter() - started) * 1000)
+
+            started = time.perf_counter()
+            results = retrieve(question, top_k, query_embedding)
+            latencies.append((time.perf_counter() - started) * 1000)
+        except Exception as e:
+            errors[question] = str(e)
+            continue
+
+        # JSON sizes of the query and of the returned results, not measured network traffic
+        query_bytes.append(len(json.dumps({"vector": query_embedding, "top_k": top_k, "include_metadata": True})))
+        result_bytes.append(len(json.dumps(results, default=str)))
+
+        results_by_question[question] = [result["id"] for result in results]
+        if candidates is not None:
+            candidates[question] = [label_candidate(result) for result in results]
+        if question in labels:
+            recall = recall_at_k(results, labels[question])
+            if recall is not None:
+                recalls.append(recall)
+        if baseline is not None and question in baseline:
+            overlaps.append(jaccard(results_by_question[question], baseline[question]))
+
+    return {
+        "questions": len(questions),
+        "errors": len(errors),
+        "error_examples": dict(list(errors.items())[:3]),
+        "latency_ms": percentiles(latencies),
+        "embedding_latency_ms": percentiles(embedding_latencies),
+        "json_bytes": {
+            "query_mean": float(np.mean(query_bytes)) if query_bytes else None,
+            "results_mean": float(np.mean(result_bytes)) if result_bytes else None
+        },
+        "recall_at_k": float(np.mean(recalls)) if recalls else None,
+        "labeled_questions": len(recalls),
+        "baseline_overlap": float(np.mean(overlaps)) if overlaps else None,
+        "baseline_questions": len(overlaps)
+    }, results_by_question
+
+
+def print_summary(report):
+    # Recall is only shown once some question has labeled chunks
+    show_recall = any(summary["labeled_questions"] for summary in report["paths"].values())
+    print(f"\n{'path':<8}{'questions':>10}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'json KB':>9}"
+          + (f"{'recall@k':>10}" if show_recall else "") + f"{'overlap':>9}")
+    for path, summary in report["paths"].items():
+        latency = summary["latency_ms"] or {}
+        response = summary["json_bytes"]["results_mean"]
+        cells = [
+            f"{latency['p50']:>9.2f}" if latency else f"{'-':>9}",
+            f"{latency['p95']:>9.2f}" if latency else f"{'-':>9}",
+            f"{latency['p99']:>9.2f}" if latency else f"{'-':>9}",
+            f"{response / 1024:>9.1f}" if response is not None else f"{'-':>9}"
+        ]
+        if show_recall:
+            cells.append(f"{summary['recall_at_k']:>10.3f}" if summary["recall_at_k"] is not None else f"{'-':>10}")
+        cells.append(f"{summary['baseline_overlap']:>9.3f}" if summary["baseline_overlap"] is not None else f"{'-':>9}")
+        print(f"{path:<8}{summary['questions']:>10}{summary['errors']:>8}" + "".join(cells))
+    if not show_recall:
+        print("Recall is not measured: no question in the labels file has relevant chunks yet")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the MEM, Pratt and AIPI retrieval paths")
+    parser.add_argument("--backend", choices=BACKENDS, help="Vector store to query; defaults to VECTOR_STORE")
+    parser.add_argument("--embedder", choices=("openai", "fake"), default="openai",
+                        help="fake embeds offline with the hashing embedder")
+    parser.add_argument("--paths", nargs="+", choices=PATHS, default=list(PATHS))
+    parser.add_argument("--questions", default=EVAL_QUESTIONS_FILE)
+    parser.add_argument("--labels", default=LABELS_FILE)
+    parser.add_argument("--all-questions", action="store_true", help="Run every question through every path")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=2, help="Untimed queries per path before measuring")
+    parser.add_argument("--baseline", help="Earlier JSON report to measure result overlap against")
+    parser.add_argument("--output", default="retrieval_benchmark.json")
+    parser.add_argument("--label-candidates",
+                        help="Also write every question's results (ids, sources, excerpts) here, to pick labels from")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    # The project modules read these settings when imported, so set them first
+    if args.backend:
+        os.environ["VECTOR_STORE"] = args.backend
+    backend = os.getenv("VECTOR_STORE", "pinecone")
+    source_dir = os.getenv("VECTOR_STORE_DIR", "data/vector_store")
+    if args.embedder == "fake":
+        if backend == "pinecone":
+            parser.error("--embedder fake needs a local backend (--backend local, ivf, int8 or binary)")
+        os.environ["VECTOR_STORE_DIR"] = tempfile.mkdtemp(prefix="retrieval_benchmark_")
+        # Re-embedded copies are only needed for this run
+        atexit.register(shutil.rmtree, os.environ["VECTOR_STORE_DIR"], ignore_errors=True)
+        # The retrievers check for a key at start-up; queries arrive already embedded, so it is never used
+        os.environ.setdefault("OPENAI_API_KEY", "offline")
+
+    from utils.embeddings import embedding_dimension
+    from utils.semantic_cache import HashingEmbedder
+    from utils.openai_client import get_embeddings_model
+
+    paths = {path: retriever for path, retriever in retrieval_paths().items() if path in args.paths}
+    if args.embedder == "fake":
+        embedder = HashingEmbedder(dimensions=embedding_dimension())
+        build_fake_stores([index_name for index_name, _ in paths.values() if index_name], source_dir, embedder)
+    else:
+        embedder = get_embeddings_model(os.getenv("OPENAI_API_KEY"))
+
+    questions = load_questions(args.questions)
+    labels = load_labels(args.labels)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+    report = {
+        "config": {
+            "backend": backend,
+            "embedder": args.embedder,
+            "embedding_dimensions": embedding_dimension(),
+            "top_k": args.top_k,
+            "commit": git_commit(),
+            "questions_file": os.path.relpath(args.questions, project_root),
+            "all_questions": args.all_questions
+        },
+        "paths": {},
+        "results": {}
+    }
+    candidates = {} if args.label_candidates else None
+    for path, (index_name, retrieve) in paths.items():
+        path_questions = questions_for_path(path, questions, args.all_questions)
+        print(f"Running {len(path_questions)} questions through {path} ({index_name}, {backend})")
+        path_candidates = {} if candidates is not None else None
+        report["paths"][path], report["results"][path] = run_path(
+            retrieve, path_questions, embedder, args.top_k, labels.get(path, {}),
+            baseline.get(path) if baseline else None, args.warmup, path_candidates
+        )
+        if candidates is not None:
+            candidates[path] = path_candidates
+
+    if candidates is not None:
+        with open(args.label_candidates, "w", encoding="utf-8") as f:
+            json.dump(candidates, f, indent=2, sort_keys=True)
+        print(f"Label candidates written to {args.label_candidates}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(_rounded(report), f, indent=2, sort_keys=True)
+    print_summary(report)
+    print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,14 @@ import glob
 from tqdm import tqdm
 import uuid
 from dotenv import load_dotenv
-from langchain_openai import OpenAIEmbeddings
+from openai import OpenAI
+import sys
+
+# Add the project root directory to the Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from utils.embeddings import CachedEmbeddings, embedding_dimension
 import time
 
 # Load environment variables from .env file
@@ -38,8 +45,10 @@ def initialize_pinecone(api_key):
     pc = Pinecone(api_key=api_key)
     return pc
 
-def handle_index(pc, index_name, dimension=1536):
+def handle_index(pc, index_name, dimension=None):
     """Handle Pinecone index creation or connection."""
+    # Defaults to the size of the embeddings this script produces (EMBEDDING_DIMENSIONS)
+    dimension = dimension or embedding_dimension()
     # Check if index exists
     existing_indexes = pc.list_indexes().names()
     
@@ -53,6 +62,11 @@ def handle_index(pc, index_name, dimension=1536):
         print("  - Use the default region for free tier")
         return None
     else:
+        existing_dimension = pc.describe_index(index_name)["dimension"]
+        if existing_dimension != dimension:
+            print(f"Index {index_name} has dimension {existing_dimension}, but the embeddings have {dimension}.")
+            print("Set EMBEDDING_DIMENSIONS to match, or migrate the index with python -m utils.embedding_migration")
+            return None
         print(f"Using existing Pinecone index: {index_name}")
         return pc.Index(index_name)
 
@@ -68,40 +82,40 @@ def embed_and_store_documents(file_paths, embeddings_model, pinecone_index):
     for i in range(0, len(file_paths), batch_size):
         batch_files = file_paths[i:i+batch_size]
         vectors_batch = []
+        documents = []
         
-        for file_path in tqdm(batch_files, desc=f"Embedding batch {i//batch_size + 1}/{(len(file_paths)-1)//batch_size + 1}"):
-            try:
-                # Get file content
-                content = read_text_file(file_path)
-                if not content:
-                    failures += 1
-                    continue
-                
-                # Get file name (title) from the file path
-                file_name = os.path.basename(file_path)
-                title = os.path.splitext(file_name)[0]
-                
-                # Generate embedding
-                embedding = embeddings_model.embed_query(content)
-                
-                # Create unique ID
-                doc_id = str(uuid.uuid4())
-                
-                # Add to vectors batch
-                vectors_batch.append({
-                    "id": doc_id,
-                    "values": embedding,
-                    "metadata": {
-                        "title": title,
-                        "source": file_path
-                    }
-                })
-                
-                successful_uploads += 1
-                
-            except Exception as e:
-                print(f"Error processing {file_path}: {e}")
+        for file_path in tqdm(batch_files, desc=f"Reading batch {i//batch_size + 1}/{(len(file_paths)-1)//batch_size + 1}"):
+            # Get file content
+            content = read_text_file(file_path)
+            if not content:
                 failures += 1
+                continue
+            documents.append((file_path, content))
+        
+        try:
+            # Generate all embeddings for the batch in one call
+            embeddings = embeddings_model.embed_documents([content for _, content in documents])
+        except Exception as e:
+            print(f"Error embedding batch {i//batch_size + 1}: {e}")
+            failures += len(documents)
+            continue
+        
+        for (file_path, _), embedding in zip(documents, embeddings):
+            # Get file name (title) from the file path
+            file_name = os.path.basename(file_path)
+            title = os.path.splitext(file_name)[0]
+            
+            # Add to vectors batch
+            vectors_batch.append({
+                "id": str(uuid.uuid4()),
+                "values": embedding,
+                "metadata": {
+                    "title": title,
+                    "source": file_path
+                }
+            })
+            
+            successful_uploads += 1
         
         # Upload batch to Pinecone
         if vectors_batch:
@@ -132,6 +146,7 @@ def main():
     
     # Configuration
     embedding_model_name = "text-embedding-3-small"
+    dimension = embedding_dimension(embedding_model_name)
     index_name = "meng-ai"
     
     # Get text files
@@ -143,15 +158,15 @@ def main():
         return
     
     # Initialize embedding model
-    print(f"Initializing OpenAI embedding model: {embedding_model_name}")
-    embeddings_model = OpenAIEmbeddings(model=embedding_model_name)
+    print(f"Initializing OpenAI embedding model: {embedding_model_name} ({dimension} dimensions)")
+    embeddings_model = CachedEmbeddings(OpenAI(api_key=openai_api_key), model=embedding_model_name)
     
     # Initialize Pinecone
     print("Connecting to Pinecone...")
     pc = initialize_pinecone(pinecone_api_key)
     
     # Get Pinecone index
-    pinecone_index = handle_index(pc, index_name)
+    pinecone_index = handle_index(pc, index_name, dimension)
     
     if pinecone_index:
         # Process files and store in Pinecone
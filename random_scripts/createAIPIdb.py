@@ -3,12 +3,23 @@ from dotenv import load_dotenv
 from pinecone import Pinecone
 from openai import OpenAI
 import uuid
+import sys
+
+# Add the project root directory to the Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
+
+from utils.embeddings import CachedEmbeddings, EMBEDDING_MODEL, embedding_dimension
+from utils.document_store import get_chunk_store
 
 # Load environment variables
 load_dotenv()
 
 # Initialize OpenAI client
 client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+# Output size comes from EMBEDDING_DIMENSIONS (full size when unset)
+embedding_model = os.getenv('EMBEDDING_MODEL', EMBEDDING_MODEL)
+embeddings = CachedEmbeddings(client, model=embedding_model)
 
 # Initialize Pinecone with the new API
 pc = Pinecone(api_key=os.getenv('PINECONE_API_KEY'))
@@ -16,21 +27,27 @@ pc = Pinecone(api_key=os.getenv('PINECONE_API_KEY'))
 # Connect to Pinecone index
 index = pc.Index(os.getenv('PINECONE_INDEX'))
 
+# A Pinecone index's dimension is fixed when it is created
+index_dimension = pc.describe_index(os.getenv('PINECONE_INDEX'))["dimension"]
+if index_dimension != embedding_dimension(embedding_model, embeddings.dimensions):
+    print(f"Error: index {os.getenv('PINECONE_INDEX')} has dimension {index_dimension}, "
+          f"but the embeddings have {embedding_dimension(embedding_model, embeddings.dimensions)}.")
+    print("Set EMBEDDING_DIMENSIONS to match, or create a new index at the new size.")
+    exit(1)
+
+# Local copy of every chunk, so get_AIPI_details can reassemble files without extra queries
+chunk_store = get_chunk_store(os.getenv('PINECONE_INDEX'))
+
 # Define the folder containing the text files
 folder_path = "scraped_websites"
 
+# Pinecone accepts up to 2MB per upsert request; 100 chunks of 500 characters stays well under
+UPSERT_BATCH_SIZE = 100
+
 # Define a function to chunk text into smaller parts
 def chunk_text(text, chunk_size=500):
     return [text[i:i+chunk_size] for i in range(0, len(text), chunk_size)]
 
-# Function to create embeddings
-def create_embedding(text):
-    response = client.embeddings.create(
-        input=text,
-        model=os.getenv('EMBEDDING_MODEL')
-    )
-    return response.data[0].embedding
-
 # Iterate through all files in the folder
 chunks_metadata = []
 unique_id = 0
@@ -50,8 +67,12 @@ for filename in os.listdir(folder_path):
             text = file.read()
             chunks = chunk_text(text)
             
-            # Process each chunk
-            for position, chunk in enumerate(chunks):
+            # One embeddings call per file; the batching layer splits it into
+            # token-limited requests and skips chunks that are already cached
+            embeddings_batch = embeddings.embed_documents(chunks)
+
+            vectors = []
+            for position, (chunk, embedding) in enumerate(zip(chunks, embeddings_batch)):
                 # Create a unique ID for this chunk
                 chunk_id = str(unique_id)
                 
@@ -63,20 +84,19 @@ for filename in os.listdir(folder_path):
                     "uniqueID": unique_id
                 }
                 
-                # Create embedding
-                embedding = create_embedding(chunk)
-                
-                # Upload to Pinecone
-                index.upsert(
-                    vectors=[(chunk_id, embedding, metadata)]
-                )
+                vectors.append((chunk_id, embedding, metadata))
                 
                 # Store metadata for verification
                 chunks_metadata.append(metadata)
+                chunk_store.add_chunk(filename, position, chunk)
                 
                 unique_id += 1
-                
-                if unique_id % 10 == 0:
-                    print(f"Processed {unique_id} chunks...")
 
+            # Upload the file's chunks to Pinecone in batches
+            for start in range(0, len(vectors), UPSERT_BATCH_SIZE):
+                index.upsert(vectors=vectors[start:start + UPSERT_BATCH_SIZE])
+            print(f"Processed {unique_id} chunks...")
+
+chunk_store.save()
 print(f"Total chunks processed: {unique_id}")
+print(f"Chunk store saved to {chunk_store.path}")
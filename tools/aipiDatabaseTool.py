@@ -1,14 +1,26 @@
 import os
 import json
 from typing import Dict, List, Any
-from pinecone import Pinecone
-from openai import OpenAI
+from utils.openai_client import get_openai_client, current_api_key, current_client
+from utils.embeddings import CachedEmbeddings, embedding_dimension
 from dotenv import load_dotenv
+from utils.tracing import span, record_usage
+from utils.resilience import call_with_resilience
+from utils.vector_store import open_vector_store, use_local_vector_store
+from utils.pinecone_utils import get_index_handle
+from utils.document_store import get_chunk_store
+from utils.lexical_index import hybrid_query
+from utils.passages import passage_result, should_summarize
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 
 load_dotenv()
 
+# Pinecone's largest top_k when metadata is included
+MAX_CHUNKS_PER_FILE = 1000
+
 class PineconeRetriever:
-    def __init__(self, api_key=None, index_name=None, embedding_model="text-embedding-3-small"):
+    def __init__(self, api_key=None, index_name=None, embedding_model="text-embedding-3-small", openai_api_key=None):
         """
         Initialize the PineconeRetriever with the necessary credentials.
         
@@ -16,24 +28,33 @@ class PineconeRetriever:
             api_key (str): Pinecone API key. Defaults to PINECONE_API_KEY env variable.
             index_name (str): Name of the Pinecone index. Defaults to PINECONE_INDEX env variable.
             embedding_model (str): OpenAI embedding model to use. Defaults to text-embedding-3-small.
+            openai_api_key (str): OpenAI API key. Defaults to the current request's or session's key.
         """
         self.api_key = api_key or os.getenv("PINECONE_API_KEY_AIPI")
         self.index_name = index_name or os.getenv("PINECONE_INDEX_AIPI")
         self.embedding_model = embedding_model
         
-        if not all([self.api_key, self.index_name]):
+        # The Pinecone key is only needed when querying the remote index
+        if not self.index_name or not (self.api_key or use_local_vector_store()):
             raise ValueError("Missing required Pinecone credentials")
         
-        self.openai_api_key = os.getenv("OPENAI_API_KEY")
+        self.openai_api_key = openai_api_key or current_api_key()
         if not self.openai_api_key:
             raise ValueError("Missing OpenAI API key")
         
-        # Initialize Pinecone with new API
-        self.pc = Pinecone(api_key=self.api_key)
-        self.index = self.pc.Index(self.index_name)
+        # Pinecone index, or the local store when VECTOR_STORE=local
+        self.index = open_vector_store(
+            self.index_name,
+            lambda: get_index_handle(self.index_name, db_name="AIPI", api_key=self.api_key),
+            embedding_dimension(self.embedding_model)
+        )
+        self.backend = getattr(self.index, "backend", "pinecone")
+        # Chunks keyed by source_file and position, for reassembling whole files
+        self.chunk_store = get_chunk_store(self.index_name)
         
-        # Initialize OpenAI client
-        self.client = OpenAI(api_key=self.openai_api_key)
+        # Shared OpenAI client with a pooled keep-alive connection
+        self.client = get_openai_client(self.openai_api_key)
+        self.embeddings = CachedEmbeddings(self.client, model=self.embedding_model)
     
     def get_embedding(self, text: str) -> List[float]:
         """
@@ -45,32 +66,58 @@ class PineconeRetriever:
         Returns:
             List[float]: Vector embedding
         """
-        response = self.client.embeddings.create(
-            input=text,
-            model=self.embedding_model
-        )
-        return response.data[0].embedding
+        return self.embeddings.embed_query(text)
+    
+    def _fetch_document_chunks(self, source_file: str, query_embedding: List[float]) -> None:
+        """Load every chunk of one file into the chunk store with a filtered query"""
+        with span("vector.query", backend=self.backend, index=self.index_name,
+                  top_k=MAX_CHUNKS_PER_FILE, filtered=True) as record:
+            file_vectors = self.index.query(
+                vector=query_embedding,  # We still need a vector for the query
+                filter={"source_file": {"$eq": source_file}},
+                top_k=MAX_CHUNKS_PER_FILE,
+                include_metadata=True
+            )
+            record["matches"] = len(file_vectors['matches'])
+        
+        if len(file_vectors['matches']) >= MAX_CHUNKS_PER_FILE:
+            print(f"Warning: {source_file} has at least {MAX_CHUNKS_PER_FILE} chunks; the reconstruction may be truncated")
+        self.chunk_store.add_matches(file_vectors['matches'])
     
-    def query_and_reconstruct(self, query: str, top_k: int = 3) -> Dict[str, Any]:
+    def fetch_documents(self, source_files: List[str], query_embedding: List[float]) -> None:
+        """
+        Fetch the chunks of several files from the index at the same time.
+        They stay in the in-memory chunk store, so each file is fetched once per process.
+        """
+        with ThreadPoolExecutor(max_workers=len(source_files)) as executor:
+            futures = [
+                executor.submit(copy_context().run, self._fetch_document_chunks, source_file, query_embedding)
+                for source_file in source_files
+            ]
+            for future in futures:
+                future.result()
+    
+    def query_and_reconstruct(self, query: str, top_k: int = 3, query_embedding: List[float] = None) -> Dict[str, Any]:
         """
         Main function to process a query, find similar vectors, and reconstruct files.
         
         Args:
             query (str): User query
             top_k (int): Number of top vectors to retrieve
+            query_embedding (List[float]): Optional embedding of query computed by the caller
             
         Returns:
             Dict: JSON response with reconstructed files
         """
         # Get embedding for the query
-        query_embedding = self.get_embedding(query)
+        if query_embedding is None:
+            query_embedding = self.get_embedding(query)
         
-        # Query Pinecone for similar vectors
-        results = self.index.query(
-            vector=query_embedding,
-            top_k=top_k,
-            include_metadata=True
-        )
+        # Find the most relevant chunks
+        with span("vector.query", backend=self.backend, index=self.index_name, top_k=top_k) as record:
+            # Vector similarity fused with BM25 keyword matches (see utils.lexical_index)
+            results = hybrid_query(self.index, self.index_name, query_embedding, query, top_k=top_k)
+            record["matches"] = len(results['matches'])
         
         # Track unique source files from top results
         unique_source_files = set()
@@ -78,40 +125,17 @@ class PineconeRetriever:
             if 'metadata' in match and 'source_file' in match['metadata']:
                 unique_source_files.add(match['metadata']['source_file'])
         
-        reconstructed_files = []
+        # Reassemble files from the local chunk store; only files it does not
+        # hold yet are fetched from the index, concurrently
+        missing_files = [f for f in unique_source_files if not self.chunk_store.has_document(f)]
+        if missing_files:
+            self.fetch_documents(missing_files, query_embedding)
         
-        # Process each unique source file
+        reconstructed_files = []
         for source_file in unique_source_files:
-            # Query to get all vectors from this source file
-            file_query = {
-                "source_file": {"$eq": source_file}
-            }
-            
-            # Using a large top_k to ensure we get all chunks from the file
-            file_vectors = self.index.query(
-                vector=query_embedding,  # We still need a vector for the query
-                filter=file_query,
-                top_k=100,  # Assuming no single file has more than 100 chunks
-                include_metadata=True
-            )
-            
-            # Sort chunks by position to reconstruct the original text
-            sorted_chunks = sorted(
-                file_vectors['matches'], 
-                key=lambda x: x['metadata'].get('position', 0) 
-                if 'metadata' in x and 'position' in x['metadata'] else 0
-            )
-            
-            # Reconstruct the full text
-            reconstructed_text = ""
-            for chunk in sorted_chunks:
-                if 'metadata' in chunk and 'text' in chunk['metadata']:
-                    reconstructed_text += chunk['metadata']['text'] + " "
-            
-            # Add to our results
             reconstructed_files.append({
                 "source_file": source_file,
-                "reconstructed_content": reconstructed_text.strip(),
+                "reconstructed_content": self.chunk_store.document(source_file),
                 "relevance_score": next(
                     (m['score'] for m in results['matches'] 
                      if 'metadata' in m and m['metadata'].get('source_file') == source_file), 
@@ -127,20 +151,41 @@ class PineconeRetriever:
             "reconstructed_files": reconstructed_files
         }
 
-def get_AIPI_details(query: str, api_key=None) -> Dict[str, Any]:
+def retrieve(query: str, top_k: int = 3, query_embedding: List[float] = None) -> List[Dict[str, Any]]:
+    """
+    Return the reconstructed AIPI pages most relevant to query, best first,
+    without summarizing them.
+    """
+    return PineconeRetriever().query_and_reconstruct(query, top_k, query_embedding)["reconstructed_files"]
+
+def document_passages(reconstructed_files: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Passages (program, source, reference, text) from reconstructed AIPI pages"""
+    return [{
+        "program": "AIPI",
+        "source": "AIPI website",
+        "reference": document["source_file"],
+        "text": document["reconstructed_content"]
+    } for document in reconstructed_files]
+
+def get_AIPI_details(query: str, api_key=None, summarize: bool = None) -> Dict[str, Any]:
     """
     Main function to be called by the LLM agent.
     
     Args:
         query (str): User query
+        summarize (bool): Answer with gpt-4-turbo instead of returning passages.
+            Defaults to SUMMARIZE_SEARCH_RESULTS.
         
     Returns:
-        Dict: Dictionary with reconstructed files
+        Dict: The relevant pages as passages trimmed to a token budget, or the summarized answer
     """
     try:
-        retriever = PineconeRetriever()
+        retriever = PineconeRetriever(openai_api_key=api_key)
         result = retriever.query_and_reconstruct(query)
         
+        if not should_summarize(summarize):
+            return passage_result(query, document_passages(result["reconstructed_files"]))
+        
         print("\n=== Testing with ChatGPT ===")
         chatgptSummary = test_with_chatgpt(query, result)
 
@@ -198,14 +243,21 @@ Answer:"""
     
     # Call ChatGPT to get the answer
     try:
-        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        response = client.chat.completions.create(
-            model="gpt-4-turbo",  # or "gpt-3.5-turbo"
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant. Use only the provided context information to answer the question."},
-                {"role": "user", "content": prompt}
-            ]
-        )
+        client = current_client()
+        with span("llm.chat", model="gpt-4-turbo", request_chars=len(prompt)) as record:
+            response = call_with_resilience(
+                "chat:gpt-4-turbo",
+                lambda: client.chat.completions.create(
+                    model="gpt-4-turbo",  # or "gpt-3.5-turbo"
+                    messages=[
+                        {"role": "system", "content": "You are a helpful assistant. Use only the provided context information to answer the question."},
+                        {"role": "user", "content": prompt}
+                    ]
+                ),
+                hedge=True,
+                record=record
+            )
+            record_usage(record, response.usage)
         
         # Print the results
         print("\n=== Retrieved Context Files ===")
@@ -218,6 +270,7 @@ Answer:"""
         
     except Exception as e:
         print(f"Error calling ChatGPT: {str(e)}")
+        return "Failed to get a valid response from OpenAI."
 
 if __name__ == "__main__":
     import sys
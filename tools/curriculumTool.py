@@ -1,9 +1,11 @@
 import requests
+import httpx
 from dotenv import load_dotenv
 import os
 from urllib.parse import quote
 import json
 from difflib import SequenceMatcher
+from utils.tracing import span, url_for_trace
 
 load_dotenv()
 
@@ -67,9 +69,8 @@ def find_best_match(query, subjects):
         return best_match
     return None
 
-def get_courses(subject):
-    """A tool to get all courses for a given subject"""
-    
+def _courses_url(subject):
+    """Resolve a subject query to its streamer API courses URL, or an error dict"""
     # Load subjects and find the best match
     subjects = load_subjects()
     match = find_best_match(subject, subjects)
@@ -81,14 +82,12 @@ def get_courses(subject):
     formatted_subject = f"{code} - {name}"
     
     encoded_subject = quote(formatted_subject)
-    url = f"{BASE_URL}/curriculum/courses/subject/{encoded_subject}?access_token={DUKE_API_KEY}"
-    response = requests.get(url)
-
-    if response.status_code != 200:
-        return {"error": response.status_code, "message": response.text}
+    return f"{BASE_URL}/curriculum/courses/subject/{encoded_subject}?access_token={DUKE_API_KEY}"
 
+def _parse_courses(data):
+    """Turn a streamer API courses response into a list of course summaries"""
     try:
-        courses_raw = response.json()['ssr_get_courses_resp']['course_search_result']['subjects']['subject']['course_summaries']['course_summary']
+        courses_raw = data['ssr_get_courses_resp']['course_search_result']['subjects']['subject']['course_summaries']['course_summary']
         summaries = [
             {
                 "catalog_nbr": c.get("catalog_nbr", "").strip(),
@@ -103,18 +102,49 @@ def get_courses(subject):
     except KeyError:
         return {"error": "No courses found or unexpected response structure."}
 
+def get_courses(subject):
+    """A tool to get all courses for a given subject"""
+    
+    url = _courses_url(subject)
+    if isinstance(url, dict):
+        return url
 
-def get_course_details_helper(crse_id, crse_offer_nbr):
-    """A tool to get detailed course info for a specific course using its ID and offering number"""
+    with span("http.get", url=url_for_trace(url)) as record:
+        response = requests.get(url)
+        record["status"] = response.status_code
+        record["response_bytes"] = len(response.content)
+
+    if response.status_code != 200:
+        return {"error": response.status_code, "message": response.text}
+
+    return _parse_courses(response.json())
 
-    url = f"{BASE_URL}/curriculum/courses/crse_id/{crse_id}/crse_offer_nbr/{crse_offer_nbr}?access_token={DUKE_API_KEY}"
-    response = requests.get(url)
+async def aget_courses(subject):
+    """Async version of get_courses"""
+
+    url = _courses_url(subject)
+    if isinstance(url, dict):
+        return url
+
+    with span("http.get", url=url_for_trace(url)) as record:
+        async with httpx.AsyncClient(timeout=15) as client:
+            response = await client.get(url)
+        record["status"] = response.status_code
+        record["response_bytes"] = len(response.content)
 
     if response.status_code != 200:
         return {"error": response.status_code, "message": response.text}
 
+    return _parse_courses(response.json())
+
+
+def _course_details_url(crse_id, crse_offer_nbr):
+    return f"{BASE_URL}/curriculum/courses/crse_id/{crse_id}/crse_offer_nbr/{crse_offer_nbr}?access_token={DUKE_API_KEY}"
+
+def _parse_course_details(data, text):
+    """Turn a streamer API course offering response into a course info dict"""
     try:
-        data = response.json()['ssr_get_course_offering_resp']['course_offering_result']['course_offering']
+        data = data['ssr_get_course_offering_resp']['course_offering_result']['course_offering']
         course_info = {
             "title": data.get("course_title_long", "N/A"),
             "description": data.get("descrlong", "No description available."),
@@ -126,12 +156,55 @@ def get_course_details_helper(crse_id, crse_offer_nbr):
             "department": data.get("acad_org_lov_descr", "N/A"),
             "consent": data.get("consent_lov_descr", "N/A"),
             "component": data.get("course_components", {}).get("course_component", {}).get("ssr_component_lov_descr", "N/A"),
-            "scheduled": "*** This course has not been scheduled. ***" not in response.text
+            "scheduled": "*** This course has not been scheduled. ***" not in text
         }
         return course_info
     except KeyError:
         return {"error": "Unexpected structure in course detail response."}
 
+def get_course_details_helper(crse_id, crse_offer_nbr):
+    """A tool to get detailed course info for a specific course using its ID and offering number"""
+
+    url = _course_details_url(crse_id, crse_offer_nbr)
+    with span("http.get", url=url_for_trace(url)) as record:
+        response = requests.get(url)
+        record["status"] = response.status_code
+        record["response_bytes"] = len(response.content)
+
+    if response.status_code != 200:
+        return {"error": response.status_code, "message": response.text}
+
+    return _parse_course_details(response.json(), response.text)
+
+async def aget_course_details_helper(crse_id, crse_offer_nbr):
+    """Async version of get_course_details_helper"""
+
+    url = _course_details_url(crse_id, crse_offer_nbr)
+    with span("http.get", url=url_for_trace(url)) as record:
+        async with httpx.AsyncClient(timeout=15) as client:
+            response = await client.get(url)
+        record["status"] = response.status_code
+        record["response_bytes"] = len(response.content)
+
+    if response.status_code != 200:
+        return {"error": response.status_code, "message": response.text}
+
+    return _parse_course_details(response.json(), response.text)
+
+
+def _select_course(course_list, course_title=None, course_number=None):
+    """Pick the course from course_list that best matches the title or number"""
+    if course_title:
+        match = find_best_match(course_title, [course['title'] for course in course_list])
+        key = 'title'
+    else:
+        match = find_best_match(course_number, [course['catalog_nbr'] for course in course_list])
+        key = 'catalog_nbr'
+
+    for course in course_list:
+        if course[key] == match:
+            return course
+    return None
 
 def get_course_details(subject, course_title=None, course_number=None, api_key = None):
     """
@@ -145,36 +218,31 @@ def get_course_details(subject, course_title=None, course_number=None, api_key =
     if isinstance(course_list, dict) and "error" in course_list:
         return course_list
 
-    if course_title:
-        query = course_title
-        match = find_best_match(query, [course['title'] for course in course_list])
-
-        for course in course_list:
-            if course['title'] == match:
-                course_details = course
-                break
+    if not (course_title or course_number):
+        return {"error": "No course title or number provided."}
 
-        course_details = get_course_details_helper(course_details['crse_id'], course_details['crse_offer_nbr'])
-     
-        return course_details
-    
-    elif course_number:
-        query = course_number
-        match = find_best_match(query, [course['catalog_nbr'] for course in course_list])
+    course = _select_course(course_list, course_title, course_number)
+    if course is None:
+        return {"error": f"No matching course found in '{subject}'."}
 
-        # based on the catalog number match, get the course details
-        for course in course_list:
-            if course['catalog_nbr'] == match:
-                course_details = course
-                break
+    return get_course_details_helper(course['crse_id'], course['crse_offer_nbr'])
 
-        course_details = get_course_details_helper(course_details['crse_id'], course_details['crse_offer_nbr'])
+async def aget_course_details(subject, course_title=None, course_number=None, api_key = None):
+    """Async version of get_course_details"""
 
-        return course_details
+    course_list = await aget_courses(subject)
+    if isinstance(course_list, dict) and "error" in course_list:
+        return course_list
 
-    else:
+    if not (course_title or course_number):
         return {"error": "No course title or number provided."}
 
+    course = _select_course(course_list, course_title, course_number)
+    if course is None:
+        return {"error": f"No matching course found in '{subject}'."}
+
+    return await aget_course_details_helper(course['crse_id'], course['crse_offer_nbr'])
+
 
 if __name__ == "__main__":
  
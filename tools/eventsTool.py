@@ -1,9 +1,11 @@
 import requests
+import httpx
 from datetime import datetime
 from urllib.parse import quote
 import json
 import re
-from utils.openai_client import get_chat_completion
+from utils.openai_client import get_chat_completion, aget_chat_completion
+from utils.tracing import span, url_for_trace
 
 # Load groups and categories from the correct relative paths
 GROUPS_FILE = "data/eventsData/groups.txt"
@@ -16,7 +18,7 @@ with open(GROUPS_FILE, "r") as f:
 with open(CATEGORIES_FILE, "r") as f:
     categories_list = [line.strip() for line in f if line.strip()]
 
-def get_event_filters_with_gpt(user_prompt, groups=['All'], categories=['All']):
+def _event_filter_messages(user_prompt, groups, categories):
 
     system_prompt = """"The year is 2025. You are an assistant that extracts event filters for an event calendar API. Given a user query and lists of valid 'groups' and 'categories', extract:
 
@@ -46,8 +48,19 @@ Available categories:
 {categories}
 """}
     ]
-
-    response = get_chat_completion( messages)
+    return messages
+
+def _parse_event_filters(response):
+    """Parse the model's JSON filter reply, falling back to broad defaults"""
+    default_filters = {
+        "future_days": 30,
+        "groups": [],
+        "categories": [],
+        "target_date": None,
+        "location_keywords": []
+    }
+    if response is None or not response.content:
+        return default_filters
 
     content = response.content.strip()
     if content.startswith("```"):
@@ -57,13 +70,18 @@ Available categories:
         return json.loads(content)
     except json.JSONDecodeError:
         # Fallback in case parsing fails
-        return {
-            "future_days": 30,
-            "groups": [],
-            "categories": [],
-            "target_date": None,
-            "location_keywords": []
-        }
+        return default_filters
+
+def get_event_filters_with_gpt(user_prompt, groups=['All'], categories=['All']):
+    messages = _event_filter_messages(user_prompt, groups, categories)
+    response = get_chat_completion(messages)
+    return _parse_event_filters(response)
+
+async def aget_event_filters_with_gpt(user_prompt, groups=['All'], categories=['All']):
+    """Async version of get_event_filters_with_gpt"""
+    messages = _event_filter_messages(user_prompt, groups, categories)
+    response = await aget_chat_completion(messages)
+    return _parse_event_filters(response)
 
 def fetch_filtered_events(groups=None, categories=None, future_days=1, location_keywords=None, target_date=None):
     base_url = "https://calendar.duke.edu/events/index.json"
@@ -144,7 +162,8 @@ def fetch_filtered_events(groups=None, categories=None, future_days=1, location_
 
 
 
-def fetch_filtered_events_data(categories=None, future_days=1, groups=None, location_keywords=None, target_date=None):
+def _events_url(groups=None, categories=None, future_days=1):
+    """Build the calendar API URL for the given group and category filters"""
     base_url = "https://calendar.duke.edu/events/index.json"
 
     fixed_params = {
@@ -166,56 +185,82 @@ def fetch_filtered_events_data(categories=None, future_days=1, groups=None, loca
     if categories and not ("all" in [c.lower() for c in categories]):
         query_parts += [f"cfu[]={quote(c)}" for c in categories]
 
-    full_url = f"{base_url}?{'&'.join(query_parts)}"
-    print(f"\n🔍 Constructed URL: {full_url}\n")
+    return f"{base_url}?{'&'.join(query_parts)}"
+
+def _parse_events(data, location_keywords=None, target_date=None):
+    """Filter and format the events from a calendar API response"""
+    events = data.get("events", [])
+    if not events:
+        return "⚠️ No events found for the selected filters."
+    
+    events_data = []
+    for event in events:
+        title = event.get("summary", "No Title")
+        description = event.get("description", "").strip()
+        start_ts = event.get("start_timestamp", "")
+        location = event.get("location", {}).get("address", "TBD")
+        link = event.get("link", "")
+
+        start_dt = None
+        try:
+            start_dt = datetime.strptime(start_ts, "%Y-%m-%dT%H:%M:%SZ")
+            formatted_start = start_dt.strftime("%b %d, %Y %I:%M %p")
+        except:
+            formatted_start = start_ts
+
+        # Filter by exact date (if provided)
+        if target_date:
+            try:
+                filter_date = datetime.strptime(target_date, "%Y-%m-%d").date()
+                if not start_dt or start_dt.date() != filter_date:
+                    continue  # Skip if not the target date
+            except:
+                pass
 
-    try:
-        response = requests.get(full_url)
-        response.raise_for_status()
-        data = response.json()
+        # Skip if location doesn't match (if location keywords are provided)
+        if location_keywords and location:
+            location_lower = location.lower()
+            if not any(keyword.lower() in location_lower for keyword in location_keywords):
+                continue
 
-        events = data.get("events", [])
-        if not events:
-            return "⚠️ No events found for the selected filters."
-        
-        events_data = []
-        for event in events:
-            title = event.get("summary", "No Title")
-            description = event.get("description", "").strip()
-            start_ts = event.get("start_timestamp", "")
-            location = event.get("location", {}).get("address", "TBD")
-            link = event.get("link", "")
+        events_data.append({
+            "title": title,
+            "start_time": formatted_start,
+            "location": location,
+            "link": link,
+            "description": description[:150] if description else ""
+        })
 
-            try:
-                start_dt = datetime.strptime(start_ts, "%Y-%m-%dT%H:%M:%SZ")
-                formatted_start = start_dt.strftime("%b %d, %Y %I:%M %p")
-            except:
-                formatted_start = start_ts
+    return events_data
 
-            # Filter by exact date (if provided)
-            if target_date:
-                try:
-                    filter_date = datetime.strptime(target_date, "%Y-%m-%d").date()
-                    if not start_dt or start_dt.date() != filter_date:
-                        continue  # Skip if not the target date
-                except:
-                    pass
+def fetch_filtered_events_data(categories=None, future_days=1, groups=None, location_keywords=None, target_date=None):
+    full_url = _events_url(groups, categories, future_days)
+    print(f"\n🔍 Constructed URL: {full_url}\n")
 
-            # Skip if location doesn't match (if location keywords are provided)
-            if location_keywords and location:
-                location_lower = location.lower()
-                if not any(keyword.lower() in location_lower for keyword in location_keywords):
-                    continue
+    try:
+        with span("http.get", url=url_for_trace(full_url)) as record:
+            response = requests.get(full_url)
+            record["status"] = response.status_code
+            record["response_bytes"] = len(response.content)
+        response.raise_for_status()
+        return _parse_events(response.json(), location_keywords, target_date)
+
+    except Exception as e:
+        return f"❌ Error fetching events: {e}"
 
-            events_data.append({
-                "title": title,
-                "start_time": formatted_start,
-                "location": location,
-                "link": link,
-                "description": description[:150] if description else ""
-            })
+async def afetch_filtered_events_data(categories=None, future_days=1, groups=None, location_keywords=None, target_date=None):
+    """Async version of fetch_filtered_events_data"""
+    full_url = _events_url(groups, categories, future_days)
+    print(f"\n🔍 Constructed URL: {full_url}\n")
 
-        return events_data
+    try:
+        with span("http.get", url=url_for_trace(full_url)) as record:
+            async with httpx.AsyncClient(timeout=30) as client:
+                response = await client.get(full_url)
+            record["status"] = response.status_code
+            record["response_bytes"] = len(response.content)
+        response.raise_for_status()
+        return _parse_events(response.json(), location_keywords, target_date)
 
     except Exception as e:
         return f"❌ Error fetching events: {e}"
@@ -223,19 +268,24 @@ def fetch_filtered_events_data(categories=None, future_days=1, groups=None, loca
 def get_events(query, api_key=None):
     filters = get_event_filters_with_gpt(query, groups_list, categories_list)
 
-    groups = filters.get("groups", [])
-    categories = filters.get("categories", [])
-    future_days = filters.get("future_days", 30)
+    return fetch_filtered_events_data(
+        groups=filters.get("groups", []),
+        categories=filters.get("categories", []),
+        future_days=filters.get("future_days", 30),
+        target_date=filters.get("target_date", None),
+        location_keywords=filters.get("location_keywords", [])
+    )
 
-    target_date = filters.get("target_date", None)
-    location_keywords = filters.get("location_keywords", [])
+async def aget_events(query, api_key=None):
+    """Async version of get_events"""
+    filters = await aget_event_filters_with_gpt(query, groups_list, categories_list)
 
-    return fetch_filtered_events_data(
-        groups=groups,
-        categories=categories,
-        future_days=future_days,
-        target_date=target_date,
-        location_keywords=location_keywords
+    return await afetch_filtered_events_data(
+        groups=filters.get("groups", []),
+        categories=filters.get("categories", []),
+        future_days=filters.get("future_days", 30),
+        target_date=filters.get("target_date", None),
+        location_keywords=filters.get("location_keywords", [])
     )
   
 if __name__ == "__main__":
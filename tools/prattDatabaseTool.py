@@ -1,39 +1,67 @@
 from utils.pinecone_utils import initialize_pinecone_index, get_embeddings_model
 from utils.openai_client import get_openai_client, get_chat_completion
+import os
 from typing import List, Dict
+from utils.tracing import span
+from utils.vector_store import open_vector_store
+from utils.lexical_index import hybrid_query
+from utils.passages import match_passages, passage_result, should_summarize
+from utils.embeddings import embedding_dimension
 from utils.pinecone_utils import process_pdf
 
-def search(query: str) -> List[Dict]:
+NAMESPACE = "pratt-handbook"
+# Override to point at an index migrated to another embedding size
+INDEX_NAME = os.getenv("PRATT_INDEX_NAME", "pratt-database")
+# Matches the query embeddings: 1536 unless EMBEDDING_DIMENSIONS shortens them
+DIMENSION = embedding_dimension()
+METRIC = "cosine"
+
+def retrieve(query: str, top_k: int = 3, query_embedding=None) -> List[Dict]:
     """
-    Search Pratt related content in the vector database
+    Return the top_k Pratt chunks for query as vector store matches (id, score, metadata).
+    Pass query_embedding to reuse an embedding computed by the caller.
     """
-    top_k = 3
-    namespace = "pratt-handbook"
-    index_name = "pratt-database"
-    dimension = 1536
-    metric = "cosine"
+    if query_embedding is None:
+        embeddings = get_embeddings_model()
+        # Create embedding for the query
+        query_embedding = embeddings.embed_query(query)
+    
+    # Initialize index (Pinecone, or the local store when VECTOR_STORE=local)
+    index = open_vector_store(
+        INDEX_NAME, lambda: initialize_pinecone_index(INDEX_NAME, DIMENSION, METRIC, "PRATT"), DIMENSION, METRIC
+    )
     
+    # Search the vector store
+    with span("vector.query", backend=getattr(index, "backend", "pinecone"), index=INDEX_NAME,
+              namespace=NAMESPACE, top_k=top_k) as record:
+        # Vector similarity fused with BM25 keyword matches (see utils.lexical_index)
+        results = hybrid_query(index, INDEX_NAME, query_embedding, query, top_k=top_k, namespace=NAMESPACE)
+        record["matches"] = len(results['matches'])
+    return results['matches']
+
+def retrieve_passages(query: str, top_k: int = 3, query_embedding=None) -> List[Dict]:
+    """The top_k Pratt chunks as passages with program, source and page reference"""
+    return match_passages(retrieve(query, top_k, query_embedding), "Pratt", "Pratt Bulletin")
+
+def search(query: str, summarize: bool = None) -> List[Dict]:
+    """
+    Search Pratt related content in the vector database.
+
+    Returns the matching passages trimmed to a token budget, or, with
+    summarize=True (default: SUMMARIZE_SEARCH_RESULTS), an LLM answer based on them.
+    """
     embeddings = get_embeddings_model()
     if not embeddings:
         return "Error: Could not initialize embeddings model for Pratt Search"
-    # Create embedding for the query
-    query_embedding = embeddings.embed_query(query)
     
-    # Initialize index
-    index = initialize_pinecone_index(index_name, dimension, metric, "PRATT")
-    
-    # Search in Pinecone
-    results = index.query(
-        namespace=namespace,
-        vector=query_embedding,
-        top_k=top_k,
-        include_metadata=True
-    )
+    matches = retrieve(query, query_embedding=embeddings.embed_query(query))
+    if not should_summarize(summarize):
+        return passage_result(query, match_passages(matches, "Pratt", "Pratt Bulletin"))
 
     messages = [
         {"role": "system", "content": "You are a helpful assistant that summarizes text."},
         {"role": "user", "content": f"""Answer the following question based on the following text:
-{results['matches']}
+{matches}
 
 Question: {query}
 """}
@@ -0,0 +1,98 @@
+"""
+Federated search across the MEM handbook, the Pratt bulletin and the AIPI
+website.
+
+Cross-program questions ("How do the MEM and AIPI capstones differ?") used
+to take one agent turn per program tool. search_duke_programs embeds the
+question once, queries every requested corpus at the same time and merges
+the results by reciprocal rank fusion into one bundle of passages, each
+labeled with the program and source it came from, deduplicated and trimmed
+to the passage token budget (see utils.passages).
+"""
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Dict, List
+
+from tools import memDatabaseTool, prattDatabaseTool, aipiDatabaseTool
+from utils.lexical_index import reciprocal_rank_fusion
+from utils.passages import passage_result
+from utils.openai_client import get_embeddings_model
+from utils.tracing import span
+
+PROGRAMS = ["MEM", "Pratt", "AIPI"]
+PASSAGES_PER_PROGRAM = 3
+
+
+def _aipi_passages(query, top_k, query_embedding):
+    return aipiDatabaseTool.document_passages(aipiDatabaseTool.retrieve(query, top_k, query_embedding))
+
+
+PROGRAM_RETRIEVERS = {
+    "MEM": memDatabaseTool.retrieve_passages,
+    "Pratt": prattDatabaseTool.retrieve_passages,
+    "AIPI": _aipi_passages
+}
+
+
+def _retrieve_program(program, query, query_embedding, top_k):
+    with span(f"federated.{program.lower()}") as record:
+        passages = PROGRAM_RETRIEVERS[program](query, top_k, query_embedding)
+        record["passages"] = len(passages)
+    return passages
+
+
+def _normalize_programs(programs):
+    if not programs:
+        return list(PROGRAMS)
+    by_name = {program.lower(): program for program in PROGRAMS}
+    selected = [by_name[program.strip().lower()] for program in programs if program.strip().lower() in by_name]
+    return selected or list(PROGRAMS)
+
+
+def search_duke_programs(query: str, programs: List[str] = None, top_k: int = PASSAGES_PER_PROGRAM) -> Dict:
+    """
+    Search the MEM, Pratt and AIPI corpora concurrently.
+
+    Args:
+        query (str): The user's question.
+        programs (List[str]): Any of "MEM", "Pratt", "AIPI"; all three when omitted.
+        top_k (int): Passages taken from each program before merging.
+
+    Returns:
+        Dict: {"query", "passages": [{"program", "source", "reference", "text"}, ...] best first
+        within PASSAGE_TOKEN_BUDGET,
+        "errors": {program: message}} for programs whose search failed.
+    """
+    programs = _normalize_programs(programs)
+
+    # All three corpora are embedded with the same model, so one embedding serves every index
+    query_embedding = get_embeddings_model().embed_query(query)
+
+    results, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=len(programs), thread_name_prefix="federated") as executor:
+        futures = {
+            program: executor.submit(copy_context().run, _retrieve_program, program, query, query_embedding, top_k)
+            for program in programs
+        }
+        for program, future in futures.items():
+            try:
+                results[program] = future.result()
+            except Exception as e:
+                print(f"Federated search failed for {program}: {e}")
+                errors[program] = str(e)
+
+    # Scores from different indexes are not comparable; fuse by rank instead
+    passages = {}
+    rankings = []
+    for program, program_passages in results.items():
+        ranking = []
+        for rank, passage in enumerate(program_passages):
+            key = f"{program}:{rank}"
+            passages[key] = passage
+            ranking.append(key)
+        rankings.append(ranking)
+
+    # Drop repeated chunks and keep the bundle within the passage token budget
+    result = passage_result(query, [passages[key] for key, _ in reciprocal_rank_fusion(rankings)])
+    result["errors"] = errors
+    return result
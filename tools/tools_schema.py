@@ -33,6 +33,28 @@ TOOLS_SCHEMA = [
             }
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "search_duke_programs",
+            "description": "Search the MEM handbook, the Pratt School of Engineering bulletin and the AIPI program website at the same time and get back matching passages labeled with their program and source. Use it for questions that span or compare several programs (e.g., 'How do the MEM and AIPI capstone projects differ?') instead of calling mem_search, pratt_search and get_AIPI_details one after another.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "The search query"
+                    },
+                    "programs": {
+                        "type": "array",
+                        "items": {"type": "string", "enum": ["MEM", "Pratt", "AIPI"]},
+                        "description": "Programs to search; all three when omitted"
+                    }
+                },
+                "required": ["query"]
+            }
+        }
+    },
     {
         "type": "function",
         "function": {
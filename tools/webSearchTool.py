@@ -1,45 +1,71 @@
 import requests
+import httpx
+import asyncio
 import os
 from bs4 import BeautifulSoup
 from readability import Document
+from utils.tracing import span, url_for_trace
+
+HEADERS = {"User-Agent": "Mozilla/5.0"}
+NUM_RESULTS = 3
+
+def _extract_page_content(url, html):
+    """Extracts clean text content and the title from a page's HTML."""
+    doc = Document(html)
+    soup = BeautifulSoup(doc.summary(), "html.parser")
+    extracted = soup.get_text()
+
+    return {
+        "title": doc.title(),
+        "content": extracted.strip(),
+        "restricted": "NO",
+        "url": url
+    }
 
 def fetch_page_content(url):
     """Scrapes the given URL and extracts clean text content along with metadata."""
-    headers = {"User-Agent": "Mozilla/5.0"} 
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        with span("http.get", url=url_for_trace(url)) as record:
+            response = requests.get(url, headers=HEADERS, timeout=10)
+            record["status"] = response.status_code
+            record["response_bytes"] = len(response.content)
         response.raise_for_status()
+        return _extract_page_content(url, response.text)
 
-        doc = Document(response.text)
-        soup = BeautifulSoup(doc.summary(), "html.parser")
-        extracted = soup.get_text()
+    except requests.exceptions.RequestException as e:
+        return {"title" : "", "content": str(e), "restricted" : "YES", "url": url}
 
-        return {
-            "title": Document(response.text).title(),
-            "content": extracted.strip(),
-            "restricted": "NO",
-            "url": url
-        }
+async def afetch_page_content(client, url):
+    """Async version of fetch_page_content using a shared httpx client."""
+    try:
+        with span("http.get", url=url_for_trace(url)) as record:
+            response = await client.get(url, headers=HEADERS, timeout=10)
+            record["status"] = response.status_code
+            record["response_bytes"] = len(response.content)
+        response.raise_for_status()
+        return _extract_page_content(url, response.text)
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         return {"title" : "", "content": str(e), "restricted" : "YES", "url": url}
-    
-def web_search(query):
-    """Fetches top search results for a given query."""
 
-    num_results = 3
+def _search_url(query):
     API_KEY = os.getenv("GOOGLE_API_KEY")
     SEARCH_ENGINE_ID = os.getenv("GOOGLE_SEARCH_ENGINE_ID")
+    return f"https://www.googleapis.com/customsearch/v1?q={query}&key={API_KEY}&cx={SEARCH_ENGINE_ID}"
+
+def _result_urls(results):
+    return [item["link"] for item in results.get("items", [])[:NUM_RESULTS]]
     
-    search_url = f"https://www.googleapis.com/customsearch/v1?q={query}&key={API_KEY}&cx={SEARCH_ENGINE_ID}"
+def web_search(query):
+    """Fetches top search results for a given query."""
 
-    response = requests.get(search_url)
+    with span("http.get", url=url_for_trace(_search_url(query))) as record:
+        response = requests.get(_search_url(query))
+        record["status"] = response.status_code
+        record["response_bytes"] = len(response.content)
     urls = []
     if response.status_code == 200:
-        results = response.json()
-        for item in results.get("items", [])[:num_results]:
-            url = item["link"]
-            urls.append(url)
+        urls = _result_urls(response.json())
     else:
         print("Failed to fetch search results.")
 
@@ -50,6 +76,22 @@ def web_search(query):
 
     return all_content
 
+async def aweb_search(query):
+    """Async version of web_search; the result pages are fetched concurrently."""
+
+    async with httpx.AsyncClient(follow_redirects=True) as client:
+        with span("http.get", url=url_for_trace(_search_url(query))) as record:
+            response = await client.get(_search_url(query))
+            record["status"] = response.status_code
+            record["response_bytes"] = len(response.content)
+        urls = []
+        if response.status_code == 200:
+            urls = _result_urls(response.json())
+        else:
+            print("Failed to fetch search results.")
+
+        return list(await asyncio.gather(*(afetch_page_content(client, url) for url in urls)))
+
 
 if __name__ == "__main__":
     print(web_search("What is the best way to learn about the AIPI program at Duke University?"))
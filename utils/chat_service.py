@@ -0,0 +1,306 @@
+"""
+Headless chat service.
+
+run_chat() runs one chat turn with explicit credentials (via
+request_context) instead of st.session_state, so the agent can run in
+worker threads, other processes and load tests. It yields plain JSON-able
+events:
+
+    {"type": "status", "text": "..."}      progress updates
+    {"type": "delta", "text": "..."}       streamed answer text
+    {"type": "final", "content": "...", "new_messages": [...]}
+
+arun_chat() is the asyncio version: model calls use AsyncOpenAI and the
+HTTP tools run on the event loop, so one process can serve many chats.
+
+The same events are served as newline-delimited JSON over HTTP, either by a
+thread pool running run_chat() or, with --asyncio, by one event loop
+running arun_chat():
+
+    python -m utils.chat_service --port 8600 --workers 8
+    python -m utils.chat_service --port 8600 --asyncio
+
+    POST /chat  {"messages": [...], "api_key": "sk-..."}  ->  NDJSON event stream
+    GET  /health                                           ->  {"status": "ok"}
+    GET  /metrics                                          ->  service_metrics(): endpoints and caches
+
+app.py talks to the service when CHAT_SERVICE_URL is set and calls
+run_chat() in-process otherwise.
+"""
+import argparse
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import requests
+from dotenv import load_dotenv
+
+from utils.function_calling import get_response, aget_response, ContentDelta, semantic_cache
+from utils.history import compact_history
+from utils.openai_client import request_context, close_async_clients
+from utils.resilience import resilience_metrics
+from utils.semantic_cache import standalone_question
+from utils.speculation import speculation_metrics
+from utils.tool_cache import tool_cache
+from utils.tracing import start_trace
+
+load_dotenv()
+
+DEFAULT_PORT = 8600
+DEFAULT_WORKERS = 8
+
+
+def run_chat(messages, api_key, stream=True):
+    """
+    Run one chat turn for messages (system prompt + history + the new user
+    message) and yield events. The final event carries the messages this turn
+    added (tool calls, tool results and the answer) so the caller can store them.
+    """
+    # Decided before compaction, which can drop the turns a follow-up refers to
+    standalone = standalone_question(messages) is not None
+    model_messages = compact_history(messages)
+    compacted_length = len(model_messages)
+    step_timings = []
+
+    with request_context(api_key), start_trace(history_messages=compacted_length) as trace:
+        response = None
+        for status in get_response(model_messages, stream=stream, step_timings=step_timings,
+                                   standalone=standalone):
+            if isinstance(status, ContentDelta):
+                yield {"type": "delta", "text": str(status)}
+            elif isinstance(status, str):
+                yield {"type": "status", "text": status}
+            else:
+                response = status
+                break
+        trace.attributes["steps"] = step_timings
+
+    yield _final_event(model_messages, compacted_length, response)
+
+
+async def arun_chat(messages, api_key):
+    """Async version of run_chat; yields the same events, without answer deltas"""
+    standalone = standalone_question(messages) is not None
+    model_messages = compact_history(messages)
+    compacted_length = len(model_messages)
+    step_timings = []
+
+    with request_context(api_key), start_trace(history_messages=compacted_length) as trace:
+        response = None
+        async for status in aget_response(model_messages, step_timings=step_timings, standalone=standalone):
+            if isinstance(status, str):
+                yield {"type": "status", "text": status}
+            else:
+                response = status
+                break
+        trace.attributes["steps"] = step_timings
+
+    yield _final_event(model_messages, compacted_length, response)
+
+
+def _final_event(model_messages, compacted_length, response):
+    """The final event: the answer and the messages this turn added"""
+    new_messages = model_messages[compacted_length:]
+    content = response.content if response is not None else None
+    if content:
+        new_messages.append({"role": "assistant", "content": content})
+    return {"type": "final", "content": content, "new_messages": new_messages}
+
+
+def service_metrics():
+    """
+    What GET /metrics reports: retries, hedges and breaker state per OpenAI
+    endpoint, speculative prefetch outcomes, and tool and answer cache hit rates
+    """
+    return {
+        "endpoints": resilience_metrics.stats(),
+        "speculation": speculation_metrics.stats(),
+        "tool_cache": tool_cache.stats(),
+        "semantic_cache": semantic_cache.stats()
+    }
+
+
+def stream_remote_chat(service_url, messages, api_key, timeout=180):
+    """Client side of the service: POST a chat turn and yield its events"""
+    response = requests.post(
+        f"{service_url.rstrip('/')}/chat",
+        json={"messages": messages, "api_key": api_key},
+        stream=True,
+        timeout=timeout
+    )
+    response.raise_for_status()
+    for line in response.iter_lines():
+        if line:
+            yield json.loads(line)
+
+
+class ChatRequestHandler(BaseHTTPRequestHandler):
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif self.path == "/metrics":
+            self._send_json(200, service_metrics())
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if self.path != "/chat":
+            self._send_json(404, {"error": "Not found"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length))
+            messages = payload["messages"]
+        except (ValueError, KeyError) as e:
+            self._send_json(400, {"error": f"Invalid request: {e}"})
+            return
+
+        api_key = payload.get("api_key") or os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            self._send_json(400, {"error": "No OpenAI API key provided"})
+            return
+
+        # HTTP/1.0 without Content-Length: the body ends when the connection closes
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        try:
+            for event in run_chat(messages, api_key, stream=payload.get("stream", True)):
+                self.wfile.write((json.dumps(event, default=str) + "\n").encode("utf-8"))
+                self.wfile.flush()
+        except Exception as e:
+            self.wfile.write((json.dumps({"type": "error", "text": str(e)}) + "\n").encode("utf-8"))
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTPServer that handles requests on a fixed-size thread pool"""
+
+    def __init__(self, server_address, handler_class, workers=DEFAULT_WORKERS):
+        super().__init__(server_address, handler_class)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chat-worker")
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self._process_request_in_worker, request, client_address)
+
+    def _process_request_in_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=False)
+
+
+async def _write_json(writer, status, payload):
+    body = json.dumps(payload).encode("utf-8")
+    writer.write(
+        f"HTTP/1.0 {status} {HTTPStatus(status).phrase}\r\n"
+        f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+
+
+async def _handle_async_request(reader, writer):
+    """The HTTP endpoints of ChatRequestHandler, served on the event loop"""
+    try:
+        method, path, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if method == "GET" and path == "/health":
+            await _write_json(writer, 200, {"status": "ok"})
+        elif method == "GET" and path == "/metrics":
+            await _write_json(writer, 200, service_metrics())
+        elif method == "POST" and path == "/chat":
+            try:
+                payload = json.loads(await reader.readexactly(int(headers.get("content-length", 0))))
+                messages = payload["messages"]
+            except (ValueError, KeyError, asyncio.IncompleteReadError) as e:
+                await _write_json(writer, 400, {"error": f"Invalid request: {e}"})
+                return
+
+            api_key = payload.get("api_key") or os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                await _write_json(writer, 400, {"error": "No OpenAI API key provided"})
+                return
+
+            # HTTP/1.0 without Content-Length: the body ends when the connection closes
+            writer.write(b"HTTP/1.0 200 OK\r\nContent-Type: application/x-ndjson\r\n\r\n")
+            try:
+                async for event in arun_chat(messages, api_key):
+                    writer.write((json.dumps(event, default=str) + "\n").encode("utf-8"))
+                    await writer.drain()
+            except Exception as e:
+                writer.write((json.dumps({"type": "error", "text": str(e)}) + "\n").encode("utf-8"))
+        else:
+            await _write_json(writer, 404, {"error": "Not found"})
+    except (ValueError, ConnectionError) as e:
+        print(f"Bad request: {e}")
+    finally:
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+
+async def serve_async(host, port):
+    server = await asyncio.start_server(_handle_async_request, host, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        # The loop's AsyncOpenAI connection pools cannot outlive it
+        await close_async_clients()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the Duke advisor agent over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--asyncio", action="store_true",
+                        help="Serve every chat on one event loop (arun_chat) instead of a thread pool")
+    args = parser.parse_args()
+
+    if args.asyncio:
+        print(f"Chat service listening on http://{args.host}:{args.port} (asyncio)")
+        try:
+            asyncio.run(serve_async(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    server = PooledHTTPServer((args.host, args.port), ChatRequestHandler, workers=args.workers)
+    print(f"Chat service listening on http://{args.host}:{args.port} with {args.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
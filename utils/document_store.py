@@ -0,0 +1,132 @@
+"""
+Local chunk store for reassembling source documents.
+
+The AIPI index stores each scraped page as fixed-size chunks with
+source_file and position metadata. Rebuilding a page used to take one
+filtered vector query per file; ChunkStore keeps every chunk keyed by
+(source_file, position) so a page is a local lookup instead.
+
+A store is saved as one JSON file per index under DOCUMENT_STORE_DIR. Fill it
+while ingesting (random_scripts/createAIPIdb.py does), or copy it from an
+existing index:
+
+    python -m utils.document_store build $PINECONE_INDEX_AIPI --api-key-env PINECONE_API_KEY_AIPI
+"""
+import argparse
+import json
+import os
+import threading
+
+DOCUMENT_STORE_DIR = os.getenv("DOCUMENT_STORE_DIR", "data/document_store")
+
+_chunk_stores = {}
+_chunk_stores_lock = threading.Lock()
+
+
+class ChunkStore:
+    def __init__(self, path=None):
+        """
+        Args:
+            path (str): JSON file to load from and save to; None keeps the store in memory only.
+        """
+        self.path = path
+        self._documents = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load()
+
+    def add_chunk(self, source_file, position, text):
+        with self._lock:
+            self._documents.setdefault(source_file, {})[int(position)] = text
+
+    def add_matches(self, matches):
+        """Add chunks from vector query matches carrying source_file/position/text metadata"""
+        for match in matches:
+            metadata = match.get("metadata") or {}
+            if "source_file" in metadata and "text" in metadata:
+                self.add_chunk(metadata["source_file"], metadata.get("position", 0), metadata["text"])
+
+    def has_document(self, source_file):
+        with self._lock:
+            return source_file in self._documents
+
+    def chunks(self, source_file):
+        """The document's chunk texts in position order"""
+        with self._lock:
+            chunks = self._documents.get(source_file, {})
+            return [chunks[position] for position in sorted(chunks)]
+
+    def document(self, source_file):
+        """The reassembled document, joined the same way as the original retriever"""
+        return " ".join(self.chunks(source_file)).strip()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._documents)
+
+    def save(self, path=None):
+        path = path or self.path
+        if not path:
+            raise ValueError("No path to save the chunk store to")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock:
+            payload = {
+                source_file: [[position, text] for position, text in sorted(chunks.items())]
+                for source_file, chunks in self._documents.items()
+            }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+
+    def load(self, path=None):
+        path = path or self.path
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        with self._lock:
+            self._documents = {
+                source_file: {int(position): text for position, text in chunks}
+                for source_file, chunks in payload.items()
+            }
+
+
+def get_chunk_store(index_name):
+    """Shared ChunkStore for index_name, persisted under DOCUMENT_STORE_DIR"""
+    with _chunk_stores_lock:
+        if index_name not in _chunk_stores:
+            _chunk_stores[index_name] = ChunkStore(os.path.join(DOCUMENT_STORE_DIR, f"{index_name}.json"))
+        return _chunk_stores[index_name]
+
+
+def build_from_index(index, store, namespace="", batch_size=100):
+    """Copy every chunk of an index namespace into store by listing and fetching ids"""
+    copied = 0
+    for ids in index.list(namespace=namespace):
+        for start in range(0, len(ids), batch_size):
+            response = index.fetch(ids=ids[start:start + batch_size], namespace=namespace)
+            store.add_matches({"metadata": vector.metadata} for vector in response.vectors.values())
+            copied += len(response.vectors)
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage local chunk stores")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Copy the chunks of a Pinecone index into the local chunk store")
+    build_parser.add_argument("index_name")
+    build_parser.add_argument("--namespace", default="")
+    build_parser.add_argument("--api-key-env", default="PINECONE_API_KEY",
+                              help="Environment variable holding the Pinecone API key")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from pinecone import Pinecone
+    load_dotenv()
+
+    index = Pinecone(api_key=os.getenv(args.api_key_env)).Index(args.index_name)
+    store = get_chunk_store(args.index_name)
+    copied = build_from_index(index, store, namespace=args.namespace)
+    store.save()
+    print(f"Copied {copied} chunks from {len(store)} documents to {store.path}")
+
+
+if __name__ == "__main__":
+    main()
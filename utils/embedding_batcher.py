@@ -0,0 +1,165 @@
+"""
+Micro-batching embedding coalescer.
+
+Query-time embedding calls send one text each. Under concurrent load, the
+EmbeddingBatcher collects texts from many callers for a few milliseconds,
+or up to max_batch_size texts, sends them in one embeddings request and
+hands each caller its own vector back through a Future. Each text is queued
+with the client to embed it with; texts for different clients (API keys)
+in one batch go out as separate requests, so the batcher holds no client
+beyond the batch in flight. Requests are sent from a small pool, so a slow
+request or a retry backoff does not hold up the next batch or other clients.
+
+Texts over the per-input token limit are not sent whole: split_input cuts
+them into pieces, which callers embed and combine (see utils.embeddings).
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from utils.history import count_tokens, split_to_tokens, truncate_to_tokens
+
+MAX_BATCH_SIZE = 64
+MAX_WAIT_MS = 5
+# Embeddings requests one batcher keeps in flight at once
+MAX_CONCURRENT_REQUESTS = 4
+# Limits of the embeddings endpoint: tokens per input and per request
+MAX_TOKENS_PER_INPUT = 8191
+MAX_TOKENS_PER_REQUEST = 300000
+# Size of the pieces an over-long input is split into; below the limit
+# because count_tokens uses a different tokenizer than the embedding models
+SPLIT_TOKENS = 7000
+
+
+def split_input(text, max_tokens=SPLIT_TOKENS):
+    """text as pieces the endpoint accepts; more than one only for over-long texts"""
+    pieces = split_to_tokens(text, max_tokens)
+    if len(pieces) > 1:
+        print(f"⚠️ Text of ~{count_tokens(text)} tokens is over the embedding input limit; "
+              f"embedding it in {len(pieces)} pieces")
+    return pieces
+
+
+def fit_input(text, max_tokens=SPLIT_TOKENS):
+    """text truncated to what the endpoint accepts, with a warning if it was cut"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    print(f"⚠️ Text of ~{count_tokens(text)} tokens is over the embedding input limit; embedding its start only")
+    return truncate_to_tokens(text, max_tokens)
+
+
+def token_limited_batches(texts, max_batch_size=MAX_BATCH_SIZE, max_tokens_per_request=MAX_TOKENS_PER_REQUEST):
+    """
+    Split texts into consecutive index batches within the size and token limits;
+    each text must already fit one input (see split_input)
+    """
+    batches, current, current_tokens = [], [], 0
+    for i, text in enumerate(texts):
+        tokens = count_tokens(text)
+        if current and (len(current) >= max_batch_size or current_tokens + tokens > max_tokens_per_request):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+class EmbeddingBatcher:
+    def __init__(self, embed_batch, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS,
+                 max_tokens_per_request=MAX_TOKENS_PER_REQUEST, max_concurrent_requests=MAX_CONCURRENT_REQUESTS):
+        """
+        Args:
+            embed_batch (callable): Takes a client and a list of texts and returns their vectors in order.
+            max_batch_size (int): Most texts sent in one request.
+            max_wait_ms (float): How long the first queued text waits for company.
+            max_tokens_per_request (int): Token budget for one request.
+            max_concurrent_requests (int): Requests in flight at once.
+        """
+        self.embed_batch = embed_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_tokens_per_request = max_tokens_per_request
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.texts = 0
+        self._senders = ThreadPoolExecutor(max_workers=max_concurrent_requests, thread_name_prefix="embedding-request")
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, text, client=None):
+        """
+        Queue one text to embed with client; the returned Future resolves to its
+        vector. An over-long text is truncated; split it first to embed all of it.
+        """
+        future = Future()
+        text = fit_input(text)
+        self._queue.put((text, count_tokens(text), client, future))
+        return future
+
+    def embed(self, text, client=None, timeout=None):
+        return self.submit(text, client).result(timeout=timeout)
+
+    def _collect(self):
+        """Block for the first text, then gather more until a limit is hit"""
+        batch = [self._queue.get()]
+        batch_tokens = batch[0][1]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if batch_tokens + item[1] > self.max_tokens_per_request:
+                # Put it back for the next batch; this one is full
+                self._queue.put(item)
+                break
+            batch.append(item)
+            batch_tokens += item[1]
+        return batch
+
+    def _run(self):
+        while True:
+            # A call of its own, so no client stays referenced while waiting for the next batch
+            self._dispatch(self._collect())
+
+    def _dispatch(self, batch):
+        """One request per client among the batch's texts, sent from the pool"""
+        by_client = {}
+        for text, _, client, future in batch:
+            # Skip callers that cancelled while waiting
+            if future.set_running_or_notify_cancel():
+                by_client.setdefault(id(client), (client, []))[1].append((text, future))
+        for client, active in by_client.values():
+            self._senders.submit(self._send, client, active)
+
+    def _send(self, client, active):
+        texts = [text for text, _ in active]
+        futures = [future for _, future in active]
+        try:
+            vectors = self.embed_batch(client, texts)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        with self._lock:
+            self.requests += 1
+            self.texts += len(texts)
+        for future, vector in zip(futures, vectors):
+            future.set_result(vector)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "texts": self.texts,
+                "texts_per_request": self.texts / self.requests if self.requests else 0.0
+            }
@@ -0,0 +1,211 @@
+"""
+Content-addressed embedding cache.
+
+Embeddings are keyed by (model, dimensions, hash of the normalized text), so
+the same text is only ever embedded once per model, whether it comes from a
+user query or from re-running an ingestion script on unchanged documents.
+
+Two tiers:
+- an in-memory LRU of recent vectors, and
+- an on-disk store per (model, dimensions): records.bin holds one
+  fixed-size record per embedding, its key followed by its float32 vector,
+  and is read through np.memmap. Records are appended under a file lock, so
+  queries and ingestion scripts in other processes can share the store; a
+  record cut short by a crash is truncated the next time the store is
+  opened or written.
+"""
+import hashlib
+import json
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: appends are only serialized within the process
+    fcntl = None
+
+import numpy as np
+
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", ".cache/embeddings")
+MAX_MEMORY_ENTRIES = 4096
+# Length of a hex sha256 key
+KEY_BYTES = 64
+
+
+def normalize_text(text):
+    """Unicode NFC and collapsed whitespace; other differences change the embedding"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def embedding_key(model, dimensions, text):
+    payload = f"{model}|{dimensions or 'native'}|{normalize_text(text)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _DiskStore:
+    """Append-only file of (key, float32 vector) records for one (model, dimensions)"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.records_path = os.path.join(directory, "records.bin")
+        self.meta_path = os.path.join(directory, "meta.json")
+        os.makedirs(directory, exist_ok=True)
+
+        self.dimensions = None
+        self._record = None
+        self.rows = {}
+        self._indexed = 0
+        self._matrix = None
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r") as f:
+                self._set_dimensions(json.load(f)["dimensions"])
+            with self._locked("ab") as f:
+                self._truncate_partial(f)
+            self._refresh()
+
+    def _set_dimensions(self, dimensions):
+        self.dimensions = dimensions
+        # One record holds the key and its vector, so a row can never be read with another row's key
+        self._record = np.dtype([("key", f"S{KEY_BYTES}"), ("vector", "<f4", (dimensions,))])
+
+    @contextmanager
+    def _locked(self, mode):
+        """The records file, opened with an exclusive lock against other processes"""
+        with open(self.records_path, mode) as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield f
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _truncate_partial(self, f):
+        """Drop a record cut short by a crash; call with the lock held"""
+        size = os.fstat(f.fileno()).st_size
+        if size % self._record.itemsize:
+            f.truncate(size - size % self._record.itemsize)
+
+    def _complete_rows(self):
+        if not os.path.exists(self.records_path):
+            return 0
+        return os.path.getsize(self.records_path) // self._record.itemsize
+
+    def _refresh(self):
+        """Index the records appended since the last look, by this or another process"""
+        row_count = self._complete_rows()
+        if row_count <= self._indexed:
+            return
+        self._matrix = np.memmap(self.records_path, dtype=self._record, mode="r", shape=(row_count,))
+        # Two processes may both have appended a key; the first record wins
+        for row, key in enumerate(self._matrix["key"][self._indexed:], start=self._indexed):
+            self.rows.setdefault(key.decode("ascii"), row)
+        self._indexed = row_count
+
+    def get(self, key):
+        if self.dimensions is None:
+            return None
+        row = self.rows.get(key)
+        if row is None and self._complete_rows() > self._indexed:
+            self._refresh()
+            row = self.rows.get(key)
+        if row is None:
+            return None
+        return np.array(self._matrix[row]["vector"])
+
+    def put(self, key, vector):
+        if key in self.rows:
+            return
+        if self.dimensions is None:
+            self._set_dimensions(len(vector))
+            with open(self.meta_path, "w") as f:
+                json.dump({"dimensions": self.dimensions}, f)
+        record = np.zeros(1, dtype=self._record)
+        record["key"] = key.encode("ascii")
+        record["vector"] = vector
+        with self._locked("ab") as f:
+            self._truncate_partial(f)
+            f.write(record.tobytes())
+        self._refresh()
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir=EMBEDDING_CACHE_DIR, max_memory_entries=MAX_MEMORY_ENTRIES):
+        """
+        Args:
+            cache_dir (str): Directory for the on-disk tier; empty or None keeps the cache in memory only.
+            max_memory_entries (int): Vectors kept in the in-memory LRU tier.
+        """
+        self.cache_dir = cache_dir
+        self.max_memory_entries = max_memory_entries
+        self._memory = OrderedDict()
+        self._stores = {}
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _store(self, model, dimensions):
+        if not self.cache_dir:
+            return None
+        name = f"{model}-{dimensions or 'native'}".replace("/", "_")
+        if name not in self._stores:
+            self._stores[name] = _DiskStore(os.path.join(self.cache_dir, name))
+        return self._stores[name]
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, model, dimensions, text):
+        """Return the cached float32 vector for text, or None"""
+        key = embedding_key(model, dimensions, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+
+            store = self._store(model, dimensions)
+            vector = store.get(key) if store is not None else None
+            if vector is not None:
+                self._remember(key, vector)
+                self.disk_hits += 1
+                return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, model, dimensions, text, vector):
+        key = embedding_key(model, dimensions, text)
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._remember(key, vector)
+            store = self._store(model, dimensions)
+            if store is not None:
+                try:
+                    store.put(key, vector)
+                except OSError as e:
+                    print(f"Could not write embedding cache to disk: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory)
+            }
+
+
+# Shared by query-time tools and the ingestion scripts
+embedding_cache = EmbeddingCache()
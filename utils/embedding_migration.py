@@ -0,0 +1,152 @@
+"""
+Convert a vector index to another embedding size.
+
+text-embedding-3 models are trained so that the first d values of an
+embedding, re-normalized, are a usable d-dimensional embedding (Matryoshka
+representation learning). An index built at 1536 dimensions can therefore be
+shrunk without calling the API:
+
+    python -m utils.embedding_migration mem-database --dimensions 256
+
+--method reembed embeds each chunk's metadata text again at the new size
+instead. Indexes built with text-embedding-ada-002 need this, because its
+embeddings cannot be truncated. Cached full-size embeddings are still
+shortened locally (see utils.embeddings).
+
+The source is the local copy of the index under VECTOR_STORE_DIR (create it
+with `python -m utils.vector_store sync`). Every namespace is written to the
+local store --target, which defaults to the source (in place). With
+--pinecone the vectors are also uploaded to a new Pinecone index named
+--target, created at the new dimension. Then set EMBEDDING_DIMENSIONS to the
+new size and, for a new index name, point the tools at it (MEM_INDEX_NAME,
+PRATT_INDEX_NAME or PINECONE_INDEX_AIPI).
+"""
+import argparse
+import os
+import shutil
+
+from utils.vector_store import LocalVectorStore, new_local_vector_store, local_store_path, normalize_vectors
+from utils.embeddings import EMBEDDING_MODEL, NATIVE_DIMENSIONS
+from utils.document_store import DOCUMENT_STORE_DIR
+
+METHODS = ("truncate", "reembed")
+# Rows converted and upserted at a time
+MIGRATION_BATCH_SIZE = 1000
+PINECONE_UPSERT_BATCH_SIZE = 100
+
+
+def truncate_vectors(matrix, dimensions):
+    """The first dimensions values of every row, re-normalized"""
+    if dimensions > matrix.shape[1]:
+        raise ValueError(f"Cannot truncate {matrix.shape[1]}-dimension vectors to {dimensions}")
+    return normalize_vectors(matrix[:, :dimensions])
+
+
+def reembed_vectors(metadata, embeddings):
+    """Embed the text stored with each vector again"""
+    texts = [meta.get("text") for meta in metadata]
+    if any(not text for text in texts):
+        raise ValueError("Re-embedding needs the chunk text in every vector's metadata")
+    return normalize_vectors(embeddings.embed_documents(texts))
+
+
+def migrate_store(source, target, dimensions, method="truncate", embeddings=None, remote=None):
+    """
+    Write every namespace of source into target at dimensions, and into the
+    remote (Pinecone) index if given. Returns the number of vectors migrated.
+    """
+    migrated = 0
+    for namespace in source.describe_index_stats()["namespaces"]:
+        store = source.get_namespace(namespace)
+        for start in range(0, len(store.ids), MIGRATION_BATCH_SIZE):
+            ids = store.ids[start:start + MIGRATION_BATCH_SIZE]
+            metadata = store.metadata[start:start + MIGRATION_BATCH_SIZE]
+            if method == "truncate":
+                vectors = truncate_vectors(store.matrix[start:start + MIGRATION_BATCH_SIZE], dimensions)
+            else:
+                vectors = reembed_vectors(metadata, embeddings)
+            if vectors.shape[1] != dimensions:
+                raise ValueError(f"Embeddings have {vectors.shape[1]} dimensions, expected {dimensions}")
+
+            target.upsert(list(zip(ids, vectors, metadata)), namespace=namespace)
+            if remote is not None:
+                for offset in range(0, len(ids), PINECONE_UPSERT_BATCH_SIZE):
+                    remote.upsert(
+                        vectors=[
+                            {"id": vector_id, "values": values.tolist(), "metadata": meta}
+                            for vector_id, values, meta in zip(
+                                ids[offset:offset + PINECONE_UPSERT_BATCH_SIZE],
+                                vectors[offset:offset + PINECONE_UPSERT_BATCH_SIZE],
+                                metadata[offset:offset + PINECONE_UPSERT_BATCH_SIZE]
+                            )
+                        ],
+                        namespace=namespace
+                    )
+            migrated += len(ids)
+            print(f"Migrated {migrated} vectors ({namespace or 'default namespace'})")
+    return migrated
+
+
+def copy_chunk_store(source_name, target_name):
+    """Give the target index the source's chunk store, so AIPI pages still reassemble locally"""
+    source_path = os.path.join(DOCUMENT_STORE_DIR, f"{source_name}.json")
+    if source_name != target_name and os.path.exists(source_path):
+        shutil.copyfile(source_path, os.path.join(DOCUMENT_STORE_DIR, f"{target_name}.json"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a vector index to another embedding size")
+    parser.add_argument("index_name", help="Local copy of the index to convert")
+    parser.add_argument("--dimensions", type=int, required=True, help="New embedding size, e.g. 256 or 512")
+    parser.add_argument("--method", choices=METHODS, default="truncate")
+    parser.add_argument("--model", default=EMBEDDING_MODEL,
+                        help="Model the index was built with (truncate) or to embed with (reembed)")
+    parser.add_argument("--target", help="Index to write; defaults to converting index_name in place")
+    parser.add_argument("--pinecone", action="store_true", help="Also upload to a new Pinecone index named --target")
+    parser.add_argument("--api-key-env", default="PINECONE_API_KEY",
+                        help="Environment variable holding the Pinecone API key")
+    args = parser.parse_args()
+
+    target_name = args.target or args.index_name
+    if args.pinecone and target_name == args.index_name:
+        parser.error("A Pinecone index's dimension cannot change; pass --target with a new index name")
+    if args.method == "truncate" and not args.model.startswith("text-embedding-3"):
+        parser.error(f"{args.model} embeddings cannot be truncated; use --method reembed")
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    source_path = local_store_path(args.index_name)
+    if not os.path.exists(os.path.join(source_path, "index.json")):
+        parser.error(f"No local copy of {args.index_name}; run python -m utils.vector_store sync first")
+    source = LocalVectorStore(source_path)
+    print(f"Converting {source.describe_index_stats()['total_vector_count']} vectors of {args.index_name} "
+          f"from {source.dimension} to {args.dimensions} dimensions ({args.method})")
+
+    embeddings = None
+    if args.method == "reembed":
+        from utils.openai_client import get_openai_client
+        from utils.embeddings import CachedEmbeddings
+        embeddings = CachedEmbeddings(get_openai_client(os.getenv("OPENAI_API_KEY")), args.model, args.dimensions)
+
+    remote = None
+    if args.pinecone:
+        from utils.pinecone_utils import get_index_handle
+        remote = get_index_handle(target_name, args.dimensions, api_key=os.getenv(args.api_key_env))
+
+    # Built in memory and saved at the end, so an in-place conversion reads the old vectors throughout
+    target = new_local_vector_store(dimension=args.dimensions)
+    migrate_store(source, target, args.dimensions, args.method, embeddings, remote)
+    target.embedding = {
+        "model": args.model,
+        "dimensions": None if args.dimensions == NATIVE_DIMENSIONS.get(args.model) else args.dimensions,
+        "migrated_from": source.dimension,
+        "method": args.method
+    }
+    target.save(local_store_path(target_name))
+    copy_chunk_store(args.index_name, target_name)
+    print(f"Saved {target_name} to {local_store_path(target_name)}. Set EMBEDDING_DIMENSIONS={args.dimensions}.")
+
+
+if __name__ == "__main__":
+    main()
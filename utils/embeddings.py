@@ -0,0 +1,172 @@
+"""
+Embedding entry point shared by query-time tools and ingestion scripts.
+
+CachedEmbeddings has the same embed_query / embed_documents interface as
+langchain's OpenAIEmbeddings, but checks the content-addressed
+embedding_cache first and only sends the misses to the OpenAI API. A few
+misses (the query-time case) go through a shared EmbeddingBatcher so
+concurrent callers share requests; bulk misses (ingestion) are sent
+directly in token-limited batches.
+
+text-embedding-3 models can return shortened (Matryoshka) embeddings: the
+first d values of a full embedding, re-normalized. EMBEDDING_DIMENSIONS
+(e.g. 256 or 512) sets that size for the tools and the ingestion scripts;
+every index must be built at the same size (see utils.embedding_migration).
+Shortened embeddings are also derived from cached full-size ones without an
+API call.
+
+A text over the endpoint's per-input token limit is embedded in pieces and
+its embedding is the token-weighted average of theirs, re-normalized, as
+langchain's OpenAIEmbeddings does, so one long page never fails a batch.
+"""
+import os
+import threading
+
+import numpy as np
+
+from utils.embedding_cache import embedding_cache, embedding_key
+from utils.embedding_batcher import EmbeddingBatcher, token_limited_batches, split_input
+from utils.history import count_tokens
+from utils.resilience import call_with_resilience
+from utils.tracing import span
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Full output size of each embedding model
+NATIVE_DIMENSIONS = {"text-embedding-3-small": 1536, "text-embedding-3-large": 3072, "text-embedding-ada-002": 1536}
+# Shortened output size for text-embedding-3 models; unset keeps the full size
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0")) or None
+
+# The embeddings endpoint accepts at most 2048 inputs per request
+MAX_INPUTS_PER_REQUEST = 2048
+
+# Calls with at most this many cache misses are coalesced with other callers
+COALESCE_MAX_TEXTS = 8
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+def embedding_dimension(model=EMBEDDING_MODEL, dimensions=EMBEDDING_DIMENSIONS):
+    """Vector size an index needs for model's embeddings at the configured output size"""
+    return dimensions or NATIVE_DIMENSIONS[model]
+
+
+def shorten_embedding(vector, dimensions):
+    """The first dimensions values of an embedding, re-normalized"""
+    vector = np.asarray(vector, dtype=np.float32)[:dimensions]
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _request_embeddings(client, model, dimensions, texts):
+    """One embeddings API request; returns (vectors, prompt_tokens)"""
+    kwargs = {"input": texts, "model": model}
+    if dimensions:
+        kwargs["dimensions"] = dimensions
+    response = call_with_resilience(f"embeddings:{model}", lambda: client.embeddings.create(**kwargs))
+    return [item.embedding for item in response.data], response.usage.prompt_tokens
+
+
+def combine_piece_embeddings(vectors, weights):
+    """One embedding for a text embedded in pieces: their weighted average, re-normalized"""
+    if len(vectors) == 1:
+        return vectors[0]
+    average = np.average(np.asarray(vectors, dtype=np.float32), axis=0, weights=weights)
+    norm = np.linalg.norm(average)
+    return average / norm if norm else average
+
+
+def get_batcher(model=EMBEDDING_MODEL, dimensions=None):
+    """Shared batcher for one model and output size; callers pass their client with each text"""
+    key = (model, dimensions)
+    with _batchers_lock:
+        if key not in _batchers:
+            _batchers[key] = EmbeddingBatcher(
+                lambda client, texts: _request_embeddings(client, model, dimensions, texts)[0]
+            )
+        return _batchers[key]
+
+
+def embed_texts(texts, client, model=EMBEDDING_MODEL, dimensions=None, cache=embedding_cache, coalesce=True):
+    """
+    Embed texts with client (an OpenAI client), using the cache where possible.
+    With coalesce=True, small lookups share requests with concurrent callers.
+
+    Returns:
+        List[List[float]]: One embedding per input text, in order.
+    """
+    vectors = [cache.get(model, dimensions, text) for text in texts]
+    if dimensions and model.startswith("text-embedding-3"):
+        # A cached full-size embedding shortens to the same vector the API would return
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                full = cache.get(model, None, texts[i])
+                if full is not None and len(full) > dimensions:
+                    vectors[i] = shorten_embedding(full, dimensions)
+
+    # Texts that normalize to the same key are only sent once
+    missing = {}
+    for i, vector in enumerate(vectors):
+        if vector is None:
+            missing.setdefault(embedding_key(model, dimensions, texts[i]), []).append(i)
+    missing = list(missing.values())
+
+    unique_texts = [texts[indices[0]] for indices in missing]
+
+    # What is sent: each text, or its pieces if it is over the per-input limit
+    pieces, piece_ranges = [], []
+    for text in unique_texts:
+        start = len(pieces)
+        pieces.extend(split_input(text))
+        piece_ranges.append((start, len(pieces)))
+    piece_vectors = [None] * len(pieces)
+
+    with span("embedding", model=model, inputs=len(texts), api_inputs=len(pieces)) as record:
+        if coalesce and 0 < len(pieces) <= COALESCE_MAX_TEXTS:
+            record["coalesced"] = True
+            batcher = get_batcher(model, dimensions)
+            futures = [batcher.submit(piece, client) for piece in pieces]
+            piece_vectors = [future.result() for future in futures]
+        else:
+            for batch in token_limited_batches(pieces, max_batch_size=MAX_INPUTS_PER_REQUEST):
+                batch_vectors, prompt_tokens = _request_embeddings(
+                    client, model, dimensions, [pieces[j] for j in batch]
+                )
+                record["prompt_tokens"] = record.get("prompt_tokens", 0) + prompt_tokens
+                for j, vector in zip(batch, batch_vectors):
+                    piece_vectors[j] = vector
+
+    unique_vectors = [
+        combine_piece_embeddings(piece_vectors[start:end], [count_tokens(piece) or 1 for piece in pieces[start:end]])
+        for start, end in piece_ranges
+    ]
+
+    for indices, text, vector in zip(missing, unique_texts, unique_vectors):
+        cache.put(model, dimensions, text, vector)
+        for i in indices:
+            vectors[i] = vector
+
+    return [list(map(float, vector)) for vector in vectors]
+
+
+class CachedEmbeddings:
+    def __init__(self, client, model=EMBEDDING_MODEL, dimensions=EMBEDDING_DIMENSIONS, cache=embedding_cache):
+        """
+        Args:
+            client: OpenAI client used for cache misses.
+            model (str): Embedding model name.
+            dimensions (int): Shortened output size supported by text-embedding-3 models; None for the full size.
+            cache (EmbeddingCache): Cache to read and fill.
+        """
+        self.client = client
+        self.model = model
+        # Asking for the full size explicitly would split the cache from full-size entries
+        self.dimensions = None if dimensions == NATIVE_DIMENSIONS.get(model) else dimensions
+        self.cache = cache
+
+    def embed_query(self, text):
+        return embed_texts([text], self.client, self.model, self.dimensions, self.cache)[0]
+
+    def embed_documents(self, texts):
+        return embed_texts(list(texts), self.client, self.model, self.dimensions, self.cache)
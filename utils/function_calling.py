@@ -1,19 +1,34 @@
+import asyncio
+import contextvars
 import json
-from utils.openai_client import get_chat_completion
+import os
+import threading
+import time
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from utils.openai_client import get_chat_completion, stream_chat_completion, aget_chat_completion, get_embeddings_model
 from tools.memDatabaseTool import search as mem_search
 from tools.prattDatabaseTool import search as pratt_search
-from tools.curriculumTool import get_courses, get_course_details
-from tools.eventsTool import get_events
+from tools.curriculumTool import get_courses, get_course_details, aget_courses, aget_course_details
+from tools.eventsTool import get_events, aget_events
 from tools.professorsTool import rate_my_professor_info
 from tools.aipiDatabaseTool import get_AIPI_details
-from tools.webSearchTool import web_search
+from tools.programSearchTool import search_duke_programs
+from tools.webSearchTool import web_search, aweb_search
 from tools.tools_schema import TOOLS_SCHEMA
+from utils.tool_cache import tool_cache
+from utils.tracing import span, payload_size
+from utils.semantic_cache import SemanticAnswerCache, HashingEmbedder, standalone_question
+from utils.intent_router import get_intent_router, ROUTER_CONFIDENCE_THRESHOLD
+from utils.speculation import SpeculativePrefetch, SPECULATION_THRESHOLD, SPECULATIVE_TOOLS
 
 def get_tool_function(tool_name: str):
     """Get the actual function implementation for a tool name"""
     tool_functions = {
         "mem_search": mem_search,
         "pratt_search": pratt_search,
+        "search_duke_programs": search_duke_programs,
         "get_courses": get_courses,
         "get_course_details": get_course_details,
         "get_events": get_events,
@@ -24,9 +39,42 @@ def get_tool_function(tool_name: str):
     return tool_functions.get(tool_name) 
 
 
+def get_async_tool_function(tool_name: str):
+    """
+    Get an async implementation for a tool name. Tools doing HTTP have native
+    async versions; the rest (Pinecone, OpenAI SDK, local files) run their
+    sync implementation in a worker thread.
+    """
+    async_tool_functions = {
+        "get_courses": aget_courses,
+        "get_course_details": aget_course_details,
+        "get_events": aget_events,
+        "web_search": aweb_search
+    }
+    if tool_name in async_tool_functions:
+        return async_tool_functions[tool_name]
+
+    function_to_call = get_tool_function(tool_name)
+    if function_to_call is None:
+        return None
+
+    script_ctx = get_script_run_ctx(suppress_warning=True)
+
+    def call_with_script_ctx(function_args):
+        if script_ctx is not None:
+            add_script_run_ctx(ctx=script_ctx)
+        return function_to_call(**function_args)
+
+    async def run_in_thread(**function_args):
+        return await asyncio.to_thread(call_with_script_ctx, function_args)
+
+    return run_in_thread
+
+
 tool_status_messages = {
     "mem_search": "Searching MEM database...",
     "pratt_search": "Searching Pratt database...",
+    "search_duke_programs": "Searching MEM, Pratt and AIPI databases...",
     "get_courses": "Getting courses...",
     "get_course_details": "Getting course details...",
     "get_events": "Getting events...",
@@ -35,58 +83,543 @@ tool_status_messages = {
     "web_search": "Searching the web..."
 }
 
-def get_response(messages, first_call=True):
-    
-    if first_call:
-        yield "Analyzing question..."
-    else:
-        yield "Analyzing whether another tool call is needed..."
-    response_message = get_chat_completion(messages, tools=TOOLS_SCHEMA)
-
-    if response_message.content:
-        yield response_message.content
-    
-    # Check if the model wants to call a function
-    if response_message.tool_calls:
-        # Get the function call
-        tool_call = response_message.tool_calls[0]
+# Seconds each tool may run before its result is replaced with a timeout error
+tool_timeouts = {
+    "mem_search": 30,
+    "pratt_search": 30,
+    "search_duke_programs": 60,
+    "get_courses": 15,
+    "get_course_details": 20,
+    "get_events": 30,
+    "rate_my_professor_info": 5,
+    "get_AIPI_details": 60,
+    "web_search": 45
+}
+DEFAULT_TOOL_TIMEOUT = 30
+MAX_TOOL_WORKERS = 4
+
+# Upper bounds for one user question: model calls and total seconds
+MAX_AGENT_STEPS = 6
+AGENT_DEADLINE_SECONDS = 120
+
+def _embed_question(question):
+    return get_embeddings_model().embed_query(question)
+
+
+# Answers to standalone questions, reused for close paraphrases.
+# SEMANTIC_CACHE_EMBEDDER=local swaps in the offline hashing embedder.
+if os.getenv("SEMANTIC_CACHE_EMBEDDER") == "local":
+    semantic_cache = SemanticAnswerCache(HashingEmbedder().embed_query)
+else:
+    semantic_cache = SemanticAnswerCache(_embed_question)
+
+# Answers built from these tools go stale too quickly to reuse
+UNCACHEABLE_ANSWER_TOOLS = {"get_events"}
+
+
+def _standalone_question(messages, standalone):
+    """
+    The user's question if this turn may use the answer cache and router.
+    standalone is the caller's verdict on the full conversation; compacted
+    messages can look standalone after their earlier turns were dropped.
+    """
+    if standalone is False:
+        return None
+    return standalone_question(messages)
+
+
+def _lookup_cached_answer(question):
+    """
+    Return (question, embedding, cached_answer) for a standalone question.
+    question is None when the conversation does not qualify for the cache.
+    """
+    if question is None:
+        return None, None, None
+
+    with span("semantic_cache.lookup") as record:
+        try:
+            embedding = semantic_cache.embed(question)
+        except Exception as e:
+            print(f"Semantic cache lookup skipped: {e}")
+            return None, None, None
+
+        answer, similarity = semantic_cache.lookup(question, embedding)
+        record["cache_hit"] = answer is not None
+        record["similarity"] = round(similarity, 4)
+    return question, embedding, answer
+
+
+def _remember_answer(question, embedding, response_message, step_timings):
+    if question is None or not response_message.content:
+        return
+    tools_used = {tool for timing in step_timings for tool in timing["tools"]}
+    if tools_used & UNCACHEABLE_ANSWER_TOOLS:
+        return
+    semantic_cache.store(question, response_message.content, embedding)
+
+
+def _cached_answer_message(answer):
+    return SimpleNamespace(role="assistant", content=answer, tool_calls=None)
+
+
+def _router_decision(question):
+    """Ask the local intent router about a standalone question, if there is one"""
+    if question is None:
+        return None
+    with span("router") as record:
+        decision = get_intent_router().route(question)
+        if decision is not None:
+            record["tool"] = decision["tool"]
+            record["confidence"] = round(decision["confidence"], 4)
+    return decision
+
+
+def _routed_tool_call(decision):
+    """Turn a confident router decision into a synthetic tool call"""
+    if decision is None or decision["confidence"] < ROUTER_CONFIDENCE_THRESHOLD:
+        return None
+    return SimpleNamespace(
+        id="router_call_0",
+        type="function",
+        function=SimpleNamespace(name=decision["tool"], arguments=json.dumps(decision["arguments"]))
+    )
+
+
+def _speculation_target(decision):
+    """Return (tool name, arguments) worth prefetching while the model plans, or None"""
+    if decision is None or decision["tool"] not in SPECULATIVE_TOOLS:
+        return None
+    if decision["confidence"] < SPECULATION_THRESHOLD:
+        return None
+    return decision["tool"], decision["arguments"]
+
+
+class ContentDelta(str):
+    """A chunk of streamed answer text, as opposed to a status message"""
+
+
+def new_tool_executor():
+    """
+    Pool for the tool calls of one user question. Each request gets its own,
+    so tool calls never queue behind other conversations or behind timed-out
+    calls that are still running.
+    """
+    return ThreadPoolExecutor(max_workers=MAX_TOOL_WORKERS, thread_name_prefix="tool-call")
+
+
+def _run_tool(script_ctx, function_name, function_args, started):
+    """Run one tool inside a worker thread, keeping access to st.session_state"""
+    started.started_at = time.monotonic()
+    started.set()
+    if script_ctx is not None:
+        add_script_run_ctx(ctx=script_ctx)
+
+    function_to_call = get_tool_function(function_name)
+    if function_to_call is None:
+        return {"error": f"Unknown tool '{function_name}'."}
+
+    with span(f"tool.{function_name}") as record:
+        record["queue_seconds"] = round(started.started_at - started.submitted_at, 4)
+        hit, cached_result = tool_cache.get(function_name, function_args)
+        record["cache_hit"] = hit
+        if hit:
+            record["result_chars"] = payload_size(cached_result)
+            return cached_result
+
+        try:
+            result = function_to_call(**function_args)
+        except Exception as e:
+            record["error"] = str(e)[:200]
+            return {"error": f"Tool '{function_name}' failed: {e}"}
+
+        record["result_chars"] = payload_size(result)
+        tool_cache.set(function_name, function_args, result)
+        return result
+
+
+def _submit_tool(executor, script_ctx, function_name, function_args):
+    """
+    Start a tool on executor; copying the context keeps it inside the current trace.
+    The returned future's started event is set when a worker picks the call up.
+    """
+    started = threading.Event()
+    started.submitted_at = time.monotonic()
+    context = contextvars.copy_context()
+    future = executor.submit(context.run, _run_tool, script_ctx, function_name, function_args, started)
+    future.started = started
+    return future
+
+
+def _tool_result(future, function_name, deadline):
+    """
+    Wait for a submitted tool. Its timeout counts from when it started
+    running; time spent queued for a worker is only bounded by the deadline.
+    Returns (result, seconds spent queued).
+    """
+    timeout = tool_timeouts.get(function_name, DEFAULT_TOOL_TIMEOUT)
+    queue_limit = (deadline or time.monotonic() + AGENT_DEADLINE_SECONDS) - time.monotonic()
+    if not future.started.wait(timeout=max(0, queue_limit)):
+        future.cancel()
+        queued = time.monotonic() - future.started.submitted_at
+        return {"error": f"Tool '{function_name}' could not start before the time limit."}, queued
+
+    queued = future.started.started_at - future.started.submitted_at
+    remaining = future.started.started_at + timeout - time.monotonic()
+    if deadline is not None:
+        remaining = min(remaining, deadline - time.monotonic())
+    try:
+        return future.result(timeout=max(0, remaining)), queued
+    except FutureTimeoutError:
+        return {"error": f"Tool '{function_name}' timed out after {timeout} seconds."}, queued
+
+
+def execute_tool_calls(tool_calls, deadline=None, prefetch=None, executor=None, timing=None):
+    """
+    Run every tool call from one model turn concurrently and return their
+    responses in the same order as the tool calls.
+
+    deadline is an optional time.monotonic() timestamp that caps every
+    per-tool timeout, so the agent loop's overall budget is respected.
+    A matching speculative prefetch is consumed instead of running the tool again.
+    executor is the request's tool pool (a temporary one if omitted). If
+    timing is a dict, the seconds tools spent queued for a worker are added
+    to its "tool_queue_seconds".
+    """
+    own_executor = executor is None
+    if own_executor:
+        executor = new_tool_executor()
+    script_ctx = get_script_run_ctx(suppress_warning=True)
+
+    futures = []
+    for tool_call in tool_calls:
+        try:
+            function_args = json.loads(tool_call.function.arguments or "{}")
+        except json.JSONDecodeError as e:
+            futures.append({"error": f"Invalid arguments for '{tool_call.function.name}': {e}"})
+            continue
+        prefetched = prefetch.claim(tool_call.function.name, function_args) if prefetch else None
+        futures.append(prefetched or _submit_tool(executor, script_ctx, tool_call.function.name, function_args))
+
+    results = []
+    queued_seconds = 0.0
+    for tool_call, future in zip(tool_calls, futures):
+        if isinstance(future, dict):
+            results.append(future)
+            continue
+        result, queued = _tool_result(future, tool_call.function.name, deadline)
+        results.append(result)
+        queued_seconds += queued
+
+    if own_executor:
+        executor.shutdown(wait=False, cancel_futures=True)
+    if timing is not None:
+        timing["tool_queue_seconds"] = timing.get("tool_queue_seconds", 0.0) + queued_seconds
+    return results
+
+
+async def _arun_tool(function_name, function_args, timeout):
+    function_to_call = get_async_tool_function(function_name)
+    if function_to_call is None:
+        return {"error": f"Unknown tool '{function_name}'."}
+
+    with span(f"tool.{function_name}") as record:
+        hit, cached_result = tool_cache.get(function_name, function_args)
+        record["cache_hit"] = hit
+        if hit:
+            record["result_chars"] = payload_size(cached_result)
+            return cached_result
+
+        try:
+            result = await asyncio.wait_for(function_to_call(**function_args), timeout=timeout)
+        except asyncio.TimeoutError:
+            record["error"] = "timeout"
+            return {"error": f"Tool '{function_name}' timed out after {timeout} seconds."}
+        except Exception as e:
+            record["error"] = str(e)[:200]
+            return {"error": f"Tool '{function_name}' failed: {e}"}
+
+        record["result_chars"] = payload_size(result)
+        tool_cache.set(function_name, function_args, result)
+        return result
+
+
+async def aexecute_tool_calls(tool_calls, deadline=None, prefetch=None):
+    """Async version of execute_tool_calls; all tool calls run on the event loop concurrently"""
+    coroutines = []
+    for tool_call in tool_calls:
         function_name = tool_call.function.name
-        function_args = json.loads(tool_call.function.arguments)
-        
-        yield f"{tool_status_messages[function_name]}..."
-        
-        # Get the function implementation
-        function_to_call = get_tool_function(function_name)
-        
-        # Add the API key to the function call
-        function_response = function_to_call(**function_args)
-
-        # Add the function response to the messages
-        messages.append({
-            "role": "assistant",
-            "content": None,
-            "tool_calls": [{
-                "id": tool_call.id,
-                "type": "function",
-                "function": {
-                    "name": function_name,
-                    "arguments": tool_call.function.arguments
-                }
-            }]
-        })
-        
-        messages.append({
+        try:
+            function_args = json.loads(tool_call.function.arguments or "{}")
+        except json.JSONDecodeError as e:
+            coroutines.append(asyncio.sleep(0, result={"error": f"Invalid arguments for '{function_name}': {e}"}))
+            continue
+
+        prefetched = prefetch.claim(function_name, function_args) if prefetch else None
+        if prefetched is not None:
+            coroutines.append(prefetched)
+            continue
+
+        timeout = tool_timeouts.get(function_name, DEFAULT_TOOL_TIMEOUT)
+        if deadline is not None:
+            timeout = max(0, min(timeout, deadline - time.monotonic()))
+        coroutines.append(_arun_tool(function_name, function_args, timeout))
+
+    return list(await asyncio.gather(*coroutines))
+
+
+def _stream_completion(messages, tools=None, deadline=None):
+    """Drive stream_chat_completion, yielding ContentDelta chunks and then the message"""
+    for item in stream_chat_completion(messages, tools=tools, deadline=deadline):
+        if isinstance(item, str):
+            yield ContentDelta(item)
+        else:
+            yield item
+
+
+def get_response(messages, max_steps=MAX_AGENT_STEPS, deadline_seconds=AGENT_DEADLINE_SECONDS, step_timings=None, stream=False,
+                 use_semantic_cache=True, use_router=True, use_speculation=True, standalone=None):
+    """
+    Agent loop: ask the model, run any tools it requests, and repeat until it
+    answers without tools. Yields status strings and finally the response message.
+
+    The loop is bounded by max_steps model calls and a wall-clock deadline;
+    each model call's timeout is the time left until the deadline. On the
+    last allowed step the model is called without tools so it has to answer
+    with what it has. If step_timings is a list, one record per step is
+    appended with the time spent in the LLM, in tools (and, of that, queued
+    for a worker of the question's tool pool) and on serialization.
+
+    With stream=True the model's text is yielded as ContentDelta chunks while
+    it is generated, before the final response message.
+
+    Standalone questions (no earlier turns) are first looked up in the
+    semantic answer cache; a close enough paraphrase returns its stored answer.
+    When the local intent router is confident about such a question, its tool
+    is dispatched directly and the first (planning) model call is skipped.
+    When it is only fairly sure, its guess is started speculatively alongside
+    the first model call and reused if the model asks for the same thing.
+    Callers passing compacted history set standalone from the full
+    conversation, so a follow-up is never cached or routed.
+    """
+    if step_timings is None:
+        step_timings = []
+
+    deadline = time.monotonic() + deadline_seconds
+
+    standalone_text = _standalone_question(messages, standalone)
+    question, question_embedding = None, None
+    if use_semantic_cache:
+        question, question_embedding, cached_answer = _lookup_cached_answer(standalone_text)
+        if cached_answer is not None:
+            yield "Found an answer to a similar question..."
+            yield _cached_answer_message(cached_answer)
+            return
+
+    decision = _router_decision(standalone_text) if (use_router or use_speculation) and max_steps > 1 else None
+    routed_call = _routed_tool_call(decision) if use_router else None
+
+    # This question's own tool pool, shut down (without waiting for stragglers) when it is answered
+    executor = new_tool_executor()
+    try:
+        prefetch = None
+        speculation_target = _speculation_target(decision) if use_speculation and routed_call is None else None
+        if speculation_target is not None:
+            tool_name, function_args = speculation_target
+            prefetch = SpeculativePrefetch(
+                tool_name, function_args,
+                _submit_tool(executor, get_script_run_ctx(suppress_warning=True), tool_name, function_args)
+            )
+
+        for step in range(1, max_steps + 1):
+            if step == 1:
+                yield "Analyzing question..."
+            else:
+                yield "Analyzing whether another tool call is needed..."
+
+            timing = {"step": step, "llm_seconds": 0.0, "tool_seconds": 0.0, "tool_queue_seconds": 0.0,
+                      "serialization_seconds": 0.0, "tools": []}
+            step_timings.append(timing)
+
+            final_step = step == max_steps or time.monotonic() >= deadline
+
+            tools = None if final_step else TOOLS_SCHEMA
+
+            llm_started = time.perf_counter()
+            if step == 1 and routed_call is not None:
+                timing["router_confidence"] = decision["confidence"]
+                response_message = SimpleNamespace(role="assistant", content=None, tool_calls=[routed_call])
+            elif stream:
+                response_message = None
+                for item in _stream_completion(messages, tools=tools, deadline=deadline):
+                    if isinstance(item, ContentDelta):
+                        if "first_token_seconds" not in timing:
+                            timing["first_token_seconds"] = time.perf_counter() - llm_started
+                        yield item
+                    else:
+                        response_message = item
+            else:
+                response_message = get_chat_completion(messages, tools=tools, deadline=deadline)
+            timing["llm_seconds"] = time.perf_counter() - llm_started
+
+            if prefetch is not None and not (response_message and response_message.tool_calls):
+                timing["speculation"] = "wasted"
+                prefetch.discard()
+                prefetch = None
+
+            if response_message is None:
+                yield "Sorry, the model could not be reached. Please try again."
+                return
+
+            if response_message.content and response_message.tool_calls and not stream:
+                yield response_message.content
+
+            # Check if the model wants to call one or more functions
+            if not response_message.tool_calls:
+                _remember_answer(question, question_embedding, response_message, step_timings)
+                if not stream:
+                    yield "Generating final response..."
+                yield response_message
+                return
+
+            tool_calls = response_message.tool_calls
+            timing["tools"] = [tool_call.function.name for tool_call in tool_calls]
+
+            yield " ".join(tool_status_messages.get(tool_call.function.name, "Calling tool...") for tool_call in tool_calls)
+
+            # Run all requested tools in parallel
+            tool_started = time.perf_counter()
+            function_responses = execute_tool_calls(tool_calls, deadline=deadline, prefetch=prefetch, executor=executor,
+                                                    timing=timing)
+            if prefetch is not None:
+                timing["speculation"] = "hit" if prefetch.claimed else "wasted"
+                prefetch.discard()
+                prefetch = None
+            timing["tool_seconds"] = time.perf_counter() - tool_started
+
+            # Add the function calls and their responses to the messages
+            serialization_started = time.perf_counter()
+            messages.extend(_tool_call_messages(tool_calls, function_responses))
+            timing["serialization_seconds"] = time.perf_counter() - serialization_started
+
+            yield "Tool Calls Completed. Processing the results..."
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _tool_call_messages(tool_calls, function_responses):
+    """Build the assistant tool_calls message and the tool result messages"""
+    tool_messages = [{
+        "role": "assistant",
+        "content": None,
+        "tool_calls": [{
+            "id": tool_call.id,
+            "type": "function",
+            "function": {
+                "name": tool_call.function.name,
+                "arguments": tool_call.function.arguments
+            }
+        } for tool_call in tool_calls]
+    }]
+
+    for tool_call, function_response in zip(tool_calls, function_responses):
+        tool_messages.append({
             "role": "tool",
             "tool_call_id": tool_call.id,
             "content": str(function_response)
         })
-        
-        yield "Tool Call Completed. Processing the results..."
-        
-        for status in get_response(messages, first_call=False):
-            yield status
+    return tool_messages
 
-        return
-    
-    yield "Generating final response..."
-    yield response_message
\ No newline at end of file
+
+async def aget_response(messages, max_steps=MAX_AGENT_STEPS, deadline_seconds=AGENT_DEADLINE_SECONDS, step_timings=None, client=None,
+                        use_semantic_cache=True, use_router=True, use_speculation=True, standalone=None):
+    """
+    Async version of get_response. Model calls go through an AsyncOpenAI
+    client and tools run concurrently on the event loop, so one process can
+    serve many conversations at once. Yields the same items as get_response.
+    """
+    if step_timings is None:
+        step_timings = []
+
+    deadline = time.monotonic() + deadline_seconds
+
+    standalone_text = _standalone_question(messages, standalone)
+    question, question_embedding = None, None
+    if use_semantic_cache:
+        question, question_embedding, cached_answer = await asyncio.to_thread(_lookup_cached_answer, standalone_text)
+        if cached_answer is not None:
+            yield "Found an answer to a similar question..."
+            yield _cached_answer_message(cached_answer)
+            return
+
+    decision = None
+    if (use_router or use_speculation) and max_steps > 1:
+        # The router may embed the question, so it stays off the event loop
+        decision = await asyncio.to_thread(_router_decision, standalone_text)
+    routed_call = _routed_tool_call(decision) if use_router else None
+
+    prefetch = None
+    speculation_target = _speculation_target(decision) if use_speculation and routed_call is None else None
+    if speculation_target is not None:
+        tool_name, function_args = speculation_target
+        timeout = tool_timeouts.get(tool_name, DEFAULT_TOOL_TIMEOUT)
+        prefetch = SpeculativePrefetch(
+            tool_name, function_args,
+            asyncio.create_task(_arun_tool(tool_name, function_args, timeout))
+        )
+
+    for step in range(1, max_steps + 1):
+        if step == 1:
+            yield "Analyzing question..."
+        else:
+            yield "Analyzing whether another tool call is needed..."
+
+        timing = {"step": step, "llm_seconds": 0.0, "tool_seconds": 0.0, "serialization_seconds": 0.0, "tools": []}
+        step_timings.append(timing)
+
+        final_step = step == max_steps or time.monotonic() >= deadline
+        tools = None if final_step else TOOLS_SCHEMA
+
+        llm_started = time.perf_counter()
+        if step == 1 and routed_call is not None:
+            timing["router_confidence"] = decision["confidence"]
+            response_message = SimpleNamespace(role="assistant", content=None, tool_calls=[routed_call])
+        else:
+            response_message = await aget_chat_completion(messages, tools=tools, client=client, deadline=deadline)
+        timing["llm_seconds"] = time.perf_counter() - llm_started
+
+        if prefetch is not None and not (response_message and response_message.tool_calls):
+            timing["speculation"] = "wasted"
+            prefetch.discard()
+            prefetch = None
+
+        if response_message is None:
+            yield "Sorry, the model could not be reached. Please try again."
+            return
+
+        if response_message.content and response_message.tool_calls:
+            yield response_message.content
+
+        if not response_message.tool_calls:
+            _remember_answer(question, question_embedding, response_message, step_timings)
+            yield "Generating final response..."
+            yield response_message
+            return
+
+        tool_calls = response_message.tool_calls
+        timing["tools"] = [tool_call.function.name for tool_call in tool_calls]
+
+        yield " ".join(tool_status_messages.get(tool_call.function.name, "Calling tool...") for tool_call in tool_calls)
+
+        tool_started = time.perf_counter()
+        function_responses = await aexecute_tool_calls(tool_calls, deadline=deadline, prefetch=prefetch)
+        if prefetch is not None:
+            timing["speculation"] = "hit" if prefetch.claimed else "wasted"
+            prefetch.discard()
+            prefetch = None
+        timing["tool_seconds"] = time.perf_counter() - tool_started
+
+        serialization_started = time.perf_counter()
+        messages.extend(_tool_call_messages(tool_calls, function_responses))
+        timing["serialization_seconds"] = time.perf_counter() - serialization_started
+
+        yield "Tool Calls Completed. Processing the results..."
@@ -0,0 +1,140 @@
+"""
+Keeps the conversation sent to the model bounded.
+
+st.session_state.messages grows with every user question, answer and raw
+tool output, and the whole list is resent on every completion. compact_history
+returns a smaller copy: the system prompt and the most recent turns stay
+verbatim and older tool outputs are cut down to a short excerpt. Over the
+token ceiling, the recent turns' tool outputs are cut down too; only then are
+the oldest turns dropped, and the previous answer is always kept.
+"""
+import json
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:
+    # tiktoken is optional; fall back to the usual ~4 characters per token
+    _encoding = None
+
+MAX_HISTORY_TOKENS = 12000
+KEEP_RECENT_TURNS = 3
+MAX_OLD_TOOL_OUTPUT_CHARS = 300
+
+# Per-message overhead the chat format adds on top of the content
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def count_tokens(text):
+    """Count (or estimate) the tokens in a piece of text"""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def truncate_to_tokens(text, max_tokens):
+    """The longest prefix of text that fits in max_tokens"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text)[:max_tokens])
+    return text[:max_tokens * 4]
+
+
+def split_to_tokens(text, max_tokens):
+    """Consecutive pieces of text with at most max_tokens each"""
+    if count_tokens(text) <= max_tokens:
+        return [text]
+    if _encoding is not None:
+        tokens = _encoding.encode(text)
+        return [_encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
+    # count_tokens estimates len // 4 + 1, so leave room for the + 1
+    size = (max_tokens - 1) * 4
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def message_tokens(message):
+    """Tokens used by one chat message, including tool call arguments"""
+    tokens = MESSAGE_OVERHEAD_TOKENS + count_tokens(message.get("content") or "")
+    for tool_call in message.get("tool_calls") or []:
+        tokens += count_tokens(json.dumps(tool_call))
+    return tokens
+
+
+def history_tokens(messages):
+    return sum(message_tokens(message) for message in messages)
+
+
+def _split_turns(messages):
+    """
+    Split messages into the leading system messages and a list of turns.
+    A turn starts at a user message and holds everything up to the next one,
+    so assistant tool calls always stay together with their tool results.
+    """
+    system_messages = []
+    index = 0
+    while index < len(messages) and messages[index].get("role") == "system":
+        system_messages.append(messages[index])
+        index += 1
+
+    turns = []
+    for message in messages[index:]:
+        if message.get("role") == "user" or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return system_messages, turns
+
+
+def _elide_tool_output(message, max_chars):
+    content = message.get("content") or ""
+    if len(content) <= max_chars:
+        return message
+    elided = dict(message)
+    elided["content"] = content[:max_chars] + f"... [{len(content) - max_chars} characters of tool output elided]"
+    return elided
+
+
+def _elide_turn(turn, max_chars):
+    return [_elide_tool_output(message, max_chars) if message.get("role") == "tool" else message for message in turn]
+
+
+def _question_and_answer(turn):
+    """A turn without its tool calls and results: the user message and the final answer"""
+    return [
+        message for message in turn
+        if message.get("role") == "user" or (message.get("role") == "assistant" and not message.get("tool_calls"))
+    ]
+
+
+def compact_history(messages, max_tokens=MAX_HISTORY_TOKENS, keep_recent_turns=KEEP_RECENT_TURNS,
+                    max_old_tool_output_chars=MAX_OLD_TOOL_OUTPUT_CHARS):
+    """
+    Return a compacted copy of messages that fits in max_tokens where possible.
+
+    The input list is not modified. Tool outputs are cut down before any turn
+    is dropped. The latest turn is always kept verbatim, and the answer of the
+    turn before it is always kept, even if they alone are over the ceiling.
+    """
+    system_messages, turns = _split_turns(messages)
+    budget = max_tokens - history_tokens(system_messages)
+
+    cutoff = max(0, len(turns) - keep_recent_turns)
+    turns = [_elide_turn(turn, max_old_tool_output_chars) if position < cutoff else turn
+             for position, turn in enumerate(turns)]
+
+    turn_tokens = [history_tokens(turn) for turn in turns]
+    if sum(turn_tokens) > budget:
+        # Recent tool outputs next; the latest turn is the one being answered
+        turns = [_elide_turn(turn, max_old_tool_output_chars) for turn in turns[:-1]] + turns[-1:]
+        turn_tokens = [history_tokens(turn) for turn in turns]
+
+    while len(turns) > 2 and sum(turn_tokens) > budget:
+        turns.pop(0)
+        turn_tokens.pop(0)
+
+    if len(turns) == 2 and sum(turn_tokens) > budget:
+        turns[0] = _question_and_answer(turns[0])
+
+    return system_messages + [message for turn in turns for message in turn]
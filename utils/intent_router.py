@@ -0,0 +1,222 @@
+"""
+Local intent router that can pick a tool without the planning LLM call.
+
+Every question normally pays one gpt-4o-mini call with the full TOOLS_SCHEMA
+just to choose a tool. Many are obvious ("rating for Eric Fouh", "events
+this Friday"), so the router scores each tool with three cheap signals:
+
+1. keyword rules per tool,
+2. fuzzy matching of professor names and subject codes from the local data,
+3. nearest-centroid similarity over local hashed embeddings, with centroids
+   trained from the tool descriptions and the questions in
+   evaluation/eval_Q_data.csv (weakly labeled by the keyword rules).
+
+route() returns the tool, its arguments and a confidence in [0, 1]. Callers
+dispatch the tool directly when the confidence clears ROUTER_CONFIDENCE_THRESHOLD.
+"""
+import csv
+import json
+import re
+from difflib import get_close_matches
+
+import numpy as np
+
+from tools.tools_schema import TOOLS_SCHEMA
+from utils.semantic_cache import HashingEmbedder
+
+EVAL_QUESTIONS_FILE = "evaluation/eval_Q_data.csv"
+PROFESSORS_FILE = "data/professorsData/duke_professors.json"
+SUBJECTS_FILE = "data/curriculumData/duke_subjects.json"
+
+ROUTER_CONFIDENCE_THRESHOLD = 0.6
+
+KEYWORD_WEIGHT = 0.6
+ENTITY_WEIGHT = 0.6
+CENTROID_WEIGHT = 0.4
+
+KEYWORD_RULES = {
+    "get_events": r"\bevents?\b|\bseminars?\b|\blectures?\b|\bhappening\b|\bthis (week|weekend|monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b",
+    "rate_my_professor_info": r"\bratings?\b|\brate ?my ?prof|\breviews? (of|for)\b|\bis professor\b|\bhow good is\b",
+    "mem_search": r"\bmem\b|\bengineering management\b",
+    "pratt_search": r"\bpratt\b|\bmeng\b|\bmaster of engineering\b|\bbulletin\b",
+    "get_AIPI_details": r"\baipi\b|\bartificial intelligence for product innovation\b",
+    "get_courses": r"\bcourses?\b|\bclasses\b|\bcurriculum\b"
+}
+
+# The router only dispatches tools whose arguments it can fill in reliably
+ROUTABLE_TOOLS = list(KEYWORD_RULES)
+
+# Questions naming more than one of these go to a single search_duke_programs call
+PROGRAM_TOOLS = {"mem_search": "MEM", "pratt_search": "Pratt", "get_AIPI_details": "AIPI"}
+
+
+def _load_json(path, default):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Intent router could not load {path}: {e}")
+        return default
+
+
+def _load_eval_questions(path):
+    try:
+        with open(path, "r", encoding="latin1", newline="") as f:
+            return [row["questions"] for row in csv.DictReader(f) if row.get("questions")]
+    except Exception as e:
+        print(f"Intent router could not load {path}: {e}")
+        return []
+
+
+class IntentRouter:
+    def __init__(self, embedder=None, eval_questions_file=EVAL_QUESTIONS_FILE,
+                 professors_file=PROFESSORS_FILE, subjects_file=SUBJECTS_FILE):
+        self.embedder = embedder or HashingEmbedder()
+        self.keyword_rules = {tool: re.compile(pattern, re.IGNORECASE) for tool, pattern in KEYWORD_RULES.items()}
+
+        professors = _load_json(professors_file, [])
+        self.professor_names = {p["name"].lower(): p["name"] for p in professors if p.get("name")}
+        # Name token -> full names, so fuzzy matching only scans plausible candidates
+        self.professor_tokens = {}
+        for name in self.professor_names:
+            for token in name.split():
+                self.professor_tokens.setdefault(token, set()).add(name)
+
+        subjects = _load_json(subjects_file, {})
+        self.subject_codes = {code.lower(): code for code in subjects}
+
+        self.centroid_tools, self.centroids = self._train_centroids(_load_eval_questions(eval_questions_file))
+
+    def _train_centroids(self, eval_questions):
+        """Average the embeddings of each tool's description and weakly labeled questions"""
+        examples = {tool: [] for tool in ROUTABLE_TOOLS}
+        for tool in TOOLS_SCHEMA:
+            function = tool["function"]
+            if function["name"] in examples:
+                examples[function["name"]].append(function["description"])
+
+        for question in eval_questions:
+            matched = self._keyword_matches(question)
+            if len(matched) == 1:
+                examples[matched[0]].append(question)
+
+        tools, centroids = [], []
+        for tool, texts in examples.items():
+            if not texts:
+                continue
+            centroid = np.mean([self.embedder.embed_query(text) for text in texts], axis=0)
+            norm = np.linalg.norm(centroid)
+            tools.append(tool)
+            centroids.append(centroid / norm if norm else centroid)
+        return tools, np.array(centroids, dtype=np.float32)
+
+    def _keyword_matches(self, question):
+        return [tool for tool, pattern in self.keyword_rules.items() if pattern.search(question)]
+
+    def match_professor(self, question):
+        """Return (name, similarity) for the best professor name found in the question"""
+        words = re.findall(r"[A-Za-z][A-Za-z'.-]*", question)
+        spans = [" ".join(words[i:i + n]).lower() for n in (3, 2) for i in range(len(words) - n + 1)]
+
+        for span in spans:
+            if span in self.professor_names:
+                return self.professor_names[span], 1.0
+
+        candidates = set()
+        for word in words:
+            candidates |= self.professor_tokens.get(word.lower(), set())
+        if not candidates:
+            return None, 0.0
+
+        for span in spans:
+            close = get_close_matches(span, candidates, n=1, cutoff=0.85)
+            if close:
+                return self.professor_names[close[0]], 0.9
+        return None, 0.0
+
+    def match_subject(self, question):
+        """Return a subject code mentioned verbatim in the question, if any"""
+        for word in re.findall(r"[A-Za-z]+", question):
+            code = self.subject_codes.get(word.lower())
+            if code and (word.isupper() or len(word) > 3):
+                return code
+        return None
+
+    def _centroid_probabilities(self, question):
+        if not len(self.centroids):
+            return {}
+        similarities = self.centroids @ self.embedder.embed_query(question)
+        # Softmax with a low temperature turns similarities into a distribution
+        weights = np.exp((similarities - similarities.max()) / 0.05)
+        probabilities = weights / weights.sum()
+        return dict(zip(self.centroid_tools, probabilities.tolist()))
+
+    def _arguments(self, tool, question, professor):
+        if tool == "rate_my_professor_info":
+            # Without a known name the question itself is no professor query; leave it to the model
+            return {"professor_query": professor} if professor else None
+        if tool == "get_courses":
+            subject = self.match_subject(question)
+            return {"subject": subject} if subject else None
+        return {"query": question}
+
+    def route(self, question):
+        """
+        Score every routable tool for the question.
+
+        Returns:
+            Dict: {"tool": name, "arguments": dict, "confidence": float, "scores": dict},
+            or None when no tool scores above zero or its arguments can't be filled.
+        """
+        scores = {tool: 0.0 for tool in ROUTABLE_TOOLS}
+
+        keyword_matches = self._keyword_matches(question)
+        for tool in keyword_matches:
+            scores[tool] += KEYWORD_WEIGHT
+
+        professor, professor_score = self.match_professor(question)
+        if professor:
+            scores["rate_my_professor_info"] += ENTITY_WEIGHT * professor_score
+
+        for tool, probability in self._centroid_probabilities(question).items():
+            scores[tool] += CENTROID_WEIGHT * probability
+
+        programs = [PROGRAM_TOOLS[tool] for tool in keyword_matches if tool in PROGRAM_TOOLS]
+        if len(programs) > 1:
+            # Confident unless another kind of tool (courses, events, ...) also fits
+            other_best = max(score for tool, score in scores.items() if tool not in PROGRAM_TOOLS)
+            return {
+                "tool": "search_duke_programs",
+                "arguments": {"query": question, "programs": programs},
+                "confidence": max(0.0, min(1.0, 1.0 - other_best)),
+                "scores": scores
+            }
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        (best_tool, best_score), (_, second_score) = ranked[0], ranked[1]
+        if best_score <= 0:
+            return None
+
+        arguments = self._arguments(best_tool, question, professor)
+        if arguments is None:
+            return None
+
+        # A close runner-up means the question probably spans several tools
+        confidence = max(0.0, min(1.0, best_score - second_score))
+        return {
+            "tool": best_tool,
+            "arguments": arguments,
+            "confidence": confidence,
+            "scores": scores
+        }
+
+
+_router = None
+
+
+def get_intent_router():
+    """Build the process-wide router on first use"""
+    global _router
+    if _router is None:
+        _router = IntentRouter()
+    return _router
@@ -0,0 +1,218 @@
+"""
+Inverted-file (IVF) approximate nearest-neighbour search for the local
+vector store.
+
+IVFVectorStore behaves exactly like LocalVectorStore (same query / upsert /
+delete interface, filters, namespaces and persistence), but once a namespace
+holds min_train_size vectors it clusters them with spherical k-means into
+nlist lists. A query only scores the vectors in the nprobe lists whose
+centroids are closest to it, so query cost grows with nprobe / nlist of the
+corpus instead of all of it.
+
+Knobs:
+- nprobe (per store, or per query via query(..., nprobe=...)): more lists
+  probed means higher recall and higher latency.
+- nlist: more, smaller lists; defaults to sqrt(vector count).
+
+New vectors are assigned to their nearest existing centroid on insert. The
+lists are re-trained once a namespace has grown RETRAIN_GROWTH times past
+the size it was trained at. Centroids and assignments are saved next to the
+matrix as <namespace>.ivf.npz.
+
+Compare against exact search with `python -m evaluation.ann_benchmark`.
+"""
+import math
+import os
+
+import numpy as np
+
+from utils.vector_store import LocalVectorStore, VectorNamespace, normalize_vectors, append_rows, DEFAULT_NAMESPACE
+
+DEFAULT_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+# Below this many vectors exact search is as fast, so no lists are trained
+MIN_TRAIN_SIZE = 4096
+KMEANS_ITERATIONS = 10
+# k-means runs on a sample of this many vectors per list
+TRAIN_SAMPLE_PER_LIST = 64
+RETRAIN_GROWTH = 4.0
+# Filters matching at most this many rows are searched exactly
+EXACT_FILTER_ROWS = 10000
+# Rows assigned to centroids per matrix product, to bound memory
+ASSIGN_CHUNK_ROWS = 65536
+
+
+def default_nlist(vector_count):
+    return max(1, int(math.sqrt(vector_count)))
+
+
+def assign_to_centroids(matrix, centroids):
+    """Index of the most similar centroid for every row"""
+    assignments = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), ASSIGN_CHUNK_ROWS):
+        chunk = matrix[start:start + ASSIGN_CHUNK_ROWS]
+        assignments[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+def train_centroids(matrix, nlist, iterations=KMEANS_ITERATIONS, seed=0):
+    """Spherical k-means on a sample of the (normalized) rows of matrix"""
+    rng = np.random.default_rng(seed)
+    nlist = min(nlist, len(matrix))
+    sample_size = min(len(matrix), nlist * TRAIN_SAMPLE_PER_LIST)
+    sample = matrix[rng.choice(len(matrix), sample_size, replace=False)]
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = assign_to_centroids(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        counts = np.bincount(assignments, minlength=nlist)
+        # Re-seed empty lists with random sample vectors
+        empty = np.flatnonzero(counts == 0)
+        sums[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+        centroids = normalize_vectors(sums)
+    return centroids
+
+
+class _IVFNamespace(VectorNamespace):
+    def __init__(self, dimension, nlist=None, min_train_size=MIN_TRAIN_SIZE):
+        super().__init__(dimension)
+        self.nlist = nlist
+        self.min_train_size = min_train_size
+        self.centroids = None
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self.trained_size = 0
+        self._lists = None
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def train(self):
+        self.centroids = train_centroids(self.matrix, self.nlist or default_nlist(len(self)))
+        self.assignments = assign_to_centroids(self.matrix, self.centroids)
+        self.trained_size = len(self)
+        self._lists = None
+
+    def _maybe_train(self):
+        if not self.trained:
+            if len(self) >= self.min_train_size:
+                self.train()
+        elif len(self) >= self.trained_size * RETRAIN_GROWTH:
+            self.train()
+
+    def upsert(self, ids, matrix, metadata):
+        count = len(self)
+        super().upsert(ids, matrix, metadata)
+        if self.trained:
+            # Assign new and overwritten rows to their nearest existing centroid
+            rows = np.array([self.positions[vector_id] for vector_id in ids])
+            if (rows < count).any():
+                # Overwritten rows are visible to the published namespace, as for the matrix
+                self.assignments = np.array(self.assignments)
+            self.assignments = append_rows(
+                self.assignments, np.zeros(len(self) - len(self.assignments), dtype=np.int32)
+            )
+            self.assignments[rows] = assign_to_centroids(matrix, self.centroids)
+            self._lists = None
+        self._maybe_train()
+
+    def delete(self, ids):
+        removed = set(ids)
+        keep = np.array([vector_id not in removed for vector_id in self.ids], dtype=bool)
+        super().delete(ids)
+        if self.trained:
+            self.assignments = self.assignments[keep]
+            self._lists = None
+
+    def lists(self):
+        """Row indices of each inverted list, rebuilt after writes"""
+        if self._lists is None:
+            order = np.argsort(self.assignments, kind="stable")
+            counts = np.bincount(self.assignments, minlength=len(self.centroids))
+            self._lists = np.split(order, np.cumsum(counts)[:-1])
+        return self._lists
+
+    def candidate_rows(self, query, mask, top_k, nprobe=DEFAULT_NPROBE, **search_params):
+        if not self.trained:
+            return super().candidate_rows(query, mask, top_k)
+
+        if mask is not None:
+            filtered = np.flatnonzero(mask)
+            # Selective filters (e.g. one source_file) are cheaper to search exactly
+            if len(filtered) <= EXACT_FILTER_ROWS:
+                return filtered
+
+        nprobe = min(nprobe, len(self.centroids))
+        probed = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        lists = self.lists()
+        rows = np.concatenate([lists[i] for i in probed])
+        if mask is not None:
+            rows = rows[mask[rows]]
+
+        if len(rows) < top_k:
+            # Too few vectors near the query pass the filter: fall back to exact search
+            return super().candidate_rows(query, mask, top_k)
+        return rows
+
+
+class IVFVectorStore(LocalVectorStore):
+    index_type = "ivf"
+
+    def __init__(self, path=None, dimension=None, metric="cosine", nprobe=DEFAULT_NPROBE, nlist=None,
+                 min_train_size=MIN_TRAIN_SIZE):
+        """
+        Args:
+            path (str): Directory to persist to; None keeps the store in memory only.
+            dimension (int): Vector size; taken from the saved store or the first upsert if omitted.
+            metric (str): Only "cosine" is supported.
+            nprobe (int): Lists scanned per query unless the query passes its own nprobe.
+            nlist (int): Lists per namespace; defaults to sqrt(vector count) at training time.
+            min_train_size (int): Namespaces smaller than this are searched exactly.
+        """
+        self.nprobe = nprobe
+        self.nlist = nlist
+        self.min_train_size = min_train_size
+        super().__init__(path, dimension, metric)
+
+    def _new_namespace(self, dimension):
+        return _IVFNamespace(dimension, self.nlist, self.min_train_size)
+
+    def query(self, vector, top_k=10, namespace=None, filter=None, include_metadata=True, include_values=False,
+              nprobe=None):
+        return super().query(vector, top_k, namespace, filter, include_metadata, include_values,
+                             nprobe=nprobe or self.nprobe)
+
+    def train(self, namespace=None):
+        """Re-cluster a namespace now, e.g. after a bulk load"""
+        with self._lock:
+            store = self._namespaces.get(namespace or DEFAULT_NAMESPACE)
+            if store is not None and len(store):
+                self._write_namespace(namespace, lambda updated: updated.train())
+
+    def describe_index_stats(self):
+        stats = super().describe_index_stats()
+        with self._lock:
+            for name, store in self._namespaces.items():
+                stats["namespaces"][name]["nlist"] = len(store.centroids) if store.trained else 0
+        return stats
+
+    def _save_namespace(self, store, path, file_name):
+        ivf_path = os.path.join(path, f"{file_name}.ivf.npz")
+        if store.trained:
+            np.savez(ivf_path, centroids=store.centroids, assignments=store.assignments,
+                     trained_size=np.array(store.trained_size))
+        elif os.path.exists(ivf_path):
+            os.remove(ivf_path)
+
+    def _load_namespace(self, store, path, file_name):
+        ivf_path = os.path.join(path, f"{file_name}.ivf.npz")
+        if os.path.exists(ivf_path):
+            with np.load(ivf_path) as saved:
+                if len(saved["assignments"]) == len(store) and saved["centroids"].shape[1] == store.matrix.shape[1]:
+                    store.centroids = saved["centroids"]
+                    store.assignments = saved["assignments"]
+                    store.trained_size = int(saved["trained_size"])
+                    return
+        # Saved by an exact store, or out of date (e.g. migrated to another dimension): cluster from the loaded matrix
+        store._maybe_train()
@@ -0,0 +1,201 @@
+"""
+Hybrid lexical + vector retrieval.
+
+Exact terms such as course numbers ("AIPI 590", "MEM 540") and professor
+names embed poorly, so the search tools also run BM25 over the same chunks
+and merge both rankings with reciprocal rank fusion (RRF):
+
+    score(chunk) = sum over rankings of 1 / (RRF_K + rank)
+
+The BM25 index is built in memory from the vector store's saved records
+(VECTOR_STORE_DIR/<index>/<namespace>.json, written by
+`python -m utils.vector_store sync` or by local ingestion), so it works with
+both the Pinecone and the local backend. Without saved records, or with
+HYBRID_SEARCH=false, hybrid_query is a plain vector query.
+"""
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+
+from utils.tracing import span
+from utils.vector_store import namespace_records_path, load_namespace_records
+
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+# Candidates taken from each ranking before fusion
+HYBRID_CANDIDATES = 20
+RRF_K = 60
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+STOPWORDS = {
+    "a", "an", "the", "of", "for", "in", "on", "at", "to", "is", "are", "was", "what", "which", "who",
+    "how", "do", "does", "about", "and", "or", "me", "tell", "with", "be", "can", "i", "my", "it"
+}
+
+_lexical_indexes = {}
+_lexical_indexes_lock = threading.Lock()
+
+
+def tokenize(text):
+    """
+    Lowercase word tokens, plus a joined token for letter-number pairs so
+    "AIPI 590", "AIPI-590" and "AIPI590" all match each other
+    """
+    words = re.findall(r"[a-z]+|[0-9]+", text.lower())
+    tokens = [word for word in words if word not in STOPWORDS]
+    for first, second in zip(words, words[1:]):
+        if first.isalpha() and second.isdigit():
+            tokens.append(first + second)
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.ids = []
+        self.metadata = []
+        self.lengths = []
+        # term -> (row indices, term frequencies), as lists until the next search
+        self._postings = {}
+        # (postings as arrays, document lengths, average length, document count),
+        # built once per change and published as one tuple
+        self._arrays = None
+        self._lock = threading.Lock()
+
+    def add(self, doc_id, text, metadata=None):
+        row = len(self.ids)
+        self.ids.append(doc_id)
+        self.metadata.append(metadata or {})
+        tokens = tokenize(text or "")
+        self.lengths.append(len(tokens))
+        for term, count in Counter(tokens).items():
+            rows, counts = self._postings.setdefault(term, ([], []))
+            rows.append(row)
+            counts.append(count)
+        with self._lock:
+            self._arrays = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def posting_arrays(self):
+        """The search arrays, built on first use after a change; safe to call from many threads"""
+        arrays = self._arrays
+        if arrays is not None:
+            return arrays
+        with self._lock:
+            if self._arrays is None:
+                postings = {
+                    term: (np.array(rows, dtype=np.int32), np.array(counts, dtype=np.float32))
+                    for term, (rows, counts) in self._postings.items()
+                }
+                lengths = np.array(self.lengths, dtype=np.float32)
+                average_length = float(lengths.mean()) if len(lengths) else 0.0
+                self._arrays = (postings, lengths, average_length, len(lengths))
+            return self._arrays
+
+    def search(self, query, top_k=10):
+        """[(doc_id, bm25 score, metadata)] for the best top_k documents containing a query term"""
+        postings, lengths, average_length, document_count = self.posting_arrays()
+        if not document_count:
+            return []
+
+        scores = np.zeros(document_count, dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term not in postings:
+                continue
+            rows, counts = postings[term]
+            idf = math.log(1 + (document_count - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * lengths[rows] / (average_length or 1))
+            scores[rows] += idf * counts * (self.k1 + 1) / (counts + norm)
+
+        matched = np.flatnonzero(scores)
+        if len(matched) == 0:
+            return []
+        top_k = min(top_k, len(matched))
+        best = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        best = best[np.argsort(-scores[best])]
+        return [(self.ids[row], float(scores[row]), self.metadata[row]) for row in best]
+
+
+def get_lexical_index(index_name, namespace=None):
+    """
+    BM25 index over the saved records of one vector store namespace, rebuilt
+    when the records file changes; None if there are no saved records
+    """
+    path = namespace_records_path(index_name, namespace)
+    try:
+        modified = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    key = (index_name, namespace or "")
+    with _lexical_indexes_lock:
+        cached = _lexical_indexes.get(key)
+        if cached is not None and cached[0] == modified:
+            return cached[1]
+
+        index = BM25Index()
+        ids, metadata = load_namespace_records(index_name, namespace)
+        for doc_id, meta in zip(ids, metadata):
+            index.add(doc_id, meta.get("text", ""), meta)
+        # Built before the index is shared, so the first searches do not race to build it
+        index.posting_arrays()
+        _lexical_indexes[key] = (modified, index)
+        return index
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Fuse ranked id lists; returns [(id, fused score)] best first"""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def hybrid_query(index, index_name, vector, query_text, top_k, namespace=None, filter=None):
+    """
+    Vector query fused with BM25 over the same chunks. Returns the same
+    {"matches": [...]} shape as a vector query; each match's score is its
+    fused RRF score, and vector_score / bm25_score keep the raw scores.
+    """
+    query_kwargs = {"vector": vector, "include_metadata": True}
+    if namespace:
+        query_kwargs["namespace"] = namespace
+    if filter:
+        query_kwargs["filter"] = filter
+
+    lexical = get_lexical_index(index_name, namespace) if HYBRID_SEARCH and not filter else None
+    if lexical is None or len(lexical) == 0:
+        return index.query(top_k=top_k, **query_kwargs)
+
+    vector_results = index.query(top_k=max(top_k, HYBRID_CANDIDATES), **query_kwargs)
+    with span("lexical.query", index=index_name, namespace=namespace) as record:
+        lexical_hits = lexical.search(query_text, top_k=HYBRID_CANDIDATES)
+        record["matches"] = len(lexical_hits)
+
+    matches_by_id = {}
+    for match in vector_results["matches"]:
+        matches_by_id[match["id"]] = {
+            "id": match["id"], "metadata": match.get("metadata") or {}, "vector_score": match["score"]
+        }
+    for doc_id, bm25_score, metadata in lexical_hits:
+        entry = matches_by_id.setdefault(doc_id, {"id": doc_id, "metadata": metadata, "vector_score": None})
+        entry["bm25_score"] = bm25_score
+
+    fused = reciprocal_rank_fusion([
+        [match["id"] for match in vector_results["matches"]],
+        [doc_id for doc_id, _, _ in lexical_hits]
+    ])
+    matches = []
+    for doc_id, score in fused[:top_k]:
+        match = matches_by_id[doc_id]
+        match["score"] = score
+        matches.append(match)
+    return {"matches": matches, "namespace": namespace or ""}
@@ -1,15 +1,172 @@
 from dotenv import load_dotenv
-from openai import OpenAI
-from langchain_openai import OpenAIEmbeddings
+from openai import OpenAI, AsyncOpenAI
+import asyncio
+import httpx
+import threading
 import os
+import time
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from types import SimpleNamespace
 import streamlit as st
+from utils.tracing import span, payload_size, record_usage
+from utils.resilience import call_with_resilience, acall_with_resilience
+from utils.embeddings import CachedEmbeddings
 load_dotenv()
 
+# Explicit per-request credentials for code running outside a Streamlit script
+_request_context = ContextVar("request_context", default=None)
+
+# Connection pool settings for the shared OpenAI clients; the SDK's own
+# retries are disabled because utils.resilience retries with backoff
+
+MAX_CONNECTIONS = 20
+MAX_KEEPALIVE_CONNECTIONS = 10
+KEEPALIVE_EXPIRY_SECONDS = 60
+REQUEST_TIMEOUT_SECONDS = 60
+# Least time a model call gets when the caller's deadline is (nearly) spent,
+# so the final answer after a long tool step still has a chance
+MIN_REQUEST_TIMEOUT_SECONDS = 10
+# Clients unused for this long are dropped from the registry. A dropped sync
+# client closes its connections once nothing else (a request, a retriever,
+# an embeddings model) holds it; async clients are closed on their loop.
+CLIENT_IDLE_SECONDS = 15 * 60
+
+# key -> (client, last used, event loop of an async client)
+_client_registry = {}
+_client_registry_lock = threading.Lock()
+
+def _connection_limits():
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS
+    )
+
+def _close_async_client(client, loop):
+    """Close an async client on its own loop; a closed loop's connections are already gone"""
+    if loop is not None and not loop.is_closed():
+        try:
+            asyncio.run_coroutine_threadsafe(client.close(), loop)
+        except RuntimeError:
+            pass
+
+def _evict_idle_clients(now):
+    """
+    Drop registry entries idle past CLIENT_IDLE_SECONDS, and async clients
+    whose loop has closed; caller holds the lock
+    """
+    for key, (client, last_used, loop) in list(_client_registry.items()):
+        loop_closed = loop is not None and loop.is_closed()
+        if loop_closed or now - last_used > CLIENT_IDLE_SECONDS:
+            del _client_registry[key]
+            if isinstance(client, AsyncOpenAI):
+                _close_async_client(client, loop)
+
+def _registry_client(key, create, loop=None):
+    now = time.monotonic()
+    with _client_registry_lock:
+        _evict_idle_clients(now)
+        entry = _client_registry.get(key)
+        client = entry[0] if entry else create()
+        _client_registry[key] = (client, now, loop)
+        return client
+
+def _create_openai_client(api_key):
+    http_client = httpx.Client(limits=_connection_limits(), timeout=REQUEST_TIMEOUT_SECONDS)
+    client = OpenAI(api_key=api_key, max_retries=0, http_client=http_client)
+    # Closed when the last reference goes, so eviction never closes a client still in use
+    weakref.finalize(client, http_client.close)
+    return client
+
 def get_openai_client(api_key):
-    return OpenAI(api_key=api_key)
+    """
+    Shared, thread-safe OpenAI client for api_key. Clients are reused across
+    sessions and tools so TLS and connection setup are paid once per key.
+    """
+    return _registry_client(("sync", api_key), lambda: _create_openai_client(api_key))
 
-def get_chat_completion(messages, tools=None, tool_choice="auto"):
-    client = st.session_state.client
+def get_async_openai_client(api_key):
+    """
+    Shared AsyncOpenAI client for api_key and the running event loop, since
+    httpx async pools belong to one loop. close_async_clients() closes a
+    loop's clients before it stops; entries of closed loops are dropped.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    return _registry_client(
+        ("async", api_key, id(loop)),
+        lambda: AsyncOpenAI(
+            api_key=api_key,
+            max_retries=0,
+            http_client=httpx.AsyncClient(limits=_connection_limits(), timeout=REQUEST_TIMEOUT_SECONDS)
+        ),
+        loop
+    )
+
+async def close_async_clients():
+    """Close and drop the async clients of the running event loop"""
+    loop = asyncio.get_running_loop()
+    with _client_registry_lock:
+        clients = [
+            _client_registry.pop(key)[0]
+            for key, (_, _, client_loop) in list(_client_registry.items())
+            if client_loop is loop
+        ]
+    for client in clients:
+        await client.close()
+
+@contextmanager
+def request_context(api_key, client=None):
+    """
+    Make api_key (and optionally a prebuilt client) the credentials for every
+    model and embedding call in this block, instead of st.session_state.
+    Worker threads started with a copy of the current context inherit it.
+    """
+    context = SimpleNamespace(api_key=api_key, client=client)
+    token = _request_context.set(context)
+    try:
+        yield context
+    finally:
+        _request_context.reset(token)
+
+def current_api_key():
+    context = _request_context.get()
+    if context is not None:
+        return context.api_key
+    try:
+        return st.session_state.api_key
+    except (AttributeError, KeyError):
+        # Scripts run outside Streamlit use the key from the environment
+        return os.getenv("OPENAI_API_KEY")
+
+def current_client():
+    """The request's prebuilt client, or the shared client for the current key, looked up on each use"""
+    context = _request_context.get()
+    if context is not None and context.client is not None:
+        return context.client
+    return get_openai_client(current_api_key())
+
+def request_timeout(deadline=None):
+    """
+    Timeout for one request attempt: what is left until deadline (a
+    time.monotonic() timestamp), within the minimum and the client default
+    """
+    if deadline is None:
+        return REQUEST_TIMEOUT_SECONDS
+    remaining = deadline - time.monotonic()
+    return min(REQUEST_TIMEOUT_SECONDS, max(MIN_REQUEST_TIMEOUT_SECONDS, remaining))
+
+def get_chat_completion(messages, tools=None, tool_choice="auto", deadline=None):
+    """
+    One chat completion through the resilience layer (retries, hedging,
+    circuit breaker). Each attempt is limited to the time left until deadline.
+    Returns the message, or None if the call failed.
+    """
+    client = current_client()
 
     # Build request kwargs conditionally
     kwargs = {
@@ -23,19 +180,137 @@ def get_chat_completion(messages, tools=None, tool_choice="auto"):
         kwargs["tool_choice"] = tool_choice
 
     try:
-        response = client.chat.completions.create(**kwargs)
+        with span("llm.chat", model=kwargs["model"], request_chars=payload_size(messages)) as record:
+            response = call_with_resilience(
+                f"chat:{kwargs['model']}",
+                lambda: client.chat.completions.create(**kwargs, timeout=request_timeout(deadline)),
+                hedge=True,
+                record=record,
+                deadline=deadline
+            )
+            record_usage(record, response.usage)
+        return response.choices[0].message
+    except Exception as e:
+        print(f"❌ OpenAI API call failed: {e}")
+        return None
+
+async def aget_chat_completion(messages, tools=None, tool_choice="auto", client=None, deadline=None):
+    """Async version of get_chat_completion using an AsyncOpenAI client"""
+    if client is None:
+        client = get_async_openai_client(current_api_key())
+
+    kwargs = {
+        "model": "gpt-4o-mini",
+        "messages": messages,
+        "temperature": 0.1
+    }
+
+    if tools:
+        kwargs["tools"] = tools
+        kwargs["tool_choice"] = tool_choice
+
+    try:
+        with span("llm.chat", model=kwargs["model"], request_chars=payload_size(messages)) as record:
+            response = await acall_with_resilience(
+                f"chat:{kwargs['model']}",
+                lambda: client.chat.completions.create(**kwargs, timeout=request_timeout(deadline)),
+                hedge=True,
+                record=record,
+                deadline=deadline
+            )
+            record_usage(record, response.usage)
         return response.choices[0].message
     except Exception as e:
         print(f"❌ OpenAI API call failed: {e}")
         return None
 
-def get_embeddings_model():
+def stream_chat_completion(messages, tools=None, tool_choice="auto", deadline=None):
     """
-    Creates and returns an OpenAIEmbeddings object using the provided API key
+    Streaming version of get_chat_completion.
+
+    Yields each content delta as a string as soon as it arrives, then yields
+    the assembled message (with content and tool_calls, shaped like the
+    non-streaming message) as the last item, or None if the call failed.
     """
-    api_key = st.session_state.api_key
+    client = current_client()
 
-    return OpenAIEmbeddings(
-        model="text-embedding-3-small",
-        openai_api_key=api_key
+    kwargs = {
+        "model": "gpt-4o-mini",
+        "messages": messages,
+        "temperature": 0.1,
+        "stream": True,
+        "stream_options": {"include_usage": True}
+    }
+
+    if tools:
+        kwargs["tools"] = tools
+        kwargs["tool_choice"] = tool_choice
+
+    content_parts = []
+    tool_calls_by_index = {}
+    started = time.perf_counter()
+
+    try:
+        with span("llm.chat_stream", model=kwargs["model"], request_chars=payload_size(messages)) as record:
+            # Only opening the stream is retried; nothing has been yielded yet
+            # The timeout bounds opening the stream and each wait for a chunk
+            stream = call_with_resilience(
+                f"chat:{kwargs['model']}",
+                lambda: client.chat.completions.create(**kwargs, timeout=request_timeout(deadline)),
+                record=record,
+                deadline=deadline
+            )
+            for chunk in stream:
+                # With include_usage the last chunk has usage and no choices
+                if chunk.usage is not None:
+                    record_usage(record, chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+
+                if delta.content:
+                    if not content_parts:
+                        record["first_token_ms"] = round((time.perf_counter() - started) * 1000, 3)
+                    content_parts.append(delta.content)
+                    yield delta.content
+
+                # Tool calls arrive in fragments keyed by index; stitch them together
+                for tool_call_delta in delta.tool_calls or []:
+                    entry = tool_calls_by_index.setdefault(
+                        tool_call_delta.index, {"id": None, "name": "", "arguments": ""}
+                    )
+                    if tool_call_delta.id:
+                        entry["id"] = tool_call_delta.id
+                    if tool_call_delta.function:
+                        if tool_call_delta.function.name:
+                            entry["name"] += tool_call_delta.function.name
+                        if tool_call_delta.function.arguments:
+                            entry["arguments"] += tool_call_delta.function.arguments
+    except Exception as e:
+        print(f"❌ OpenAI streaming call failed: {e}")
+        yield None
+        return
+
+    tool_calls = [
+        SimpleNamespace(
+            id=entry["id"],
+            type="function",
+            function=SimpleNamespace(name=entry["name"], arguments=entry["arguments"])
+        )
+        for _, entry in sorted(tool_calls_by_index.items())
+    ]
+
+    yield SimpleNamespace(
+        role="assistant",
+        content="".join(content_parts) or None,
+        tool_calls=tool_calls or None
     )
+
+def get_embeddings_model(api_key=None):
+    """
+    Returns an embeddings model (embed_query / embed_documents) for the given
+    or current API key, backed by the shared client and the embedding cache
+    """
+    api_key = api_key or current_api_key()
+
+    return CachedEmbeddings(get_openai_client(api_key), model="text-embedding-3-small")
@@ -0,0 +1,65 @@
+"""
+Raw-passage results for the retrieval tools.
+
+By default mem_search, pratt_search, get_AIPI_details and
+search_duke_programs hand the retrieved chunks straight back to the
+orchestrating model instead of summarizing them with a nested LLM call:
+passages stay in rank order, duplicates (the same chunk text, or a chunk
+contained in a higher-ranked one) are dropped, and the total is trimmed to
+PASSAGE_TOKEN_BUDGET tokens. Set SUMMARIZE_SEARCH_RESULTS=true, or pass
+summarize=True, to get the old summarized answers.
+"""
+import os
+
+from utils.history import count_tokens, truncate_to_tokens
+
+SUMMARIZE_SEARCH_RESULTS = os.getenv("SUMMARIZE_SEARCH_RESULTS", "false").lower() == "true"
+PASSAGE_TOKEN_BUDGET = int(os.getenv("PASSAGE_TOKEN_BUDGET", "3000"))
+# A passage cut shorter than this is left out rather than added as a stub
+MIN_PASSAGE_TOKENS = 50
+
+
+def should_summarize(summarize=None):
+    return SUMMARIZE_SEARCH_RESULTS if summarize is None else summarize
+
+
+def match_passages(matches, program, default_source):
+    """Passages from vector store matches of a page-chunked document (MEM handbook, Pratt bulletin)"""
+    passages = []
+    for match in matches:
+        metadata = match.get("metadata") or {}
+        passages.append({
+            "program": program,
+            "source": metadata.get("source", default_source),
+            "reference": f"page {metadata['page_number']}" if "page_number" in metadata else match["id"],
+            "text": metadata.get("text", "")
+        })
+    return passages
+
+
+def select_passages(passages, max_tokens=PASSAGE_TOKEN_BUDGET):
+    """Drop empty and duplicate passages and trim the rest, in rank order, to max_tokens"""
+    selected, seen_texts = [], []
+    remaining = max_tokens
+    for passage in passages:
+        text = " ".join((passage.get("text") or "").split())
+        key = text.lower()
+        if not key or any(key in seen for seen in seen_texts):
+            continue
+
+        tokens = count_tokens(text)
+        if tokens > remaining:
+            if remaining < MIN_PASSAGE_TOKENS:
+                break
+            text = truncate_to_tokens(text, remaining) + " ..."
+            tokens = remaining
+
+        seen_texts.append(key)
+        selected.append({**passage, "text": text})
+        remaining -= tokens
+    return selected
+
+
+def passage_result(query, passages, max_tokens=PASSAGE_TOKEN_BUDGET):
+    """Tool result handed to the orchestrating model in raw-passage mode"""
+    return {"query": query, "passages": select_passages(passages, max_tokens)}
@@ -1,25 +1,48 @@
 import os
+import socket
+import threading
 from dotenv import load_dotenv
+from urllib3 import exceptions as urllib3_exceptions
 from pinecone import Pinecone, ServerlessSpec
 import math
 from typing import List
 import PyPDF2
 from utils.openai_client import get_embeddings_model
+from utils.vector_store import open_vector_store, use_local_vector_store
 
 # Load API Key
 load_dotenv()
 pinecone_api_key = os.getenv("PINECONE_API_KEY")
-# Initialize Pinecone client
-pc = Pinecone(api_key=pinecone_api_key)
 
+# Data-plane connection pool shared by all queries against one index
+PINECONE_POOL_THREADS = 4
+PINECONE_CONNECTION_POOL_MAXSIZE = 20
+
+_pinecone_clients = {}
+_index_handles = {}
+_handles_lock = threading.Lock()
+
+
+def get_pinecone_client(api_key=None):
+    """Pinecone client per API key, created on first use so local vector stores work without a key"""
+    api_key = api_key or pinecone_api_key
+    with _handles_lock:
+        if api_key not in _pinecone_clients:
+            _pinecone_clients[api_key] = Pinecone(api_key=api_key)
+        return _pinecone_clients[api_key]
+
+
+def _resolve_host(pc, index_name, dimension, metric, db_name, use_cached_host=True):
+    """Host of index_name, creating the index if it does not exist yet"""
+    env_name = f"PINECONE_INDEX_HOST_{db_name}" if db_name else None
+    if use_cached_host and env_name and os.getenv(env_name):
+        return os.environ[env_name]
 
-def initialize_pinecone_index(index_name, dimension, metric, db_name):
-    """
-    Creates or retrieves an existing Pinecone index and returns the index object.
-    """
     existing_indexes = [index["name"] for index in pc.list_indexes()]
     
     if index_name not in existing_indexes:
+        if dimension is None:
+            raise ValueError(f"Pinecone index {index_name} does not exist")
         print(f"Creating new Pinecone index: {index_name}")
         pc.create_index(
             name=index_name,
@@ -33,13 +56,126 @@ def initialize_pinecone_index(index_name, dimension, metric, db_name):
 
     # Get index details and print the host URL
     index_info = pc.describe_index(index_name)
+    if dimension is not None and index_info['dimension'] != dimension:
+        # A Pinecone index's dimension is fixed; EMBEDDING_DIMENSIONS changed since it was built
+        raise ValueError(
+            f"Pinecone index {index_name} holds {index_info['dimension']}-dimension vectors, not {dimension}; "
+            f"migrate it to a new index with python -m utils.embedding_migration"
+        )
     host_url = index_info['host']
-    os.environ[f"PINECONE_INDEX_HOST_{db_name}"] = host_url
+    if env_name:
+        os.environ[env_name] = host_url
 
     print(f"Pinecone index host: {host_url}")
+    return host_url
+
+
+def _needs_new_host(error):
+    """
+    Whether a failed data-plane call points at a stale host: the index is not
+    found there (404), the host does not resolve, or connections to it fail.
+    Throttling (429), server errors and timeouts are passed on as they are,
+    so load never sends extra calls to the control plane.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        status = getattr(error, "status", None)
+        if status is not None:
+            return status == 404
+        if isinstance(error, (urllib3_exceptions.NewConnectionError, urllib3_exceptions.ProtocolError,
+                              socket.gaierror, ConnectionError)):
+            return True
+        if isinstance(error, (urllib3_exceptions.TimeoutError, TimeoutError)):
+            return False
+        # urllib3 wraps the underlying error in MaxRetryError.reason
+        error = getattr(error, "reason", None) or error.__cause__ or error.__context__
+    return False
+
+
+class CachedIndex:
+    """
+    Long-lived handle to one Pinecone index. The host is resolved once and
+    the handle keeps its pooled data-plane connections; if a call fails
+    because the host looks stale (see _needs_new_host), the host is resolved
+    again and the call is retried once. Other errors are raised as they are.
+    """
+
+    def __init__(self, connect):
+        self._connect = connect
+        self._lock = threading.Lock()
+        self._index = connect(use_cached_host=True)
+
+    def refresh(self):
+        with self._lock:
+            self._index = self._connect(use_cached_host=False)
 
-    # Connect to the index
-    return pc.Index(index_name, host=host_url)
+    def _call(self, method, *args, **kwargs):
+        index = self._index
+        try:
+            return getattr(index, method)(*args, **kwargs)
+        except Exception as e:
+            if not _needs_new_host(e):
+                raise
+            print(f"Pinecone {method} failed ({e}); refreshing the index handle")
+            if self._index is index:
+                self.refresh()
+            return getattr(self._index, method)(*args, **kwargs)
+
+    def query(self, *args, **kwargs):
+        return self._call("query", *args, **kwargs)
+
+    def upsert(self, *args, **kwargs):
+        return self._call("upsert", *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._call("delete", *args, **kwargs)
+
+    def fetch(self, *args, **kwargs):
+        return self._call("fetch", *args, **kwargs)
+
+    def describe_index_stats(self, *args, **kwargs):
+        return self._call("describe_index_stats", *args, **kwargs)
+
+    def __getattr__(self, name):
+        # Everything else (e.g. list) goes straight to the current handle
+        return getattr(self._index, name)
+
+
+def get_index_handle(index_name, dimension=None, metric="cosine", db_name=None, api_key=None):
+    """
+    Shared CachedIndex for index_name. The control-plane calls (list_indexes,
+    describe_index) only run the first time, or when a call through the
+    handle finds the host stale; PINECONE_INDEX_HOST_<db_name> skips them entirely.
+    """
+    key = (api_key or pinecone_api_key, index_name)
+    with _handles_lock:
+        handle = _index_handles.get(key)
+    if handle is not None:
+        return handle
+
+    def connect(use_cached_host):
+        pc = get_pinecone_client(api_key)
+        host_url = _resolve_host(pc, index_name, dimension, metric, db_name, use_cached_host)
+        return pc.Index(
+            index_name,
+            host=host_url,
+            pool_threads=PINECONE_POOL_THREADS,
+            connection_pool_maxsize=PINECONE_CONNECTION_POOL_MAXSIZE
+        )
+
+    handle = CachedIndex(connect)
+    with _handles_lock:
+        # Another thread may have connected first; keep a single handle
+        return _index_handles.setdefault(key, handle)
+
+
+def initialize_pinecone_index(index_name, dimension, metric, db_name=None):
+    """
+    Creates or retrieves an existing Pinecone index and returns the index object.
+    The handle is cached, so only the first call per index talks to the control plane.
+    """
+    return get_index_handle(index_name, dimension, metric, db_name)
 
 
 def upsert_vectors(index, vectors, batch_size, namespace=None):
@@ -70,12 +206,10 @@ def process_pdf(pdf_path: str, namespace: str, index_name, dimension, metric, ba
     # Extract text from PDF page by page
     pages = _extract_text_from_pdf(pdf_path)
     
-    # Create embeddings for each page
+    # Create embeddings for all pages; unchanged pages come from the embedding cache
+    page_embeddings = embeddings.embed_documents(pages)
     vectors = []
-    for page_num, page_text in enumerate(pages, start=1):
-        # Split page text into chunks if needed
-       
-        embedding = embeddings.embed_query(page_text)
+    for page_num, (page_text, embedding) in enumerate(zip(pages, page_embeddings), start=1):
         vectors.append({
             'id': f"{namespace}-page{page_num}",
             'values': embedding,
@@ -87,9 +221,11 @@ def process_pdf(pdf_path: str, namespace: str, index_name, dimension, metric, ba
             }
         })
     
-    # Store in Pinecone
-    index = initialize_pinecone_index(index_name, dimension, metric)
+    # Store in Pinecone, or in the local vector store when VECTOR_STORE=local
+    index = open_vector_store(index_name, lambda: initialize_pinecone_index(index_name, dimension, metric), dimension, metric)
     upsert_vectors(index, vectors, batch_size, namespace=namespace)
+    if use_local_vector_store():
+        index.save()
 
 def _extract_text_from_pdf(pdf_path: str) -> List[str]:
     """
@@ -106,10 +242,12 @@ def delete_all_records(index_name: str, dimension: int, metric: str, namespace:
     """
     Deletes all vectors from the specified namespace in the Pinecone index.
     """
-    index = initialize_pinecone_index(index_name, dimension, metric)
+    index = open_vector_store(index_name, lambda: initialize_pinecone_index(index_name, dimension, metric), dimension, metric)
     print(f"Deleting all vectors in namespace: '{namespace}'")
     
     index.delete(delete_all=True, namespace=namespace)
     
+    if use_local_vector_store():
+        index.save()
     print(f"All vectors deleted from namespace '{namespace}'.")
 
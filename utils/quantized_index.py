@@ -0,0 +1,213 @@
+"""
+Quantized vectors for the local vector store.
+
+A 1536-dimension text-embedding-3-small vector is 6 KB as float32.
+QuantizedVectorStore keeps only a compact code per vector in memory:
+
+- int8: each normalized vector scaled to [-127, 127] plus one float scale
+  per row, 4x smaller. Approximate scores are code @ query * scale.
+- binary: one sign bit per dimension, 32x smaller. Approximate scores are
+  the (negated) Hamming distance between the vector's and the query's bits.
+
+A query ranks every row by its code, then rescores the best
+top_k * rescore_factor candidates exactly against the float vectors. Stores
+loaded from disk memory-map the float matrix (<namespace>.npy), so only the
+candidate rows are read and the pages are shared by every worker process on
+the machine. Codes are saved next to the matrix as
+<namespace>.<quantization>.npz.
+
+Writes pull the float matrix of a namespace back into memory until the next
+save() maps it again, so bulk-load first, then save.
+
+Compare recall and latency against exact search with
+`python -m evaluation.quantization_benchmark`.
+"""
+import os
+
+import numpy as np
+
+from utils.vector_store import LocalVectorStore, VectorNamespace, append_rows
+
+QUANTIZATIONS = ("int8", "binary")
+# Candidates rescored with float vectors per requested result; binary codes are coarser
+DEFAULT_RESCORE_FACTORS = {"int8": 4, "binary": 16}
+MIN_RESCORE_CANDIDATES = 20
+# int8 rows converted to float32 per matrix product; small enough to stay in
+# cache, which makes int8 scoring about as fast as float32 at a quarter of the memory
+SCORE_CHUNK_ROWS = 256
+# Rows of a memory-mapped float matrix encoded at a time
+ENCODE_CHUNK_ROWS = 65536
+
+
+def quantize_int8(matrix):
+    """(int8 codes, float32 row scales) for the rows of a normalized matrix"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    peaks = np.abs(matrix).max(axis=1)
+    scales = np.where(peaks == 0, 1, peaks / 127).astype(np.float32)
+    codes = np.rint(matrix / scales[:, None]).astype(np.int8)
+    return codes, scales
+
+
+def quantize_binary(matrix):
+    """Sign bits of every row, packed 8 dimensions per byte"""
+    return np.packbits(np.asarray(matrix) > 0, axis=-1)
+
+
+def int8_scores(codes, scales, query):
+    """Approximate cosine similarity of query with every int8-coded row"""
+    scores = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), SCORE_CHUNK_ROWS):
+        chunk = codes[start:start + SCORE_CHUNK_ROWS]
+        scores[start:start + len(chunk)] = chunk.astype(np.float32) @ query
+    return scores * scales
+
+
+def hamming_distances(codes, query_bits):
+    """Differing bits between query_bits and every packed binary row"""
+    # np.bitwise_count needs NumPy 2 (see requirements.txt)
+    return np.bitwise_count(codes ^ query_bits).sum(axis=1, dtype=np.int32)
+
+
+class _QuantizedNamespace(VectorNamespace):
+    def __init__(self, dimension, quantization, rescore_factor):
+        super().__init__(dimension)
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        self.codes, self.scales = self._encode(self.matrix)
+
+    def _encode(self, matrix):
+        """(codes, scales) for matrix rows; scales is None for binary codes"""
+        if self.quantization == "int8":
+            return quantize_int8(matrix)
+        return quantize_binary(matrix), None
+
+    def encode_all(self):
+        """Re-encode every row, reading a memory-mapped matrix a chunk at a time"""
+        codes, scales = [], []
+        for start in range(0, len(self.matrix), ENCODE_CHUNK_ROWS):
+            chunk_codes, chunk_scales = self._encode(self.matrix[start:start + ENCODE_CHUNK_ROWS])
+            codes.append(chunk_codes)
+            scales.append(chunk_scales)
+        if not codes:
+            self.codes, self.scales = self._encode(self.matrix)
+            return
+        self.codes = np.concatenate(codes)
+        self.scales = np.concatenate(scales) if self.quantization == "int8" else None
+
+    def upsert(self, ids, matrix, metadata):
+        # The first write copies a memory-mapped matrix into memory (see append_rows)
+        count = len(self)
+        super().upsert(ids, matrix, metadata)
+
+        rows = np.array([self.positions[vector_id] for vector_id in ids])
+        codes, scales = self._encode(matrix)
+        if (rows < count).any():
+            # Overwritten rows are visible to the published namespace, as for the matrix
+            self.codes = np.array(self.codes)
+            if self.scales is not None:
+                self.scales = np.array(self.scales)
+        grow = len(self) - len(self.codes)
+        self.codes = append_rows(self.codes, np.zeros((grow, self.codes.shape[1]), dtype=self.codes.dtype))
+        if scales is not None:
+            self.scales = append_rows(self.scales, np.zeros(grow, dtype=np.float32))
+        self.codes[rows] = codes
+        if scales is not None:
+            self.scales[rows] = scales
+
+    def delete(self, ids):
+        removed = set(ids)
+        keep = np.array([vector_id not in removed for vector_id in self.ids], dtype=bool)
+        super().delete(ids)
+        self.codes = self.codes[keep]
+        if self.scales is not None:
+            self.scales = self.scales[keep]
+
+    def approximate_scores(self, query, rows=None):
+        """Scores from the codes alone, higher is better, for rows (all rows if None)"""
+        codes = self.codes if rows is None else self.codes[rows]
+        if self.quantization == "int8":
+            scales = self.scales if rows is None else self.scales[rows]
+            return int8_scores(codes, scales, query)
+        return -hamming_distances(codes, quantize_binary(query))
+
+    def candidate_rows(self, query, mask, top_k, rescore_factor=None, **search_params):
+        rows = None if mask is None else np.flatnonzero(mask)
+        row_count = len(self) if rows is None else len(rows)
+        candidate_count = max(top_k * (rescore_factor or self.rescore_factor), MIN_RESCORE_CANDIDATES)
+        if row_count <= candidate_count:
+            return rows
+
+        scores = self.approximate_scores(query, rows)
+        best = np.argpartition(-scores, candidate_count - 1)[:candidate_count]
+        if rows is not None:
+            best = rows[best]
+        # Ascending rows read the memory-mapped matrix front to back
+        return np.sort(best)
+
+    def codes_shape(self):
+        """Shape of the codes for the current rows"""
+        columns = self.matrix.shape[1] if self.quantization == "int8" else (self.matrix.shape[1] + 7) // 8
+        return len(self), columns
+
+    @property
+    def code_bytes(self):
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+
+class QuantizedVectorStore(LocalVectorStore):
+    mmap_vectors = True
+
+    def __init__(self, path=None, dimension=None, metric="cosine", quantization="int8", rescore_factor=None):
+        """
+        Args:
+            path (str): Directory to persist to; None keeps the store (and its float vectors) in memory only.
+            dimension (int): Vector size; taken from the saved store or the first upsert if omitted.
+            metric (str): Only "cosine" is supported.
+            quantization (str): "int8" or "binary".
+            rescore_factor (int): Candidates rescored per requested result unless the query passes its own.
+        """
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unsupported quantization: {quantization}")
+        self.quantization = quantization
+        self.index_type = quantization
+        self.rescore_factor = rescore_factor or int(
+            os.getenv("QUANTIZED_RESCORE_FACTOR", DEFAULT_RESCORE_FACTORS[quantization])
+        )
+        super().__init__(path, dimension, metric)
+
+    def _new_namespace(self, dimension):
+        return _QuantizedNamespace(dimension, self.quantization, self.rescore_factor)
+
+    def query(self, vector, top_k=10, namespace=None, filter=None, include_metadata=True, include_values=False,
+              rescore_factor=None):
+        return super().query(vector, top_k, namespace, filter, include_metadata, include_values,
+                             rescore_factor=rescore_factor)
+
+    def describe_index_stats(self):
+        stats = super().describe_index_stats()
+        with self._lock:
+            for name, store in self._namespaces.items():
+                stats["namespaces"][name]["quantization"] = self.quantization
+                stats["namespaces"][name]["code_bytes"] = store.code_bytes
+        return stats
+
+    def _save_namespace(self, store, path, file_name):
+        codes = {"codes": store.codes}
+        if store.scales is not None:
+            codes["scales"] = store.scales
+        np.savez(os.path.join(path, f"{file_name}.{self.quantization}.npz"), **codes)
+        if path == self.path:
+            # Swap the in-memory float matrix for a map of the file just written
+            store.matrix = np.load(os.path.join(path, f"{file_name}.npy"), mmap_mode="r")
+
+    def _load_namespace(self, store, path, file_name):
+        codes_path = os.path.join(path, f"{file_name}.{self.quantization}.npz")
+        if os.path.exists(codes_path):
+            with np.load(codes_path) as saved:
+                if saved["codes"].shape == store.codes_shape():
+                    store.codes = saved["codes"]
+                    store.scales = saved["scales"] if "scales" in saved else None
+                    return
+        # Saved by an exact store, with other codes, or out of date (e.g. migrated to another
+        # dimension): encode from the matrix
+        store.encode_all()
@@ -0,0 +1,389 @@
+"""
+Resilient call layer for the OpenAI API.
+
+call_with_resilience() / acall_with_resilience() wrap one API call with:
+- a shared token bucket, so bursts from parallel tools and sessions are
+  smoothed out instead of turning into 429s,
+- a circuit breaker per endpoint (e.g. "chat:gpt-4o-mini"), so a failing
+  endpoint is rejected quickly instead of stalling every request,
+- retries with jittered exponential backoff for 429s, 5xx and connection
+  errors (honouring Retry-After), and
+- optionally a hedged duplicate request when the first one takes longer than
+  the endpoint's observed p95 latency; whichever finishes first wins.
+
+Given a deadline (a time.monotonic() timestamp), no retry or hedge starts
+after it and backoff sleeps end at it.
+
+resilience_metrics.stats() reports calls, retries, hedges and hedges won
+per endpoint.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FutureTimeoutError
+from contextvars import copy_context
+
+import httpx
+import openai
+
+MAX_RETRIES = 3
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 8.0
+
+# Consecutive failures that open a breaker, and how long it stays open
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30.0
+
+# Shared request budget across all sessions in this process
+REQUESTS_PER_SECOND = float(os.getenv("LLM_REQUESTS_PER_SECOND", "8"))
+BURST_REQUESTS = int(os.getenv("LLM_BURST_REQUESTS", "16"))
+
+# Hedge once the first request has run longer than the endpoint's p95
+HEDGING_ENABLED = os.getenv("LLM_HEDGING", "true").lower() == "true"
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY_SECONDS = 1.0
+LATENCY_WINDOW = 200
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the API while an endpoint's breaker is open"""
+
+
+def is_retryable(error):
+    """Rate limits, server errors, timeouts and dropped connections are worth retrying"""
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        # An exhausted quota will not recover by waiting
+        if getattr(error, "code", None) == "insufficient_quota":
+            return False
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+def backoff_delay(attempt, error=None):
+    """Full-jitter exponential backoff; a Retry-After header takes precedence"""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX_SECONDS)
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+class TokenBucket:
+    def __init__(self, rate=REQUESTS_PER_SECOND, capacity=BURST_REQUESTS):
+        """
+        Args:
+            rate (float): Tokens added per second.
+            capacity (int): Most tokens that can accumulate (the burst size).
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens=1):
+        """Take tokens now and return how long the caller must wait before using them"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= tokens
+            return max(0.0, -self.tokens / self.rate)
+
+    def acquire(self, tokens=1):
+        delay = self.reserve(tokens)
+        if delay:
+            time.sleep(delay)
+        return delay
+
+    async def aacquire(self, tokens=1):
+        delay = self.reserve(tokens)
+        if delay:
+            await asyncio.sleep(delay)
+        return delay
+
+
+class CircuitBreaker:
+    """closed -> open after repeated failures -> half-open trial after a cool-down"""
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            # Let a single trial request through once the cool-down has passed
+            if state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_neutral(self):
+        """
+        An attempt that says nothing about endpoint health (e.g. a bad request):
+        the failure count and state stay as they are; a half-open trial slot is freed
+        """
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class LatencyTracker:
+    """Recent successful call latencies for one endpoint"""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def hedge_delay(self):
+        """The p95 latency, or None until there are enough samples to trust it"""
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            samples = sorted(self._samples)
+        return max(HEDGE_MIN_DELAY_SECONDS, samples[int(0.95 * (len(samples) - 1))])
+
+
+class ResilienceMetrics:
+    """Process-wide counters per endpoint"""
+
+    FIELDS = ("calls", "successes", "failures", "retries", "hedges", "hedges_won", "circuit_rejections")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._throttled_seconds = {}
+
+    def incr(self, endpoint, field, amount=1):
+        with self._lock:
+            counters = self._counters.setdefault(endpoint, dict.fromkeys(self.FIELDS, 0))
+            counters[field] += amount
+
+    def add_throttle(self, endpoint, seconds):
+        with self._lock:
+            self._throttled_seconds[endpoint] = self._throttled_seconds.get(endpoint, 0.0) + seconds
+
+    def stats(self):
+        with self._lock:
+            return {
+                endpoint: {
+                    **counters,
+                    "throttled_seconds": round(self._throttled_seconds.get(endpoint, 0.0), 3),
+                    "breaker": _breakers[endpoint].state if endpoint in _breakers else "closed"
+                }
+                for endpoint, counters in self._counters.items()
+            }
+
+
+resilience_metrics = ResilienceMetrics()
+rate_limiter = TokenBucket()
+
+_breakers = {}
+_latencies = {}
+_registry_lock = threading.Lock()
+# Runs the racing requests of hedged sync calls
+_hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+
+
+def _endpoint_state(endpoint):
+    with _registry_lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker()
+            _latencies[endpoint] = LatencyTracker()
+        return _breakers[endpoint], _latencies[endpoint]
+
+
+def _first_success(futures, hedge_future):
+    """Wait for the first future that succeeds; raise the first error if all fail"""
+    pending, first_error = set(futures), None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                for other in pending:
+                    other.cancel()
+                return future.result(), future is hedge_future
+            first_error = first_error or future.exception()
+    raise first_error
+
+
+def _past(deadline):
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def _hedged_call(endpoint, call, hedge_after, deadline=None):
+    """Run call; if it outlasts hedge_after (and the deadline has not passed), race a duplicate against it"""
+    primary = _hedge_pool.submit(copy_context().run, call)
+    try:
+        return primary.result(timeout=hedge_after), False
+    except FutureTimeoutError:
+        pass
+    if _past(deadline):
+        return primary.result(), False
+
+    resilience_metrics.add_throttle(endpoint, rate_limiter.acquire())
+    resilience_metrics.incr(endpoint, "hedges")
+    hedge = _hedge_pool.submit(copy_context().run, call)
+    return _first_success([primary, hedge], hedge)
+
+
+async def _ahedged_call(endpoint, call, hedge_after, deadline=None):
+    """Async version of _hedged_call"""
+    primary = asyncio.ensure_future(call())
+    done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+    if done or _past(deadline):
+        return await primary, False
+
+    resilience_metrics.add_throttle(endpoint, await rate_limiter.aacquire())
+    resilience_metrics.incr(endpoint, "hedges")
+    hedge = asyncio.ensure_future(call())
+    pending, first_error = {primary, hedge}, None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is None:
+                for other in pending:
+                    other.cancel()
+                return task.result(), task is hedge
+            first_error = first_error or task.exception()
+    raise first_error
+
+
+def _before_attempt(endpoint, breaker, record):
+    if not breaker.allow():
+        resilience_metrics.incr(endpoint, "circuit_rejections")
+        record["circuit_open"] = True
+        raise CircuitOpenError(f"Circuit for {endpoint} is open after repeated failures")
+
+
+def _after_failure(endpoint, breaker, error, attempt, record, deadline=None):
+    """Record a failed attempt; returns the backoff delay, or None to give up"""
+    if not is_retryable(error):
+        # Client errors (bad request, auth) say nothing about endpoint health
+        breaker.record_neutral()
+        resilience_metrics.incr(endpoint, "failures")
+        return None
+    breaker.record_failure()
+    if attempt >= MAX_RETRIES or _past(deadline):
+        if _past(deadline):
+            record["deadline_exceeded"] = True
+        resilience_metrics.incr(endpoint, "failures")
+        return None
+    resilience_metrics.incr(endpoint, "retries")
+    record["retries"] = attempt + 1
+    delay = backoff_delay(attempt, error)
+    # The retry starts by the deadline at the latest
+    return delay if deadline is None else max(0.0, min(delay, deadline - time.monotonic()))
+
+
+def _after_success(endpoint, breaker, latencies, started, hedge_won, record):
+    breaker.record_success()
+    latencies.add(time.perf_counter() - started)
+    resilience_metrics.incr(endpoint, "successes")
+    if hedge_won:
+        resilience_metrics.incr(endpoint, "hedges_won")
+        record["hedge_won"] = True
+
+
+def call_with_resilience(endpoint, call, hedge=False, record=None, deadline=None):
+    """
+    Run call() (one API request) with rate limiting, circuit breaking and
+    retries. With hedge=True a slow request is raced against a duplicate.
+    The first attempt always runs; retries and hedges do not start after
+    deadline (a time.monotonic() timestamp), if given.
+    Attempt details are added to record (a tracing span record) if given.
+    Raises the last error, or CircuitOpenError, when the call cannot succeed.
+    """
+    record = record if record is not None else {}
+    breaker, latencies = _endpoint_state(endpoint)
+    resilience_metrics.incr(endpoint, "calls")
+
+    for attempt in range(MAX_RETRIES + 1):
+        _before_attempt(endpoint, breaker, record)
+        resilience_metrics.add_throttle(endpoint, rate_limiter.acquire())
+        hedge_after = latencies.hedge_delay() if hedge and HEDGING_ENABLED else None
+
+        started = time.perf_counter()
+        try:
+            if hedge_after is None:
+                result, hedge_won = call(), False
+            else:
+                result, hedge_won = _hedged_call(endpoint, call, hedge_after, deadline)
+        except Exception as e:
+            delay = _after_failure(endpoint, breaker, e, attempt, record, deadline)
+            if delay is None:
+                raise
+            print(f"⚠️ {endpoint} failed ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+
+        _after_success(endpoint, breaker, latencies, started, hedge_won, record)
+        return result
+
+
+async def acall_with_resilience(endpoint, call, hedge=False, record=None, deadline=None):
+    """Async version of call_with_resilience; call() returns an awaitable"""
+    record = record if record is not None else {}
+    breaker, latencies = _endpoint_state(endpoint)
+    resilience_metrics.incr(endpoint, "calls")
+
+    for attempt in range(MAX_RETRIES + 1):
+        _before_attempt(endpoint, breaker, record)
+        resilience_metrics.add_throttle(endpoint, await rate_limiter.aacquire())
+        hedge_after = latencies.hedge_delay() if hedge and HEDGING_ENABLED else None
+
+        started = time.perf_counter()
+        try:
+            if hedge_after is None:
+                result, hedge_won = await call(), False
+            else:
+                result, hedge_won = await _ahedged_call(endpoint, call, hedge_after, deadline)
+        except Exception as e:
+            delay = _after_failure(endpoint, breaker, e, attempt, record, deadline)
+            if delay is None:
+                raise
+            print(f"⚠️ {endpoint} failed ({e}); retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            continue
+
+        _after_success(endpoint, breaker, latencies, started, hedge_won, record)
+        return result
@@ -0,0 +1,150 @@
+"""
+Semantic answer cache for standalone student questions.
+
+Paraphrases like "what are MEM graduation requirements" and "MEM grad
+requirements?" embed to nearly the same vector, so the answer produced for
+one can be returned for the other without running the LLM -> tool -> LLM
+chain again. Only questions asked without earlier conversation qualify,
+because a follow-up like "what about AIPI?" depends on context the
+embedding does not see.
+"""
+import hashlib
+import re
+import threading
+import time
+
+import numpy as np
+
+SIMILARITY_THRESHOLD = 0.92
+MAX_CACHE_ENTRIES = 512
+CACHE_TTL_SECONDS = 6 * 60 * 60
+
+
+class HashingEmbedder:
+    """
+    Deterministic local embedding stand-in: hashed word and character
+    trigram counts, L2-normalized. Good enough for tests and offline runs,
+    no API key needed.
+    """
+
+    def __init__(self, dimensions=256):
+        self.dimensions = dimensions
+
+    def _features(self, text):
+        words = re.findall(r"[a-z0-9]+", text.lower())
+        features = list(words)
+        for word in words:
+            padded = f"#{word}#"
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def embed_query(self, text):
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature in self._features(text):
+            digest = hashlib.md5(feature.encode("utf-8")).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimensions
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vector[bucket] += sign
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def standalone_question(messages):
+    """
+    Return the user's question if the conversation is just system prompt(s)
+    plus a single user message, otherwise None.
+    """
+    non_system = [message for message in messages if message.get("role") != "system"]
+    if len(non_system) != 1 or non_system[0].get("role") != "user":
+        return None
+    return non_system[0].get("content") or None
+
+
+class SemanticAnswerCache:
+    def __init__(self, embed_fn, threshold=SIMILARITY_THRESHOLD, max_entries=MAX_CACHE_ENTRIES,
+                 ttl_seconds=CACHE_TTL_SECONDS):
+        """
+        Args:
+            embed_fn (callable): Maps a question string to an embedding vector.
+            threshold (float): Minimum cosine similarity for a hit.
+            max_entries (int): Oldest entries are evicted beyond this size.
+            ttl_seconds (float): How long an answer may be served from the cache.
+        """
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._questions = []
+        self._answers = []
+        self._expires_at = []
+        self._matrix = None
+        self.hits = 0
+        self.misses = 0
+
+    def embed(self, question):
+        """Embed and L2-normalize a question with the cache's embed_fn"""
+        vector = np.asarray(self.embed_fn(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _evict(self, keep):
+        self._questions = [self._questions[i] for i in keep]
+        self._answers = [self._answers[i] for i in keep]
+        self._expires_at = [self._expires_at[i] for i in keep]
+        self._matrix = self._matrix[keep] if keep else None
+
+    def lookup(self, question, embedding=None):
+        """
+        Return (answer, similarity) for the closest cached question above the
+        threshold, or (None, best_similarity). Pass embedding to skip re-embedding.
+        """
+        if embedding is None:
+            embedding = self.embed(question)
+
+        with self._lock:
+            now = time.time()
+            expired = [i for i, expires_at in enumerate(self._expires_at) if expires_at <= now]
+            if expired:
+                self._evict([i for i in range(len(self._expires_at)) if i not in set(expired)])
+
+            if self._matrix is None:
+                self.misses += 1
+                return None, 0.0
+
+            similarities = self._matrix @ embedding
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity >= self.threshold:
+                self.hits += 1
+                return self._answers[best], similarity
+
+            self.misses += 1
+            return None, similarity
+
+    def store(self, question, answer, embedding=None):
+        if embedding is None:
+            embedding = self.embed(question)
+
+        with self._lock:
+            self._questions.append(question)
+            self._answers.append(answer)
+            self._expires_at.append(time.time() + self.ttl_seconds)
+            row = embedding[np.newaxis, :]
+            self._matrix = row if self._matrix is None else np.vstack([self._matrix, row])
+
+            if len(self._questions) > self.max_entries:
+                self._evict(list(range(len(self._questions) - self.max_entries, len(self._questions))))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._questions)
+            }
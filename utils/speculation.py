@@ -0,0 +1,108 @@
+"""
+Speculative tool prefetch.
+
+While the first chat completion is in flight, nothing else happens. The
+intent router's guess (even below its dispatch threshold) is usually good
+enough to start the likely tool call right away. If the model then asks for
+the same tool with the same arguments (ignoring case and extra whitespace),
+the already running (or finished) call is consumed; otherwise it is
+discarded, counted as wasted work, and the requested call runs instead.
+"""
+import threading
+import time
+
+from utils.tool_cache import make_cache_key
+
+# Router confidence needed before a tool is started speculatively. Off-topic
+# questions score up to ~0.3 on the nearest tool, and every miss costs an
+# embedding and a search, so stay well above that.
+SPECULATION_THRESHOLD = 0.45
+
+# Read-only tools whose arguments the router can predict
+SPECULATIVE_TOOLS = {
+    "rate_my_professor_info", "get_courses", "mem_search", "pratt_search", "get_AIPI_details", "search_duke_programs"
+}
+
+
+def arguments_match(predicted_args, requested_args):
+    """
+    Arguments match only if they are equal after the tool cache's
+    normalization; a prefetched result for a rephrased query answers a
+    different question, so it is never returned in place of the real call.
+    """
+    return make_cache_key("", predicted_args) == make_cache_key("", requested_args)
+
+
+class SpeculationMetrics:
+    """Process-wide counters for how often speculation pays off"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = 0
+        self.hits = 0
+        self.wasted = 0
+        self.wasted_seconds = 0.0
+
+    def record_start(self):
+        with self._lock:
+            self.started += 1
+
+    def record_hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def record_waste(self, seconds):
+        with self._lock:
+            self.wasted += 1
+            self.wasted_seconds += seconds
+
+    def stats(self):
+        with self._lock:
+            return {
+                "started": self.started,
+                "hits": self.hits,
+                "wasted": self.wasted,
+                "hit_rate": self.hits / self.started if self.started else 0.0,
+                "wasted_seconds": self.wasted_seconds
+            }
+
+
+speculation_metrics = SpeculationMetrics()
+
+
+class SpeculativePrefetch:
+    """
+    One speculative tool call for one agent step. handle is a
+    concurrent.futures.Future or an asyncio.Task; both support done(),
+    cancel() and add_done_callback().
+    """
+
+    def __init__(self, tool_name, function_args, handle, metrics=speculation_metrics):
+        self.tool_name = tool_name
+        self.function_args = function_args
+        self.handle = handle
+        self.metrics = metrics
+        self.claimed = False
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+        handle.add_done_callback(self._mark_finished)
+        metrics.record_start()
+
+    def _mark_finished(self, _):
+        self.finished_at = time.perf_counter()
+
+    def claim(self, tool_name, function_args):
+        """Return the running call if it matches the requested one, otherwise None"""
+        if self.claimed or tool_name != self.tool_name or not arguments_match(self.function_args, function_args):
+            return None
+        self.claimed = True
+        self.metrics.record_hit()
+        return self.handle
+
+    def discard(self):
+        """Cancel the call if nobody claimed it and count the work it wasted"""
+        if self.claimed:
+            return
+        self.handle.cancel()
+        finished_at = self.finished_at or time.perf_counter()
+        self.metrics.record_waste(finished_at - self.started_at)
@@ -0,0 +1,168 @@
+"""
+TTL + LRU cache for tool results, used by the tool dispatch layer.
+
+Entries are keyed on the tool name plus its normalized arguments, so the
+same get_courses("AIPI") or rate_my_professor_info(...) call made by
+different users or turns is answered without touching Pinecone, the Duke
+streamer API or OpenAI again. An optional SQLite file keeps entries across
+restarts and processes.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Seconds a result stays fresh, per tool. Tools not listed are not cached.
+TOOL_CACHE_TTLS = {
+    "rate_my_professor_info": 24 * 60 * 60,
+    "get_courses": 12 * 60 * 60,
+    "get_course_details": 12 * 60 * 60,
+    "mem_search": 6 * 60 * 60,
+    "pratt_search": 6 * 60 * 60,
+    "search_duke_programs": 6 * 60 * 60,
+    "get_AIPI_details": 6 * 60 * 60,
+    "web_search": 60 * 60,
+    "get_events": 10 * 60
+}
+MAX_CACHE_ENTRIES = 1024
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return " ".join(value.lower().split())
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items() if item is not None}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def make_cache_key(tool_name, function_args):
+    """Key on tool name and arguments, ignoring case, extra whitespace and None args"""
+    return f"{tool_name}:{json.dumps(_normalize(function_args), sort_keys=True)}"
+
+
+def is_cacheable_result(result):
+    """
+    Errors and empty results are worth retrying, so they are never cached:
+    None, empty strings and collections, {"error": ...}, passage results with
+    no passages or with a failed source, and "⚠️ No events found"-style messages
+    """
+    if result is None:
+        return False
+    if isinstance(result, (str, list, tuple, dict)) and not result:
+        return False
+    if isinstance(result, dict):
+        if "error" in result or result.get("errors"):
+            return False
+        if "passages" in result and not result["passages"]:
+            return False
+    if isinstance(result, str) and result.lstrip().startswith(("❌", "⚠️", "Error", "Failed")):
+        return False
+    return True
+
+
+class ToolResultCache:
+    def __init__(self, max_entries=MAX_CACHE_ENTRIES, ttls=None, disk_path=None):
+        """
+        Args:
+            max_entries (int): In-memory entries kept before least recently used ones are evicted.
+            ttls (dict): Seconds to keep results per tool name. Defaults to TOOL_CACHE_TTLS.
+            disk_path (str): Optional SQLite file used as a second, persistent tier.
+        """
+        self.max_entries = max_entries
+        self.ttls = TOOL_CACHE_TTLS if ttls is None else ttls
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+        self._db = None
+        if disk_path:
+            self._db = sqlite3.connect(disk_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS tool_cache (key TEXT PRIMARY KEY, expires_at REAL, result TEXT)"
+            )
+            self._db.commit()
+
+    def get(self, tool_name, function_args):
+        """Return (True, result) on a fresh hit, otherwise (False, None)"""
+        if tool_name not in self.ttls:
+            return False, None
+
+        key = make_cache_key(tool_name, function_args)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, result = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, result
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT expires_at, result FROM tool_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[0] > now:
+                    result = json.loads(row[1])
+                    self._store_in_memory(key, row[0], result)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return True, result
+
+            self.misses += 1
+            return False, None
+
+    def set(self, tool_name, function_args, result):
+        ttl = self.ttls.get(tool_name)
+        if ttl is None or not is_cacheable_result(result):
+            return
+
+        key = make_cache_key(tool_name, function_args)
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._store_in_memory(key, expires_at, result)
+            if self._db is not None:
+                try:
+                    serialized = json.dumps(result)
+                except TypeError:
+                    return
+                self._db.execute(
+                    "INSERT OR REPLACE INTO tool_cache (key, expires_at, result) VALUES (?, ?, ?)",
+                    (key, expires_at, serialized)
+                )
+                self._db.commit()
+
+    def _store_in_memory(self, key, expires_at, result):
+        self._entries[key] = (expires_at, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM tool_cache")
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries)
+            }
+
+
+# Process-wide cache shared by every session; set TOOL_CACHE_PATH to persist it
+tool_cache = ToolResultCache(disk_path=os.getenv("TOOL_CACHE_PATH"))
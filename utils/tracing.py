@@ -0,0 +1,194 @@
+"""
+Per-request tracing.
+
+Each user question runs inside start_trace(); model calls, tools, embedding
+calls, Pinecone queries and outbound HTTP requests open span()s inside it.
+When the request finishes, the trace is appended as one JSON line to
+TRACE_FILE (requests.jsonl by default), for example:
+
+    {"request_id": "...", "name": "chat_request", "duration_ms": 2310.4,
+     "attributes": {...}, "spans": [{"stage": "llm.chat", "start_ms": 0.2,
+     "duration_ms": 1022.9, "prompt_tokens": 1830, ...}, ...]}
+
+Run `python -m utils.tracing [path]` to print p50/p95 latency per stage.
+"""
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+TRACE_FILE = os.getenv("TRACE_FILE", "requests.jsonl")
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_write_lock = threading.Lock()
+
+
+class Trace:
+    def __init__(self, name, attributes):
+        self.request_id = uuid.uuid4().hex
+        self.name = name
+        self.attributes = dict(attributes)
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans = []
+        self.duration_ms = None
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self._started) * 1000
+
+    def add_span(self, record):
+        # Tool spans are recorded from worker threads
+        with self._lock:
+            self.spans.append(record)
+
+    def to_record(self):
+        with self._lock:
+            return {
+                "request_id": self.request_id,
+                "name": self.name,
+                "started_at": self.started_at,
+                "duration_ms": self.duration_ms,
+                "attributes": self.attributes,
+                "spans": sorted(self.spans, key=lambda span: span["start_ms"])
+            }
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def start_trace(name="chat_request", trace_file=None, **attributes):
+    """
+    Collect spans for one user request and append the trace to trace_file
+    (TRACE_FILE by default) when the block exits.
+    """
+    trace = Trace(name, attributes)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        trace.duration_ms = trace.elapsed_ms()
+        write_trace(trace, trace_file or TRACE_FILE)
+
+
+@contextmanager
+def span(stage, **attributes):
+    """
+    Time a block as one stage of the current trace. Yields a dict the block
+    can add attributes to (token counts, payload sizes, cache hits, ...).
+    Without an active trace this only costs a dict.
+    """
+    record = dict(attributes)
+    trace = _current_trace.get()
+    if trace is None:
+        yield record
+        return
+
+    start_ms = trace.elapsed_ms()
+    started = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record["error"] = str(e)[:200]
+        raise
+    finally:
+        record["stage"] = stage
+        record["start_ms"] = round(start_ms, 3)
+        record["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        trace.add_span(record)
+
+
+def url_for_trace(url):
+    """Host and path only; query strings can carry API keys"""
+    parts = urlsplit(url)
+    return f"{parts.netloc}{parts.path}"
+
+
+def payload_size(value):
+    """Approximate size in characters of a tool result or message list"""
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return len(str(value))
+
+
+def record_usage(record, usage):
+    """Copy token counts from an OpenAI usage object into a span record"""
+    if usage is None:
+        return
+    record["prompt_tokens"] = getattr(usage, "prompt_tokens", None)
+    record["completion_tokens"] = getattr(usage, "completion_tokens", None)
+    record["total_tokens"] = getattr(usage, "total_tokens", None)
+
+
+def write_trace(trace, trace_file):
+    line = json.dumps(trace.to_record(), default=str)
+    with _write_lock:
+        try:
+            with open(trace_file, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            print(f"Could not write trace to {trace_file}: {e}")
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize_traces(trace_file):
+    """Return {stage: {"count", "p50_ms", "p95_ms", "mean_ms"}} across all traces in a file"""
+    durations = {}
+    with open(trace_file, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                trace = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            # Skip lines that are not traces (e.g. other JSON records)
+            if not isinstance(trace, dict) or "spans" not in trace:
+                continue
+            if trace.get("duration_ms") is not None:
+                durations.setdefault(trace.get("name", "request"), []).append(trace["duration_ms"])
+            for record in trace["spans"]:
+                durations.setdefault(record["stage"], []).append(record["duration_ms"])
+
+    summary = {}
+    for stage, values in durations.items():
+        values.sort()
+        summary[stage] = {
+            "count": len(values),
+            "p50_ms": round(_percentile(values, 0.50), 1),
+            "p95_ms": round(_percentile(values, 0.95), 1),
+            "mean_ms": round(sum(values) / len(values), 1)
+        }
+    return summary
+
+
+def main():
+    trace_file = sys.argv[1] if len(sys.argv) > 1 else TRACE_FILE
+    summary = summarize_traces(trace_file)
+    if not summary:
+        print(f"No traces found in {trace_file}")
+        return
+
+    print(f"{'stage':<36}{'count':>8}{'p50 ms':>12}{'p95 ms':>12}{'mean ms':>12}")
+    for stage, stats in sorted(summary.items(), key=lambda item: item[1]["p95_ms"], reverse=True):
+        print(f"{stage:<36}{stats['count']:>8}{stats['p50_ms']:>12}{stats['p95_ms']:>12}{stats['mean_ms']:>12}")
+
+
+if __name__ == "__main__":
+    main()
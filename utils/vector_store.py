@@ -0,0 +1,519 @@
+"""
+Pluggable vector store.
+
+The search tools only use the subset of the Pinecone Index API below, so any
+object providing it can stand in for a remote index:
+
+    upsert(vectors, namespace=None)
+    query(vector, top_k, namespace=None, filter=None, include_metadata=True)
+        -> {"matches": [{"id", "score", "metadata"}, ...]}
+    delete(ids=None, delete_all=False, namespace=None)
+
+LocalVectorStore implements it in process: each namespace is an L2-normalized
+float32 matrix, so cosine top-k is one matrix-vector product plus
+argpartition. Metadata filters use Pinecone's syntax ($eq, $ne, $in, $nin,
+$gt, $gte, $lt, $lte, $and, $or). A store persists to a directory holding
+<namespace>.npy (the matrix) and <namespace>.json (ids and metadata).
+
+Writes apply to a copy of the namespace that then replaces it, so queries
+only hold the store's lock long enough to pick up the current namespace and
+score it concurrently with each other and with writes. The copy shares its
+arrays and lists: new rows are appended past the rows the published
+namespace can see, into spare capacity that grows geometrically, so an
+insert costs time for the rows inserted rather than for the whole namespace.
+
+Set VECTOR_STORE=local (or ivf for approximate search over large corpora,
+see utils.ivf_index, or int8 / binary for compressed in-memory codes, see
+utils.quantized_index) to make the tools use local stores under
+VECTOR_STORE_DIR; fill them from Pinecone once with:
+
+    python -m utils.vector_store sync mem-database --namespace mem-handbook
+"""
+import argparse
+import copy
+import json
+import os
+import threading
+
+import numpy as np
+
+# "pinecone", "local" (exact search), "ivf" (approximate search, see utils.ivf_index)
+# or "int8" / "binary" (quantized search with float rescoring, see utils.quantized_index)
+VECTOR_STORE = os.getenv("VECTOR_STORE", "pinecone")
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", "data/vector_store")
+
+DEFAULT_NAMESPACE = ""
+# File name used for the default ("") namespace
+DEFAULT_NAMESPACE_FILE = "__default__"
+
+_local_stores = {}
+_local_stores_lock = threading.Lock()
+
+
+def use_local_vector_store():
+    return VECTOR_STORE in ("local", "ivf", "int8", "binary")
+
+
+def normalize_vectors(matrix):
+    """float32 rows scaled to unit length; zero rows stay zero"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+# Vectors fetched from Pinecone per local upsert when syncing
+SYNC_UPSERT_BATCH_SIZE = 10000
+# Smallest capacity of a growable row buffer
+MIN_ROW_CAPACITY = 256
+
+
+def append_rows(array, rows):
+    """
+    array with rows appended, as a view of the leading rows of a larger buffer.
+    Holders of array do not see the new rows, so while array is such a view
+    with room left, rows are written into the buffer in place; otherwise it is
+    copied into a buffer twice the size. Only the newest view of a buffer may
+    be appended to, and rows already in a view must not be changed in place.
+    """
+    rows = np.asarray(rows, dtype=array.dtype).reshape((-1,) + array.shape[1:])
+    count, needed = len(array), len(array) + len(rows)
+    buffer = array.base
+    reusable = (
+        type(buffer) is np.ndarray and buffer.flags.writeable and buffer.flags.c_contiguous
+        and buffer.dtype == array.dtype and buffer.shape[1:] == array.shape[1:] and len(buffer) >= needed
+        and array.__array_interface__["data"][0] == buffer.__array_interface__["data"][0]
+    )
+    if not reusable:
+        buffer = np.empty((max(needed, 2 * count, MIN_ROW_CAPACITY),) + array.shape[1:], dtype=array.dtype)
+        buffer[:count] = array
+    buffer[count:needed] = rows
+    return buffer[:needed]
+
+
+def _vector_fields(vector):
+    """(id, values, metadata) from a tuple or a Pinecone-style dict"""
+    if isinstance(vector, dict):
+        return vector["id"], vector["values"], vector.get("metadata") or {}
+    if len(vector) == 3:
+        return vector
+    return vector[0], vector[1], {}
+
+
+def _compare(values, operator, operand):
+    """Boolean mask for one filter operator over a column of metadata values"""
+    if operator == "$eq":
+        return np.array([value == operand for value in values], dtype=bool)
+    if operator == "$ne":
+        return np.array([value != operand for value in values], dtype=bool)
+    if operator == "$in":
+        operand = set(operand)
+        return np.array([value in operand for value in values], dtype=bool)
+    if operator == "$nin":
+        operand = set(operand)
+        return np.array([value not in operand for value in values], dtype=bool)
+    if operator in ("$gt", "$gte", "$lt", "$lte"):
+        compare = {
+            "$gt": lambda value: value > operand,
+            "$gte": lambda value: value >= operand,
+            "$lt": lambda value: value < operand,
+            "$lte": lambda value: value <= operand
+        }[operator]
+        return np.array([value is not None and compare(value) for value in values], dtype=bool)
+    raise ValueError(f"Unsupported filter operator: {operator}")
+
+
+class VectorNamespace:
+    """
+    Vectors, ids and metadata of one namespace. A copy() shares its arrays
+    and lists with the original: writes to the copy append past the rows the
+    original holds (see append_rows), and replace an array or list before
+    changing rows the original can see.
+    """
+
+    def __init__(self, dimension):
+        self.matrix = np.zeros((0, dimension), dtype=np.float32)
+        self.set_records([], [])
+
+    def set_records(self, ids, metadata):
+        """Replace the ids and metadata, e.g. with ones loaded from disk"""
+        # Append-only lists shared between copies; each copy reads its first _count entries
+        self._id_buffer = ids
+        self._metadata_buffer = metadata
+        self._count = len(ids)
+        self._records = None
+        # Positions of ids beyond _count belong to later copies; only writers look them up
+        self.positions = {vector_id: i for i, vector_id in enumerate(ids)}
+        self._columns = {}
+
+    def __len__(self):
+        return self._count
+
+    def _record_lists(self):
+        """This namespace's (ids, metadata), taken from the shared lists on first read"""
+        records = self._records
+        if records is None:
+            records = self._records = (self._id_buffer[:self._count], self._metadata_buffer[:self._count])
+        return records
+
+    @property
+    def ids(self):
+        return self._record_lists()[0]
+
+    @property
+    def metadata(self):
+        return self._record_lists()[1]
+
+    def copy(self):
+        """A copy to write to while queries keep reading this one"""
+        clone = copy.copy(self)
+        clone._records = None
+        clone._columns = {}
+        return clone
+
+    def upsert(self, ids, matrix, metadata):
+        new_rows, overwritten = [], []
+        for row, vector_id in enumerate(ids):
+            position = self.positions.get(vector_id)
+            if position is None or position >= self._count:
+                new_rows.append(row)
+            else:
+                overwritten.append((position, row))
+
+        if overwritten:
+            # Rows the published namespace can see change, so this write gets its own copies
+            self.matrix = np.array(self.matrix)
+            self._metadata_buffer = self._metadata_buffer[:self._count]
+            for position, row in overwritten:
+                self.matrix[position] = matrix[row]
+                self._metadata_buffer[position] = metadata[row]
+
+        if new_rows:
+            start = self._count
+            self.matrix = append_rows(self.matrix, matrix[new_rows])
+            # Entries past _count are left over from a write that was never published
+            del self._id_buffer[start:]
+            del self._metadata_buffer[start:]
+            for offset, row in enumerate(new_rows):
+                self._id_buffer.append(ids[row])
+                self._metadata_buffer.append(metadata[row])
+                self.positions[ids[row]] = start + offset
+            self._count += len(new_rows)
+        self._records = None
+        self._columns = {}
+
+    def delete(self, ids):
+        ids = set(ids)
+        keep = [i for i, vector_id in enumerate(self.ids) if vector_id not in ids]
+        self.matrix = self.matrix[keep]
+        self.set_records([self.ids[i] for i in keep], [self.metadata[i] for i in keep])
+
+    def column(self, field):
+        """Metadata values of one field for every row, cached until the next write"""
+        if field not in self._columns:
+            self._columns[field] = [meta.get(field) for meta in self.metadata]
+        return self._columns[field]
+
+    def candidate_rows(self, query, mask, top_k, **search_params):
+        """Rows to score exactly for a query; None means every row"""
+        return None if mask is None else np.flatnonzero(mask)
+
+    def mask(self, metadata_filter):
+        """Rows matching a Pinecone-style metadata filter"""
+        mask = np.ones(len(self), dtype=bool)
+        for key, condition in metadata_filter.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self.mask(clause)
+            elif key == "$or":
+                any_mask = np.zeros(len(self), dtype=bool)
+                for clause in condition:
+                    any_mask |= self.mask(clause)
+                mask &= any_mask
+            elif isinstance(condition, dict):
+                for operator, operand in condition.items():
+                    mask &= _compare(self.column(key), operator, operand)
+            else:
+                # {"field": value} is shorthand for {"field": {"$eq": value}}
+                mask &= _compare(self.column(key), "$eq", condition)
+        return mask
+
+
+class LocalVectorStore:
+    backend = "local"
+    index_type = "flat"
+    # Load saved matrices as read-only memory maps instead of into memory
+    mmap_vectors = False
+
+    def __init__(self, path=None, dimension=None, metric="cosine"):
+        """
+        Args:
+            path (str): Directory to persist to; None keeps the store in memory only.
+            dimension (int): Vector size; taken from the saved store or the first upsert if omitted.
+            metric (str): Only "cosine" is supported.
+        """
+        if metric != "cosine":
+            raise ValueError(f"LocalVectorStore only supports cosine similarity, not {metric}")
+        self.path = path
+        self.dimension = dimension
+        self.metric = metric
+        # How the vectors were produced, e.g. {"model", "dimensions"}; saved with the index
+        self.embedding = None
+        self._namespaces = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(os.path.join(path, "index.json")):
+            self.load()
+            if dimension and self.dimension != dimension:
+                raise ValueError(
+                    f"{path} holds {self.dimension}-dimension vectors, not {dimension}; "
+                    f"convert it with python -m utils.embedding_migration"
+                )
+
+    def get_namespace(self, namespace=None):
+        """The current VectorNamespace for a namespace name, or None; treat it as read-only"""
+        with self._lock:
+            return self._namespaces.get(namespace or DEFAULT_NAMESPACE)
+
+    def _new_namespace(self, dimension):
+        return VectorNamespace(dimension)
+
+    def _write_namespace(self, namespace, write):
+        """Apply write to a copy of a namespace and publish the copy; call with the lock held"""
+        namespace = namespace or DEFAULT_NAMESPACE
+        store = self._namespaces.get(namespace)
+        updated = store.copy() if store is not None else self._new_namespace(self.dimension)
+        write(updated)
+        self._namespaces[namespace] = updated
+
+    def _save_namespace(self, store, path, file_name):
+        """Hook for subclasses that persist index structures next to the matrix"""
+
+    def _load_namespace(self, store, path, file_name):
+        """Hook for subclasses that persist index structures next to the matrix"""
+
+    def upsert(self, vectors, namespace=None):
+        """Insert or overwrite vectors given as (id, values, metadata) tuples or Pinecone dicts"""
+        # The last occurrence of a repeated id wins, as in Pinecone
+        fields = list({fields[0]: fields for fields in map(_vector_fields, vectors)}.values())
+        if not fields:
+            return {"upserted_count": 0}
+        matrix = normalize_vectors([values for _, values, _ in fields])
+
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = matrix.shape[1]
+            if matrix.shape[1] != self.dimension:
+                raise ValueError(f"Vector dimension {matrix.shape[1]} does not match index dimension {self.dimension}")
+            self._write_namespace(namespace, lambda store: store.upsert(
+                [vector_id for vector_id, _, _ in fields], matrix, [dict(meta) for _, _, meta in fields]
+            ))
+        return {"upserted_count": len(fields)}
+
+    def query(self, vector, top_k=10, namespace=None, filter=None, include_metadata=True, include_values=False,
+              **search_params):
+        """
+        Cosine top_k over one namespace, optionally restricted by a metadata
+        filter. search_params are passed to the namespace's candidate search
+        (e.g. nprobe for IVF stores).
+        """
+        query = normalize_vectors(vector)
+        # Published namespaces are never changed, so the search runs outside the lock
+        store = self.get_namespace(namespace)
+        if store is None or not len(store):
+            return {"matches": [], "namespace": namespace or DEFAULT_NAMESPACE}
+        matrix, ids, metadata = store.matrix, store.ids, store.metadata
+        if query.shape[0] != matrix.shape[1]:
+            raise ValueError(f"Query dimension {query.shape[0]} does not match index dimension {matrix.shape[1]}")
+        mask = store.mask(filter) if filter else None
+        candidates = store.candidate_rows(query, mask, top_k, **search_params)
+
+        if candidates is None:
+            candidates = np.arange(len(ids))
+            candidate_scores = matrix @ query
+        else:
+            candidate_scores = matrix[candidates] @ query
+
+        top_k = min(top_k, len(candidates))
+        if top_k == 0:
+            return {"matches": [], "namespace": namespace or DEFAULT_NAMESPACE}
+
+        best = np.argpartition(-candidate_scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-candidate_scores[best])]
+
+        matches = []
+        for position in best:
+            row = candidates[position]
+            match = {"id": ids[row], "score": float(candidate_scores[position])}
+            if include_metadata:
+                match["metadata"] = metadata[row]
+            if include_values:
+                match["values"] = matrix[row].tolist()
+            matches.append(match)
+        return {"matches": matches, "namespace": namespace or DEFAULT_NAMESPACE}
+
+    def delete(self, ids=None, delete_all=False, namespace=None):
+        with self._lock:
+            namespace = namespace or DEFAULT_NAMESPACE
+            if delete_all:
+                self._namespaces.pop(namespace, None)
+            elif ids and namespace in self._namespaces:
+                self._write_namespace(namespace, lambda store: store.delete(ids))
+        return {}
+
+    def describe_index_stats(self):
+        with self._lock:
+            return {
+                "dimension": self.dimension,
+                "embedding": self.embedding,
+                "namespaces": {name: {"vector_count": len(store)} for name, store in self._namespaces.items()},
+                "total_vector_count": sum(len(store) for store in self._namespaces.values())
+            }
+
+    def save(self, path=None):
+        """Write each namespace as <namespace>.npy plus a <namespace>.json sidecar"""
+        path = path or self.path
+        if not path:
+            raise ValueError("No path to save the vector store to")
+        os.makedirs(path, exist_ok=True)
+
+        with self._lock:
+            for name, store in self._namespaces.items():
+                file_name = name or DEFAULT_NAMESPACE_FILE
+                # Write then rename, so a memory-mapped copy of the old file stays readable
+                matrix_path = os.path.join(path, f"{file_name}.npy")
+                with open(matrix_path + ".tmp", "wb") as f:
+                    np.save(f, store.matrix)
+                os.replace(matrix_path + ".tmp", matrix_path)
+                with open(os.path.join(path, f"{file_name}.json"), "w", encoding="utf-8") as f:
+                    json.dump({"namespace": name, "ids": store.ids, "metadata": store.metadata}, f)
+                self._save_namespace(store, path, file_name)
+            with open(os.path.join(path, "index.json"), "w", encoding="utf-8") as f:
+                json.dump({
+                    "dimension": self.dimension,
+                    "metric": self.metric,
+                    "index_type": self.index_type,
+                    "embedding": self.embedding,
+                    "namespaces": sorted(self._namespaces)
+                }, f)
+
+    def load(self, path=None):
+        path = path or self.path
+        with open(os.path.join(path, "index.json"), "r", encoding="utf-8") as f:
+            info = json.load(f)
+
+        namespaces = {}
+        for name in info["namespaces"]:
+            file_name = name or DEFAULT_NAMESPACE_FILE
+            with open(os.path.join(path, f"{file_name}.json"), "r", encoding="utf-8") as f:
+                sidecar = json.load(f)
+            store = self._new_namespace(info["dimension"])
+            store.matrix = np.load(
+                os.path.join(path, f"{file_name}.npy"), mmap_mode="r" if self.mmap_vectors else None
+            )
+            store.set_records(sidecar["ids"], sidecar["metadata"])
+            self._load_namespace(store, path, file_name)
+            namespaces[name] = store
+
+        with self._lock:
+            self.dimension = info["dimension"]
+            self.metric = info.get("metric", "cosine")
+            self.embedding = info.get("embedding")
+            self._namespaces = namespaces
+
+
+def namespace_records_path(index_name, namespace=None):
+    """Sidecar JSON (ids and metadata) of a saved namespace under VECTOR_STORE_DIR"""
+    return os.path.join(local_store_path(index_name), f"{namespace or DEFAULT_NAMESPACE_FILE}.json")
+
+
+def load_namespace_records(index_name, namespace=None):
+    """(ids, metadata) of a saved namespace, without loading its vectors"""
+    with open(namespace_records_path(index_name, namespace), "r", encoding="utf-8") as f:
+        sidecar = json.load(f)
+    return sidecar["ids"], sidecar["metadata"]
+
+
+def new_local_vector_store(path=None, dimension=None, metric="cosine"):
+    """
+    An IVFVectorStore when VECTOR_STORE=ivf, a QuantizedVectorStore when it is
+    int8 or binary, otherwise an exact LocalVectorStore
+    """
+    # Imported here because these modules build on this one
+    if VECTOR_STORE == "ivf":
+        from utils.ivf_index import IVFVectorStore
+        return IVFVectorStore(path, dimension, metric)
+    if VECTOR_STORE in ("int8", "binary"):
+        from utils.quantized_index import QuantizedVectorStore
+        return QuantizedVectorStore(path, dimension, metric, quantization=VECTOR_STORE)
+    return LocalVectorStore(path, dimension, metric)
+
+
+def local_store_path(index_name):
+    return os.path.join(VECTOR_STORE_DIR, index_name)
+
+
+def get_local_vector_store(index_name, dimension=None, metric="cosine"):
+    """Shared local store (see new_local_vector_store) persisted under VECTOR_STORE_DIR/index_name"""
+    with _local_stores_lock:
+        if index_name not in _local_stores:
+            _local_stores[index_name] = new_local_vector_store(local_store_path(index_name), dimension, metric)
+        return _local_stores[index_name]
+
+
+def open_vector_store(index_name, connect_remote, dimension=None, metric="cosine"):
+    """
+    The local store for index_name when VECTOR_STORE is local, ivf, int8 or binary, otherwise the
+    remote index returned by connect_remote()
+    """
+    if use_local_vector_store():
+        return get_local_vector_store(index_name, dimension, metric)
+    return connect_remote()
+
+
+def sync_from_pinecone(index, store, namespace=None, batch_size=100, upsert_batch_size=SYNC_UPSERT_BATCH_SIZE):
+    """
+    Copy every vector of a Pinecone namespace into store; returns the count
+    copied. Fetched pages are collected and upserted upsert_batch_size at a time.
+    """
+    copied, pending = 0, []
+
+    def flush():
+        store.upsert(pending, namespace=namespace)
+        pending.clear()
+
+    for ids in index.list(namespace=namespace or DEFAULT_NAMESPACE):
+        for start in range(0, len(ids), batch_size):
+            response = index.fetch(ids=ids[start:start + batch_size], namespace=namespace or DEFAULT_NAMESPACE)
+            pending.extend(
+                (vector_id, vector.values, vector.metadata or {}) for vector_id, vector in response.vectors.items()
+            )
+            copied += len(response.vectors)
+            if len(pending) >= upsert_batch_size:
+                flush()
+    if pending:
+        flush()
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage local vector stores")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    sync_parser = subparsers.add_parser("sync", help="Copy a Pinecone index namespace into the local store")
+    sync_parser.add_argument("index_name")
+    sync_parser.add_argument("--namespace", default=DEFAULT_NAMESPACE)
+    sync_parser.add_argument("--api-key-env", default="PINECONE_API_KEY",
+                             help="Environment variable holding the Pinecone API key")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    from pinecone import Pinecone
+    load_dotenv()
+
+    index = Pinecone(api_key=os.getenv(args.api_key_env)).Index(args.index_name)
+    store = get_local_vector_store(args.index_name)
+    copied = sync_from_pinecone(index, store, namespace=args.namespace)
+    store.save()
+    print(f"Copied {copied} vectors from {args.index_name}/{args.namespace or DEFAULT_NAMESPACE_FILE} to {store.path}")
+
+
+if __name__ == "__main__":
+    main()